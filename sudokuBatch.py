@@ -0,0 +1,292 @@
+#######
+#
+# BATCH SOLVING
+#
+# Puzzles are read from text files with one puzzle per line, in the
+# format of roster_string_dimension in sudokuSolver: 81 characters for
+# a roster of dimension 3, 256 for a roster of dimension 4, and so on,
+# or as many fields separated by spaces or commas for larger values.
+# Blank lines and lines starting with '#' are skipped.
+# The puzzles are solved in chunks by a pool of worker processes, while
+# only a bounded number of chunks is in flight at any time, such that
+# memory use does not depend on the number of puzzles.
+#
+# The solutions of a single roster can be counted in parallel as well,
+# by splitting up its search tree into subtrees that are counted by the
+# workers of a pool.
+#
+# Usage: python sudokuBatch.py [-p PROCESSES] [-c CHUNKSIZE] [--unordered]
+#                              [--backend BACKEND] [INPUT [OUTPUT]]
+#
+#######
+
+import collections
+import multiprocessing
+import Queue
+import sys
+
+import sudokuSolver
+
+
+def read_puzzles(lines):
+    """
+    Generate the puzzles in the given lines, one puzzle per line, with
+    the surrounding whitespace removed. Blank lines and lines starting
+    with '#' are skipped.
+    ValueError is raised for a line that does not describe a roster.
+  """
+    for line in lines:
+        # LOOP INVARIANT
+        #   The puzzles on all the lines handled so far have been
+        #   generated.
+        line = line.strip()
+        if line != '' and not line.startswith('#'):
+            sudokuSolver.roster_string_dimension(line)
+            yield line
+assert list(read_puzzles(['# comment\n', '\n', '4.3.21.31...3.2.\n'])) == \
+       ['4.3.21.31...3.2.']
+
+
+
+
+def solve_puzzle(puzzle, backend=None):
+    """
+    Return the string describing the solution of the given puzzle, or
+    None if the puzzle has no solution.
+  """
+    roster = sudokuSolver.roster_from_string(puzzle)
+    if sudokuSolver.fill_intelligently(roster, backend=backend):
+        return sudokuSolver.roster_to_string(roster)
+    return None
+assert solve_puzzle('1...' + '.2..' + '..3.' + '...4') != None
+assert solve_puzzle('1...' + '.2..' + '2.3.' + '..14') == None
+
+
+
+
+def solve_chunk(chunk, backend=None):
+    """
+    Return the list of the solutions of the puzzles in the given chunk.
+    The chunk is a list of pairs of an index and a puzzle; each solution
+    is a triple of that index, that puzzle and its solution.
+  """
+    solutions = []
+    for i in range(len(chunk)):
+        # LOOP INVARIANT
+        #   The puzzles of the chunk handled so far have been solved.
+        solutions.append((chunk[i][0], chunk[i][1],
+                          solve_puzzle(chunk[i][1], backend)))
+    return solutions
+
+
+
+
+def make_chunks(puzzles, chunksize):
+    """
+    Generate lists of at most chunksize pairs of an index and a puzzle,
+    for the given puzzles in order. Indices start from 0.
+  """
+    chunk = []
+    index = 0
+    for puzzle in puzzles:
+        # LOOP INVARIANT
+        #   All the puzzles handled so far have been put in a chunk, and
+        #   all the full chunks have been generated.
+        chunk.append((index, puzzle))
+        index += 1
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+assert list(make_chunks('abc', 2)) == [[(0, 'a'), (1, 'b')], [(2, 'c')]]
+
+
+
+
+def solve_puzzles(puzzles, processes=None, chunksize=64, ordered=True,
+                  backend=None):
+    """
+    Generate the solutions of the given puzzles, solved by a pool of the
+    given number of worker processes (by default one per core). Each
+    solution is a triple of the index of the puzzle, the puzzle and the
+    string describing its solution, or None if it has no solution.
+    The puzzles are handed to the workers in chunks of the given size,
+    and at most two chunks per worker are in flight at any time. If
+    ordered is True, the solutions are generated in the order of the
+    puzzles; otherwise they are generated as soon as their chunk is
+    solved.
+  """
+    if processes == None:
+        processes = multiprocessing.cpu_count()
+    max_in_flight = 2*processes
+    pool = multiprocessing.Pool(processes)
+    try:
+        if ordered:
+            in_flight = collections.deque()
+            for chunk in make_chunks(puzzles, chunksize):
+                # LOOP INVARIANT
+                #   All the chunks handled so far have been handed to the
+                #   pool, and the solutions of all the chunks before the
+                #   ones still in flight have been generated in order.
+                in_flight.append(pool.apply_async(solve_chunk, (chunk, backend)))
+                if len(in_flight) == max_in_flight:
+                    for solution in in_flight.popleft().get():
+                        yield solution
+            while len(in_flight) > 0:
+                # LOOP INVARIANT
+                #   The solutions of all the chunks no longer in flight
+                #   have been generated in order.
+                for solution in in_flight.popleft().get():
+                    yield solution
+        else:
+            solved = Queue.Queue()
+            results = []
+            nb_in_flight = 0
+            for chunk in make_chunks(puzzles, chunksize):
+                # LOOP INVARIANT
+                #   All the chunks handled so far have been handed to the
+                #   pool, and the solutions of all the chunks no longer in
+                #   flight have been generated.
+                results.append(pool.apply_async(solve_chunk, (chunk, backend),
+                                                callback=solved.put))
+                nb_in_flight += 1
+                if nb_in_flight == max_in_flight:
+                    for solution in take_solved_chunk(solved, results):
+                        yield solution
+                    nb_in_flight -= 1
+            while nb_in_flight > 0:
+                # LOOP INVARIANT
+                #   The solutions of all the chunks no longer in flight
+                #   have been generated.
+                for solution in take_solved_chunk(solved, results):
+                    yield solution
+                nb_in_flight -= 1
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+
+
+def take_solved_chunk(solved, results):
+    """
+    Wait until the pool puts the solutions of a chunk in the given queue,
+    and return them.
+    The given list holds the results of the chunks handed to the pool.
+    The results of the chunks that are done are removed from it, and if
+    solving one of those chunks failed, its exception is raised here.
+  """
+    while True:
+        # LOOP INVARIANT
+        #   None of the chunks handed to the pool has failed so far.
+        i = 0
+        while i < len(results):
+            # LOOP INVARIANT
+            #   The results handled so far belong to chunks in flight.
+            if results[i].ready():
+                if not results[i].successful():
+                    results[i].get()
+                del results[i]
+            else:
+                i += 1
+        try:
+            return solved.get(timeout=0.1)
+        except Queue.Empty:
+            pass
+
+
+
+
+def count_subroster(args):
+    """
+    Return the number of solutions of the roster in the given pair of a
+    roster and a backend.
+  """
+    return sudokuSolver.count_solutions(args[0], backend=args[1])
+
+
+
+
+def nb_solutions_parallel(roster, processes=None, split_depth=4,
+                          progress=None, backend=None):
+    """
+    Return the total number of possible ways that the given roster can be
+    filled completely, just like nb_solutions in sudokuSolver, counted by
+    a pool of the given number of worker processes (by default one per
+    core).
+    The search is first expanded up to the given depth by split_roster,
+    and each resulting subtree is counted by a worker. Idle workers take
+    the next subtree left, one at a time. If a progress function is given,
+    it is called with the number of subtrees counted and the total number
+    of subtrees each time a subtree has been counted.
+    The given roster is left untouched.
+  """
+    subrosters = []
+    for subroster in sudokuSolver.split_roster(roster, split_depth):
+        # LOOP INVARIANT
+        #   All the subtrees generated so far have been collected, along
+        #   with the backend to count them.
+        subrosters.append((subroster, backend))
+    if len(subrosters) == 0:
+        return 0
+    if processes == None:
+        processes = multiprocessing.cpu_count()
+    number_of_solutions = 0
+    pool = multiprocessing.Pool(min(processes, len(subrosters)))
+    try:
+        counts = pool.imap_unordered(count_subroster, subrosters, 1)
+        nb_counted = 0
+        for count in counts:
+            # LOOP INVARIANT
+            #   The solutions of all the subtrees counted so far have
+            #   been added up.
+            number_of_solutions += count
+            nb_counted += 1
+            if progress != None:
+                progress(nb_counted, len(subrosters))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return number_of_solutions
+
+
+
+
+def main(argv=None):
+    """
+    Solve the puzzles in the input file (by default the standard input)
+    and write their solutions to the output file (by default the standard
+    output), one per line. A puzzle without a solution gives the line '-'.
+    With --unordered, each line starts with the index of the puzzle and
+    a tab, because the solutions are written as soon as they are found.
+  """
+    import argparse
+    parser = argparse.ArgumentParser(description='Solve Sudoku puzzles in bulk.')
+    parser.add_argument('input', nargs='?', type=argparse.FileType('r'),
+                        default=sys.stdin)
+    parser.add_argument('output', nargs='?', type=argparse.FileType('w'),
+                        default=sys.stdout)
+    parser.add_argument('-p', '--processes', type=int, default=None)
+    parser.add_argument('-c', '--chunksize', type=int, default=64)
+    parser.add_argument('--unordered', action='store_true')
+    parser.add_argument('--backend', choices=sudokuSolver.BACKENDS, default=None)
+    args = parser.parse_args(argv)
+    solutions = solve_puzzles(read_puzzles(args.input), args.processes,
+                              args.chunksize, not args.unordered, args.backend)
+    for index, puzzle, solution in solutions:
+        # LOOP INVARIANT
+        #   The solutions generated so far have been written.
+        if solution == None:
+            solution = '-'
+        if args.unordered:
+            args.output.write('%d\t%s\n' % (index, solution))
+        else:
+            args.output.write(solution + '\n')
+    args.output.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+#######
+#
+# PUZZLE GENERATION
+#
+# Puzzles with a unique solution are generated from random solutions, by
+# removing clues for as long as the solution stays unique.
+# All the removals from one solution are checked on a single roster
+# state. Removing the clue V from a puzzle with a unique solution keeps
+# that solution unique if and only if the puzzle has no solution with
+# another value than V at the position of the clue; that is checked by
+# eliminating V at that position and searching for a single solution,
+# which mostly fails after a few singles.
+#
+# A symmetry pattern makes the clues of each puzzle symmetric: the clues
+# are removed in orbits of positions that are mapped onto each other.
+#
+# Usage: python sudokuGenerator.py [-n COUNT] [-d DIMENSION] [--clues CLUES]
+#                                  [--symmetry SYMMETRY] [--seed SEED]
+#                                  [OUTPUT]
+#   writes the generated puzzles to OUTPUT, one per line, in the format
+#   of sudokuBatch.
+#
+#######
+
+import random
+import sys
+
+import sudokuSolver
+
+
+SYMMETRIES = ('none', 'rotational', 'quarter', 'mirror', 'diagonal')
+
+
+def check_symmetry(symmetry):
+    """
+    Raise ValueError if the given symmetry is neither None nor one of the
+    names in SYMMETRIES.
+  """
+    if symmetry != None and symmetry not in SYMMETRIES:
+        raise ValueError('unknown symmetry %r, not one of %s'
+                         % (symmetry, ', '.join(SYMMETRIES)))
+
+
+
+
+def orbit(position, size, symmetry):
+    """
+    Return the sorted list of the distinct positions onto which the given
+    position of a roster of the given size is mapped by the given
+    symmetry:
+      - 'none' maps each position onto itself only,
+      - 'rotational' rotates the roster by half a turn,
+      - 'quarter' rotates the roster by quarter turns,
+      - 'mirror' mirrors the roster around its middle column,
+      - 'diagonal' mirrors the roster around its main diagonal.
+  """
+    (row, col) = position
+    last = size-1
+    if symmetry == 'rotational':
+        images = [(row, col), (last-row, last-col)]
+    elif symmetry == 'quarter':
+        images = [(row, col), (col, last-row), (last-row, last-col), (last-col, row)]
+    elif symmetry == 'mirror':
+        images = [(row, col), (row, last-col)]
+    elif symmetry == 'diagonal':
+        images = [(row, col), (col, row)]
+    else:
+        images = [(row, col)]
+    return sorted(set(images))
+assert orbit((0, 1), 4, 'quarter') == [(0, 1), (1, 3), (2, 0), (3, 2)]
+assert orbit((1, 1), 4, 'diagonal') == [(1, 1)]
+
+
+
+
+def orbits(dim, symmetry):
+    """
+    Return the list of the distinct orbits of the given symmetry among the
+    positions of a roster of the given dimension.
+  """
+    result = []
+    seen = set()
+    for pos in sudokuSolver.topology(dim).positions:
+        # LOOP INVARIANT
+        #   The orbits of all the positions handled so far have been
+        #   collected once.
+        if pos not in seen:
+            positions = orbit(pos, dim**2, symmetry)
+            seen.update(positions)
+            result.append(positions)
+    return result
+assert len(orbits(2, 'rotational')) == 8
+assert len(orbits(3, 'quarter')) == 21
+
+
+
+
+def fill_randomly(state, rng):
+    """
+    Fill the given correct roster state completely with a random solution
+    drawn with the given random number generator, by filling in singles
+    and trying the candidates of a cell with the least number of
+    candidates in a random order.
+    Return True if the state has been filled, and False if it has no
+    solution, in which case the state is left untouched.
+  """
+    filled_positions = []
+    if sudokuSolver.propagate_singles(state, filled_positions):
+        if state.is_complete():
+            return True
+        pos = sudokuSolver.min_candidate(state)
+        candidates = sudokuSolver.mask_values(state.candidate_mask_at(pos))
+        rng.shuffle(candidates)
+        for value in candidates:
+            # LOOP INVARIANT
+            #   The state cannot be filled with any of the candidates
+            #   handled so far at the chosen position.
+            sudokuSolver.set_value_at(state, value, pos)
+            if fill_randomly(state, rng):
+                return True
+        sudokuSolver.set_value_at(state, None, pos)
+    sudokuSolver.undo_trail(state, filled_positions, 0)
+    return False
+
+
+
+
+def random_solution(dim, rng):
+    """
+    Return a random completely filled, correct roster of the given
+    dimension, drawn with the given random number generator.
+  """
+    state = sudokuSolver.RosterState(sudokuSolver.make_roster(dim))
+    fill_randomly(state, rng)
+    return state.roster
+roster = random_solution(3, random.Random(0))
+assert sudokuSolver.is_completely_filled(roster) and sudokuSolver.is_correct_roster(roster)
+assert random_solution(3, random.Random(0)) == roster
+
+
+
+
+def is_removable(state, positions, values):
+    """
+    Return whether the given roster state, of a puzzle with a unique
+    solution from which the given values have just been removed at the
+    given positions, still has a unique solution.
+    The roster state is left untouched.
+  """
+    if len(positions) == 1:
+        cell = state.topology.cell(positions[0])
+        # A clue that is a naked single or a hidden single once removed
+        # is forced back by the other clues, without any search.
+        if state.cell_masks[cell] == 1 << values[0]:
+            return True
+        for unit in state.topology.cell_units(cell):
+            # LOOP INVARIANT
+            #   The removed value has more than one position left in all
+            #   the units of the cell handled so far.
+            if state.nb_places(unit, values[0]) == 1:
+                return True
+        eliminated = state.eliminate(cell, 1 << values[0])
+        is_unique = sudokuSolver.count_solutions_of_state(state, 1) == 0
+        state.restore(cell, eliminated)
+        return is_unique
+    return sudokuSolver.count_solutions_of_state(state, 2) == 1
+
+
+
+
+def remove_clues(state, rng, clues, symmetry):
+    """
+    Remove clues from the given completely filled roster state, in orbits
+    of the given symmetry taken in a random order, as long as the roster
+    keeps a unique solution and at least the given number of clues.
+  """
+    nb_clues = state.topology.nb_cells
+    candidates = orbits(state.dim, symmetry)
+    rng.shuffle(candidates)
+    for positions in candidates:
+        # LOOP INVARIANT
+        #   The roster state has a unique solution and at least the given
+        #   number of clues, and all the orbits handled so far that could
+        #   be removed have been removed.
+        if nb_clues - len(positions) >= clues:
+            values = []
+            for pos in positions:
+                # LOOP INVARIANT
+                #   The clues at all the positions of the orbit handled so
+                #   far have been removed and added to the values.
+                values.append(sudokuSolver.value_at(state, pos))
+                sudokuSolver.set_value_at(state, None, pos)
+            if is_removable(state, positions, values):
+                nb_clues -= len(positions)
+            else:
+                for i in xrange(len(positions)):
+                    # LOOP INVARIANT
+                    #   The clues at all the positions of the orbit handled
+                    #   so far have been put back.
+                    sudokuSolver.set_value_at(state, values[i], positions[i])
+
+
+
+
+def generate_puzzles(dim=3, count=None, clues=0, symmetry=None, seed=None):
+    """
+    Generate count puzzles of the given dimension, or puzzles without end
+    if count is None, each of them as a roster with a unique solution.
+    Clues are removed from a random solution until the puzzle has the
+    given number of clues, or until no more clues can be removed, such
+    that puzzles can have more clues than asked for. The clues of each
+    puzzle are symmetric under the given symmetry (see orbit), if any.
+    The same seed always generates the same puzzles.
+  """
+    check_symmetry(symmetry)
+    rng = random.Random(seed)
+    number = 0
+    while count == None or number < count:
+        # LOOP INVARIANT
+        #   number puzzles have been generated.
+        state = sudokuSolver.RosterState(sudokuSolver.make_roster(dim))
+        fill_randomly(state, rng)
+        remove_clues(state, rng, clues, symmetry)
+        yield state.roster
+        number += 1
+puzzles = list(generate_puzzles(2, 3, symmetry='rotational', seed=1))
+assert puzzles == list(generate_puzzles(2, 3, symmetry='rotational', seed=1))
+for roster in puzzles:
+    # LOOP INVARIANT
+    #   All the puzzles handled so far have a unique solution and clues
+    #   that are symmetric under rotation.
+    assert sudokuSolver.count_solutions(roster, limit=2) == 1
+    for pos in sudokuSolver.topology(2).positions:
+        # LOOP INVARIANT
+        #   The clues at all the positions handled so far are mirrored by
+        #   a clue at their rotated position.
+        assert (sudokuSolver.value_at(roster, pos) == None) == \
+               (sudokuSolver.value_at(roster, (3-pos[0], 3-pos[1])) == None)
+
+
+
+
+def main(argv=None):
+    """
+    Write the number of puzzles asked for on the command line to the
+    given output file, or to standard output.
+  """
+    import argparse
+    parser = argparse.ArgumentParser(description='Generate Sudoku puzzles with a unique solution.')
+    parser.add_argument('-n', '--count', type=int, default=1)
+    parser.add_argument('-d', '--dimension', type=int, default=3)
+    parser.add_argument('--clues', type=int, default=0)
+    parser.add_argument('--symmetry', choices=SYMMETRIES)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('output', nargs='?', type=argparse.FileType('w'), default=sys.stdout)
+    args = parser.parse_args(argv)
+    for roster in generate_puzzles(args.dimension, args.count, args.clues,
+                                   args.symmetry, args.seed):
+        # LOOP INVARIANT
+        #   All the puzzles generated so far have been written.
+        args.output.write(sudokuSolver.roster_to_string(roster) + '\n')
+        args.output.flush()
+
+
+if __name__ == '__main__':
+    main()
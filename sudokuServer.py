@@ -0,0 +1,615 @@
+#######
+#
+# SOLVING SERVICE
+#
+# A server that solves puzzles sent over TCP or a Unix socket, speaking
+# newline-delimited JSON: each line sent to the server is a JSON object,
+# answered by a line holding a JSON object with the same "id".
+#   - {"id": 1, "puzzle": "4.3.21.3...", "timeout": 2.5, "backend": "dlx"}
+#     asks for the solution of a puzzle in the format of sudokuBatch,
+#     within the given number of seconds (by default the timeout of the
+#     server) and by the given backend (by default the built-in search).
+#     The answer holds a "status": "solved" along with the "solution",
+#     "unsolvable", "timeout", or "error" along with an "error" message.
+#   - {"id": 2, "stats": true} asks for the counters of the server, given
+#     in the answer as "stats".
+# Answers are sent as soon as they are known, so not necessarily in the
+# order of the requests.
+#
+# Puzzles are queued and handed to a pool of worker processes in batches.
+# Each batch holds the puzzles that arrived within a short delay after
+# the first one, up to a maximum size, and only a bounded number of
+# batches is in flight at any time. Each puzzle of a batch is a task of
+# its own in the pool, answered as soon as it is solved, such that a slow
+# puzzle only uses up its own deadline, not that of the puzzles batched
+# with it. The queue has a bounded size as
+# well: while it is full, the server stops reading requests, such that
+# clients are slowed down by the flow control of their connection.
+# A puzzle whose deadline passes while it is queued is answered without
+# being solved. A worker interrupts a search that runs past its deadline
+# by means of an interval timer, and goes on with the next puzzle of its
+# batch; this requires a Unix system.
+# The answers of each connection are written by a thread of its own, such
+# that a client that stops reading its answers holds up no other client.
+#
+# The Client class is a simple client of the server, to drive it from
+# Python.
+#
+# Usage: python sudokuServer.py [--host HOST] [--port PORT | --unix PATH]
+#                               [-p PROCESSES] [--batch-size SIZE]
+#                               [--batch-delay SECONDS] [--max-queue SIZE]
+#                               [--timeout SECONDS]
+#        python sudokuServer.py --self-test
+#   the latter runs a round trip through a service instead (see self_test).
+#
+#######
+
+import collections
+import json
+import multiprocessing
+import os
+import Queue
+import shutil
+import signal
+import socket
+import SocketServer
+import tempfile
+import threading
+import time
+
+import sudokuSolver
+
+
+class DeadlineExceeded(Exception):
+    """ Raised in a worker when the search for a solution runs out of time. """
+
+
+
+
+def raise_deadline_exceeded(signum, frame):
+    """ Handle the interval timer of a worker that expired. """
+    raise DeadlineExceeded()
+
+
+
+
+def init_worker():
+    """ Prepare a worker process to interrupt searches past their deadline. """
+    signal.signal(signal.SIGALRM, raise_deadline_exceeded)
+
+
+
+
+def solve_before(puzzle, deadline, backend=None):
+    """
+    Return the answer to a request to solve the given puzzle before the
+    given deadline, in seconds since the epoch, as a dictionary without
+    id. The search is interrupted when the deadline passes.
+  """
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        return {'status': 'timeout'}
+    try:
+        signal.setitimer(signal.ITIMER_REAL, remaining)
+        try:
+            roster = sudokuSolver.roster_from_string(puzzle)
+            if sudokuSolver.fill_intelligently(roster, backend=backend):
+                return {'status': 'solved',
+                        'solution': sudokuSolver.roster_to_string(roster)}
+            return {'status': 'unsolvable'}
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    except DeadlineExceeded:
+        return {'status': 'timeout'}
+    except Exception as error:
+        return {'status': 'error', 'error': str(error)}
+
+
+
+
+def parse_request(line):
+    """
+    Return the request described by the given line, as a dictionary.
+    ValueError is raised if the line does not hold a JSON object.
+  """
+    request = json.loads(line)
+    if not isinstance(request, dict):
+        raise ValueError('a request must be a JSON object')
+    return request
+assert parse_request('{"id": 2, "stats": true}') == {'id': 2, 'stats': True}
+
+
+
+
+def check_request(request):
+    """
+    Check the given request to solve a puzzle, and turn its puzzle into a
+    string of bytes.
+    ValueError is raised if the request is not valid.
+  """
+    if not isinstance(request.get('puzzle'), basestring):
+        raise ValueError('a request must hold a puzzle or ask for stats')
+    request['puzzle'] = str(request['puzzle'])
+    sudokuSolver.roster_string_dimension(request['puzzle'])
+    timeout = request.get('timeout')
+    # JSON booleans are ints in Python, but not a number of seconds.
+    if timeout != None and (isinstance(timeout, bool) or
+                            not isinstance(timeout, (int, float)) or timeout < 0):
+        raise ValueError('the timeout must be a number of seconds')
+    sudokuSolver.check_backend(request.get('backend'))
+request = parse_request('{"id": 1, "puzzle": "4.3.21.31...3.2."}')
+check_request(request)
+assert request['puzzle'] == '4.3.21.31...3.2.'
+try:
+    check_request(parse_request('{"id": 1, "puzzle": "4.3.21.31...3.2.", "timeout": true}'))
+    assert False
+except ValueError:
+    pass
+
+
+
+
+class Job(object):
+    """
+    A request to solve a puzzle, queued in a solving service. The callback
+    is called with the answer to the request.
+  """
+    __slots__ = ('puzzle', 'deadline', 'backend', 'received', 'callback')
+
+    def __init__(self, puzzle, deadline, backend, callback):
+        self.puzzle = puzzle
+        self.deadline = deadline
+        self.backend = backend
+        self.received = time.time()
+        self.callback = callback
+
+
+
+
+class SolvingService(object):
+    """
+    A queue of puzzles that are solved in batches by a pool of the given
+    number of worker processes (by default one per core), as described
+    above. Batches hold at most batch_size puzzles, gathered during at
+    most batch_delay seconds, at most two batches per worker are in
+    flight, and at most max_queue puzzles are queued. Puzzles have to
+    be solved within timeout seconds unless a request says otherwise.
+    The service runs from start until close.
+  """
+
+    def __init__(self, processes=None, batch_size=16, batch_delay=0.005,
+                 max_queue=1024, timeout=10.0):
+        if processes == None:
+            processes = multiprocessing.cpu_count()
+        self.processes = processes
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.timeout = timeout
+        self.queue = Queue.Queue(max_queue)
+        self.slots = threading.Semaphore(2*processes)
+        self.lock = threading.Lock()
+        self.counters = collections.Counter()
+        self.in_flight = 0
+        self.latencies = collections.deque(maxlen=1000)
+        self.pool = None
+        self.dispatcher = None
+
+    def start(self):
+        """ Start the worker processes and the dispatching of batches. """
+        self.pool = multiprocessing.Pool(self.processes, init_worker)
+        self.dispatcher = threading.Thread(target=self.dispatch)
+        self.dispatcher.daemon = True
+        self.dispatcher.start()
+
+    def close(self):
+        """
+        Stop the service once all the puzzles queued have been answered.
+      """
+        self.queue.put(None)
+        self.dispatcher.join()
+        self.pool.close()
+        self.pool.join()
+
+    def submit(self, puzzle, callback, timeout=None, backend=None):
+        """
+        Queue the given puzzle, to be solved within the given number of
+        seconds (by default the timeout of the service) by the given
+        backend. The given callback is called with the answer, without id.
+        This blocks while the queue is full.
+      """
+        if timeout == None:
+            timeout = self.timeout
+        job = Job(puzzle, time.time() + timeout, backend, callback)
+        with self.lock:
+            self.counters['received'] += 1
+        self.queue.put(job)
+
+    def reject(self):
+        """ Count a request that is answered with an error without being queued. """
+        with self.lock:
+            self.counters['received'] += 1
+            self.counters['error'] += 1
+
+    def finish(self, job, answer):
+        """ Register the given answer to the given job, and pass it on. """
+        latency = time.time() - job.received
+        with self.lock:
+            self.counters[answer['status']] += 1
+            self.latencies.append(latency)
+        job.callback(answer)
+
+    def next_batch(self):
+        """
+        Return the list of the jobs of the next batch, waiting for the
+        first one, or None once the service is closed.
+      """
+        job = self.queue.get()
+        if job == None:
+            return None
+        batch = [job]
+        end = time.time() + self.batch_delay
+        while len(batch) < self.batch_size:
+            # LOOP INVARIANT
+            #   batch holds the jobs taken from the queue so far, all of
+            #   which arrived before the end of the delay.
+            remaining = end - time.time()
+            if remaining <= 0:
+                break
+            try:
+                job = self.queue.get(timeout=remaining)
+            except Queue.Empty:
+                break
+            if job == None:
+                self.queue.put(None)
+                break
+            batch.append(job)
+        return batch
+
+    def dispatch(self):
+        """
+        Hand the queued jobs to the pool in batches, until the service is
+        closed. Jobs that are past their deadline are answered at once.
+      """
+        batch = self.next_batch()
+        while batch != None:
+            # LOOP INVARIANT
+            #   All the jobs taken from the queue before the current batch
+            #   have been answered or handed to the pool.
+            now = time.time()
+            jobs = []
+            for job in batch:
+                # LOOP INVARIANT
+                #   All the jobs of the batch handled so far have been
+                #   answered if they are late, or added to the jobs.
+                if job.deadline <= now:
+                    self.finish(job, {'status': 'timeout'})
+                else:
+                    jobs.append(job)
+            if len(jobs) > 0:
+                self.slots.acquire()
+                with self.lock:
+                    self.in_flight += len(jobs)
+                remaining = [len(jobs)]
+                for job in jobs:
+                    # LOOP INVARIANT
+                    #   All the jobs handled so far have been handed to the
+                    #   pool as tasks of their own.
+                    self.pool.apply_async(solve_before,
+                                          (job.puzzle, job.deadline, job.backend),
+                                          callback=self.job_done(job, remaining))
+            batch = self.next_batch()
+
+    def job_done(self, job, remaining):
+        """
+        Return the function that answers the given job with its answer.
+        remaining holds the number of jobs of its batch not answered yet;
+        the batch leaves the jobs in flight once all of them are answered.
+      """
+        def answer(answer):
+            with self.lock:
+                self.in_flight -= 1
+                remaining[0] -= 1
+                is_batch_done = remaining[0] == 0
+            if is_batch_done:
+                self.slots.release()
+            self.finish(job, answer)
+        return answer
+
+    def stats(self):
+        """
+        Return a dictionary of the counters of this service: the number of
+        puzzles queued and in flight, the number of requests received and
+        answered with each status, and the mean, median, 99th percentile
+        and maximum of the latencies of the last 1000 answers, in
+        milliseconds.
+      """
+        with self.lock:
+            stats = {'queue_depth': self.queue.qsize(),
+                     'in_flight': self.in_flight}
+            for name in ('received', 'solved', 'unsolvable', 'timeout', 'error'):
+                # LOOP INVARIANT
+                #   The counters of all the names handled so far have been
+                #   added to the stats.
+                stats[name] = self.counters[name]
+            latencies = sorted(self.latencies)
+        if len(latencies) > 0:
+            stats['latency_ms'] = {
+                'mean': 1000.0*sum(latencies)/len(latencies),
+                'p50': 1000.0*latencies[len(latencies)//2],
+                'p99': 1000.0*latencies[min(len(latencies)-1, 99*len(latencies)//100)],
+                'max': 1000.0*latencies[-1]}
+        return stats
+
+
+
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+    """
+    The handler of a connection to a solving server, which answers each
+    line read from it. Answers are queued for a writer thread of the
+    connection, such that a client that does not read its answers only
+    holds up its own connection. The handler returns once the connection
+    is closed by the client and all its requests have been answered.
+  """
+
+    def handle(self):
+        self.write_lock = threading.Condition()
+        self.nb_pending = 0
+        self.answers = Queue.Queue()
+        writer = threading.Thread(target=self.write_answers)
+        writer.daemon = True
+        writer.start()
+        for line in iter(self.rfile.readline, ''):
+            # LOOP INVARIANT
+            #   All the requests read so far have been answered or handed
+            #   to the service.
+            if line.strip() != '':
+                self.handle_line(line)
+        with self.write_lock:
+            while self.nb_pending > 0:
+                # LOOP INVARIANT
+                #   nb_pending requests are still to be answered.
+                self.write_lock.wait()
+        self.answers.put(None)
+        writer.join()
+
+    def write_answers(self):
+        """ Write the queued answers to the client, until None is queued. """
+        line = self.answers.get()
+        while line != None:
+            # LOOP INVARIANT
+            #   All the answers taken from the queue so far have been
+            #   written, unless the connection failed.
+            try:
+                self.wfile.write(line)
+            except socket.error:
+                pass
+            line = self.answers.get()
+
+    def handle_line(self, line):
+        """ Answer the request on the given line, or hand it to the service. """
+        service = self.server.service
+        try:
+            request = parse_request(line)
+        except ValueError as error:
+            service.reject()
+            self.reply(None, {'status': 'error', 'error': str(error)})
+            return
+        request_id = request.get('id')
+        if request.get('stats'):
+            self.reply(request_id, {'stats': service.stats()})
+            return
+        try:
+            check_request(request)
+        except ValueError as error:
+            service.reject()
+            self.reply(request_id, {'status': 'error', 'error': str(error)})
+            return
+        with self.write_lock:
+            self.nb_pending += 1
+        def answer(answer):
+            self.reply(request_id, answer)
+            with self.write_lock:
+                self.nb_pending -= 1
+                self.write_lock.notify()
+        service.submit(request['puzzle'], answer, request.get('timeout'),
+                       request.get('backend'))
+
+    def reply(self, request_id, answer):
+        """ Queue the given answer to the request with the given id. """
+        answer['id'] = request_id
+        self.answers.put(json.dumps(answer) + '\n')
+
+
+
+
+class TCPSolvingServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """ A solving server on a TCP socket. """
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+
+
+class UnixSolvingServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """ A solving server on a Unix socket. """
+    daemon_threads = True
+
+
+
+
+def make_server(address, service):
+    """
+    Return a server for the given started solving service, listening at
+    the given address: a pair of a host and a port for TCP, or the path
+    of a Unix socket. The server handles connections once its
+    serve_forever method is called.
+  """
+    if isinstance(address, basestring):
+        server = UnixSolvingServer(address, RequestHandler)
+    else:
+        server = TCPSolvingServer(address, RequestHandler)
+    server.service = service
+    return server
+
+
+
+
+class Client(object):
+    """
+    A client of a solving server at the given address, as for make_server.
+  """
+
+    def __init__(self, address):
+        if isinstance(address, basestring):
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.connect(address)
+        self.file = self.socket.makefile('r+b')
+        self.next_id = 0
+        self.answers = {}
+
+    def send(self, request):
+        """ Send the given request, and return the id it was given. """
+        self.next_id += 1
+        request = dict(request, id=self.next_id)
+        self.file.write(json.dumps(request) + '\n')
+        self.file.flush()
+        return self.next_id
+
+    def receive(self, request_id):
+        """ Return the answer to the request with the given id. """
+        while request_id not in self.answers:
+            # LOOP INVARIANT
+            #   All the answers read so far have been kept by their id.
+            line = self.file.readline()
+            if line == '':
+                raise EOFError('connection closed by the server')
+            answer = json.loads(line)
+            self.answers[answer['id']] = answer
+        return self.answers.pop(request_id)
+
+    def solve(self, puzzle, timeout=None, backend=None):
+        """
+        Return the answer of the server to a request to solve the given
+        puzzle with the given timeout and backend, if any.
+      """
+        return self.solve_all([puzzle], timeout, backend)[0]
+
+    def solve_all(self, puzzles, timeout=None, backend=None):
+        """
+        Return the list of the answers to requests to solve the given
+        puzzles, which are all sent before the first answer is read.
+      """
+        request_ids = []
+        for puzzle in puzzles:
+            # LOOP INVARIANT
+            #   Requests for all the puzzles handled so far have been sent.
+            request = {'puzzle': puzzle}
+            if timeout != None:
+                request['timeout'] = timeout
+            if backend != None:
+                request['backend'] = backend
+            request_ids.append(self.send(request))
+        answers = []
+        for request_id in request_ids:
+            # LOOP INVARIANT
+            #   The answers to all the requests handled so far have been
+            #   collected.
+            answers.append(self.receive(request_id))
+        return answers
+
+    def stats(self):
+        """ Return the counters of the server. """
+        return self.receive(self.send({'stats': True}))['stats']
+
+    def close(self):
+        """ Close the connection to the server. """
+        self.file.close()
+        self.socket.close()
+
+def self_test():
+    """
+    Check a round trip through a service on a temporary Unix socket,
+    driven by a client: solved, unsolvable and invalid puzzles, a timeout
+    given by a request, and the counters of the service. The 36x36 roster
+    without clues takes the built-in search far longer than its timeout,
+    and must not hold up the puzzles batched with it.
+    This cannot run while the module is imported, as the worker processes
+    would inherit the import lock of Python 2 and block on their imports.
+  """
+    directory = tempfile.mkdtemp()
+    try:
+        service = SolvingService(2, batch_delay=0.05, timeout=5.0)
+        service.start()
+        server = make_server(os.path.join(directory, 'socket'), service)
+        serving = threading.Thread(target=server.serve_forever)
+        serving.daemon = True
+        serving.start()
+        client = Client(os.path.join(directory, 'socket'))
+        assert client.solve('1.34341221434321') == \
+               {'id': 1, 'status': 'solved', 'solution': '1234341221434321'}
+        assert client.solve('11..............')['status'] == 'unsolvable'
+        assert client.solve('1.3')['status'] == 'error'
+        assert client.solve('1.34341221434321', timeout=0)['status'] == 'timeout'
+        slow = sudokuSolver.roster_to_string(sudokuSolver.make_roster(6))
+        answers = client.solve_all([slow] + ['1.34341221434321']*5, timeout=2)
+        assert answers[0]['status'] == 'timeout'
+        for answer in answers[1:]:
+            # LOOP INVARIANT
+            #   All the fast puzzles handled so far have been solved.
+            assert answer['status'] == 'solved'
+        stats = client.stats()
+        assert stats['received'] == 10 and stats['solved'] == 6
+        assert stats['unsolvable'] == 1 and stats['error'] == 1 and stats['timeout'] == 2
+        assert stats['queue_depth'] == 0 and stats['in_flight'] == 0
+        client.close()
+        server.shutdown()
+        server.server_close()
+        service.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+
+
+def main(argv=None):
+    """
+    Run a solving server with the settings given on the command line,
+    until it is interrupted.
+  """
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve Sudoku solutions over a socket.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7878)
+    parser.add_argument('--unix', metavar='PATH')
+    parser.add_argument('-p', '--processes', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--batch-delay', type=float, default=0.005)
+    parser.add_argument('--max-queue', type=int, default=1024)
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--self-test', action='store_true',
+                        help='check a round trip through a service and exit')
+    args = parser.parse_args(argv)
+    if args.self_test:
+        self_test()
+        return
+    service = SolvingService(args.processes, args.batch_size, args.batch_delay,
+                             args.max_queue, args.timeout)
+    service.start()
+    if args.unix != None:
+        server = make_server(args.unix, service)
+    else:
+        server = make_server((args.host, args.port), service)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -25,12 +25,138 @@ assert col((2, 3)) == 3
 
 
 
+class Topology(object):
+    """
+    The index tables shared by all rosters of a given dimension.
+    Cells are numbered row by row starting from 0, such that the cell at
+    position (R, C) has index R*dimension**2 + C. Units are numbered
+    starting from 0 as well: first all the rows, then all the columns
+    and finally all the groups.
+    - positions: the position of each cell, in the order of the cells.
+    - cell_rows, cell_cols, cell_groups: the row, column and group of
+      each cell.
+    - unit_cells, unit_positions: the cells and the positions of each unit,
+      in ascending order.
+    - peers: the cells sharing a row, a column or a group with each cell,
+      in ascending order and without the cell itself.
+    - cell_unit_bits: for each cell, the bits representing it among the
+      cells of its row, its column and its group, in that order. Bit K
+      represents the K-th cell of a unit in ascending order.
+    - cell_unit_triples: the row, column and group unit of each cell.
+    Topologies are built once per dimension by the function topology.
+  """
+    __slots__ = ('dim', 'size', 'nb_cells', 'positions', 'cell_rows',
+                 'cell_cols', 'cell_groups', 'unit_cells', 'unit_positions',
+                 'peers', 'cell_unit_bits', 'cell_unit_triples')
+
+    def __init__(self, dim):
+        from array import array
+        self.dim = dim
+        self.size = dim**2
+        self.nb_cells = dim**4
+        positions = []
+        self.cell_rows = array('H')
+        self.cell_cols = array('H')
+        self.cell_groups = array('H')
+        unit_cells = []
+        for unit in xrange(3*self.size):
+            # LOOP INVARIANT
+            #   An empty list of cells has been created for all the
+            #   units handled so far.
+            unit_cells.append([])
+        for cell in xrange(self.nb_cells):
+            # LOOP INVARIANT
+            #   All the cells handled so far have been registered with
+            #   their position, row, column and group, and have been
+            #   added to the cells of their units.
+            row_nr = cell // self.size
+            col_nr = cell % self.size
+            group_nr = dim*(row_nr//dim) + (col_nr//dim)
+            positions.append((row_nr, col_nr))
+            self.cell_rows.append(row_nr)
+            self.cell_cols.append(col_nr)
+            self.cell_groups.append(group_nr)
+            unit_cells[row_nr].append(cell)
+            unit_cells[self.size + col_nr].append(cell)
+            unit_cells[2*self.size + group_nr].append(cell)
+        self.positions = tuple(positions)
+        self.unit_cells = []
+        self.unit_positions = []
+        for unit in xrange(3*self.size):
+            # LOOP INVARIANT
+            #   The cells and the positions of all the units handled so
+            #   far have been stored in compact form.
+            self.unit_cells.append(array('H', unit_cells[unit]))
+            unit_positions = []
+            for cell in unit_cells[unit]:
+                # LOOP INVARIANT
+                #   The positions of all the cells of the current unit
+                #   handled so far have been collected.
+                unit_positions.append(positions[cell])
+            self.unit_positions.append(tuple(unit_positions))
+        self.peers = []
+        for cell in xrange(self.nb_cells):
+            # LOOP INVARIANT
+            #   The peers of all the cells handled so far have been
+            #   stored in compact form.
+            peers = set(unit_cells[self.cell_rows[cell]])
+            peers.update(unit_cells[self.size + self.cell_cols[cell]])
+            peers.update(unit_cells[2*self.size + self.cell_groups[cell]])
+            peers.discard(cell)
+            self.peers.append(array('H', sorted(peers)))
+        self.cell_unit_bits = []
+        self.cell_unit_triples = []
+        for cell in xrange(self.nb_cells):
+            # LOOP INVARIANT
+            #   The bits of all the cells handled so far within their
+            #   units have been stored.
+            row_nr = self.cell_rows[cell]
+            col_nr = self.cell_cols[cell]
+            self.cell_unit_bits.append(
+                (1 << col_nr, 1 << row_nr, 1 << (dim*(row_nr % dim) + col_nr % dim)))
+            self.cell_unit_triples.append(
+                (row_nr, self.size + col_nr, 2*self.size + self.cell_groups[cell]))
+
+    def cell(self, position):
+        """ Return the index of the cell at the given position. """
+        return position[0]*self.size + position[1]
+
+    def cell_units(self, cell):
+        """ Return the row, the column and the group unit of the given cell. """
+        return self.cell_unit_triples[cell]
+
+
+
+
+_topologies = {}
+
+def topology(dimension):
+    """
+    Return the topology of rosters of the given dimension.
+    The topology of each dimension is only built once.
+  """
+    try:
+        return _topologies[dimension]
+    except KeyError:
+        _topologies[dimension] = Topology(dimension)
+        return _topologies[dimension]
+assert topology(3) is topology(3)
+assert topology(3).cell((2, 3)) == 21
+assert topology(3).positions[21] == (2, 3)
+assert len(topology(3).peers[21]) == 20
+assert topology(2).cell_units(7) == (1, 7, 9)
+assert list(topology(2).unit_cells[9]) == [2, 3, 6, 7]
+assert topology(2).cell_unit_bits[7] == (1 << 3, 1 << 1, 1 << 3)
+
+
+
+
 def group(dimension, position):
     """
     Return the group to which the given position belongs in a roster
     of the given dimension.
     """
-    return dimension*(position[0]//dimension) + (position[1]//dimension)
+    return topology(dimension).cell_groups[position[0]*dimension**2 + position[1]]
 assert group(3, (2, 3)) == 1
 
 
@@ -44,7 +170,7 @@ def row_positions(dimension, row):
     the given dimension.
     The resulting sequence contains the positions in ascending order.
   """
-    row_positions = [(row,y) for y in range(dimension**2)]
+    row_positions = [pos for pos in topology(dimension).unit_positions[row]]
     return row_positions
 assert row_positions(2, 2) == [(2, 0), (2, 1), (2, 2), (2, 3)]
 
@@ -58,7 +184,7 @@ def col_positions(dimension, col):
     of the given dimension.
     The resulting sequence contains the positions in ascending order.
   """
-    col_positions = [(x, col) for x in range(dimension**2)]
+    col_positions = [pos for pos in topology(dimension).unit_positions[dimension**2 + col]]
     return col_positions
 assert col_positions(3,7) == [(0, 7), (1, 7), (2, 7), (3, 7), (4, 7),
                               (5, 7), (6, 7), (7, 7), (8, 7)]
@@ -73,9 +199,7 @@ def group_positions(dimension, group):
     of the given dimension.
     The resulting sequence contains the positions in ascending order.
   """
-    first_row = (group//dimension)*dimension
-    first_col = (group%dimension)*dimension
-    group_positions = [(x, y) for x in xrange(first_row, first_row+dimension) for y in xrange(first_col, first_col+dimension)]
+    group_positions = [pos for pos in topology(dimension).unit_positions[2*dimension**2 + group]]
     return group_positions
 assert group_positions(2, 3) == [(2, 2), (2, 3), (3, 2) ,(3, 3)]
 
@@ -90,12 +214,10 @@ def next_position(dimension, position):
     the given position is returned. Otherwise, the first position of the
     next row is returned. If that next row does not exist, None is returned.
   """
-    row_nr = row(position)
-    col_nr = col(position)
-    if col_nr != ((dimension**2)-1):
-        return (row_nr, col_nr+1)
-    elif row_nr != ((dimension**2)-1):
-        return (row_nr+1, 0)
+    topo = topology(dimension)
+    cell = topo.cell(position)
+    if cell != topo.nb_cells-1:
+        return topo.positions[cell+1]
     else:
         return None
 assert next_position(3, (2, 3)) == (2, 4)
@@ -202,11 +324,26 @@ assert dimension(roster) == 3
 
 
 
+class RosterObject(object):
+    """
+    The base class of the rosters that are objects rather than sequences
+    of rows: roster states and flat rosters. Such a roster provides the
+    methods value_at, set_value_at, copy and is_complete, through which
+    the functions on rosters handle it. Any other roster is indexed as a
+    sequence of rows.
+  """
+    __slots__ = ()
+
+
+
+
 def value_at(roster, position):
     """
     Return the value registered at the given position in the given roster.
     None is returned if no value is registered at the given position.
   """
+    if isinstance(roster, RosterObject):
+        return roster.value_at(position)
     return roster[position[0]][position[1]]
 roster = make_roster(2,\
             [   4,None,   3,None,\
@@ -223,6 +360,381 @@ assert value_at(roster, (3, 6))== 2
 assert value_at(roster,(6, 6))== 5
 assert value_at(roster, (0, 0)) == None
 assert value_at(roster, (8, 8)) == None
+assert value_at(((1, None), (None, None)), (0, 0)) == 1
+
+
+
+
+def copy_roster(roster):
+    """
+    Return a new roster of the same dimension as the given roster,
+    filled with the same values.
+  """
+    if isinstance(roster, RosterObject):
+        return roster.copy()
+    copy = []
+    for row in range(len(roster)):
+        # LOOP INVARIANT
+        #   All the rows handled so far have been copied.
+        copy.append(list(roster[row]))
+    return copy
+roster = make_roster(2, [4, None, 3])
+assert copy_roster(roster) == roster
+assert copy_roster(roster)[0] is not roster[0]
+
+
+
+
+def mask_values(mask):
+    """
+    Return the values represented by the given bitmask, in ascending order.
+    Value V is represented by bit V of the mask.
+  """
+    values = []
+    while mask != 0:
+        # LOOP INVARIANT
+        #   All the bits of the original mask below the lowest bit still
+        #   set in mask have been added to the list of values.
+        lowest_bit = mask & -mask
+        values.append(lowest_bit.bit_length()-1)
+        mask ^= lowest_bit
+    return values
+assert mask_values(0) == []
+assert mask_values((1 << 2) | (1 << 4) | (1 << 9)) == [2, 4, 9]
+
+
+
+
+def mask_size(mask):
+    """ Return the number of values represented by the given bitmask. """
+    return bin(mask).count('1')
+assert mask_size(0) == 0
+assert mask_size((1 << 2) | (1 << 4) | (1 << 9)) == 3
+
+
+
+
+class RosterState(RosterObject):
+    """
+    A roster that tracks, for each of its rows, columns and groups, how
+    many times each value is registered in it, together with a bitmask of
+    the values registered in it. Value V is represented by bit V of a mask.
+    Units are numbered as in the topology of the roster.
+    A roster state also tracks the number of filled cells and the number
+    of conflicts, i.e. the number of times a value is registered in a unit
+    that already contains it, plus the number of values outside the range
+    from 1 to the squared dimension. Checking whether a roster state is
+    completely filled or correct therefore takes constant time.
+    Finally, a roster state tracks the candidates of each cell, and for
+    each unit and each value, the places of that value: the mask of the
+    cells of the unit at which the value is a candidate, in which the
+    K-th cell of the unit is represented by bit K. The values having a
+    single place left in a unit are tracked in a mask for each unit, such
+    that hidden singles are found without inspecting the cells.
+    The non-filled cells are kept in buckets by their number of candidates,
+    such that a cell with the least number of candidates is found without
+    inspecting all the cells either.
+    Candidates can also be eliminated from a cell by reasoning about the
+    roster (see ELIMINATION RULES). Eliminated values remain excluded from
+    the candidates of the cell until they are restored.
+    A roster state can be used wherever a roster is expected. The wrapped
+    roster reflects every change made to the state, but it may only be
+    changed through set_value_at, such that the counters stay up to date.
+  """
+    __slots__ = ('roster', 'dim', 'topology', 'all_values', 'values',
+                 'unit_masks', 'unit_counts', 'nb_filled', 'nb_conflicts',
+                 'cell_masks', 'places', 'unit_singles', 'eliminated',
+                 'buckets', 'cell_counts')
+
+    def __init__(self, roster):
+        self.roster = roster
+        self.dim = dimension(roster)
+        self.topology = topology(self.dim)
+        self.all_values = ((1 << len(roster)) - 1) << 1
+        self.values = [None]*self.topology.nb_cells
+        self.unit_masks = [0]*(3*len(roster))
+        self.unit_counts = [0]*(3*len(roster)*(len(roster)+1))
+        self.nb_filled = 0
+        self.nb_conflicts = 0
+        positions = self.topology.positions
+        for cell in xrange(len(positions)):
+            # LOOP INVARIANT
+            #   The values of all the cells handled so far have been
+            #   registered in the counters and the masks.
+            value = value_at(roster, positions[cell])
+            if value != None:
+                self.values[cell] = value
+                self.nb_filled += 1
+                self.register(value, cell)
+        self.cell_masks = [0]*self.topology.nb_cells
+        self.eliminated = [0]*self.topology.nb_cells
+        self.places = [0]*len(self.unit_counts)
+        self.unit_singles = [0]*len(self.unit_masks)
+        self.buckets = []
+        for count in xrange(len(roster)+1):
+            # LOOP INVARIANT
+            #   An empty bucket has been created for all the numbers of
+            #   candidates handled so far.
+            self.buckets.append(set())
+        self.cell_counts = [-1]*self.topology.nb_cells
+        for cell in xrange(len(positions)):
+            # LOOP INVARIANT
+            #   The candidates of all the cells handled so far have been
+            #   registered, along with their places in the units.
+            if self.values[cell] == None:
+                self.change_mask(cell, self.free_mask(cell))
+
+    def __len__(self):
+        return len(self.roster)
+
+    def copy(self):
+        """ Return a copy of the roster wrapped by this roster state. """
+        return copy_roster(self.roster)
+
+    def value_at(self, position):
+        """
+        Return the value registered at the given position in this roster
+        state, or None if no value is registered there.
+      """
+        return self.values[position[0]*len(self.roster) + position[1]]
+
+    def register(self, value, cell):
+        """
+        Register the given value in the counters and the masks of the
+        units of the given cell.
+      """
+        if not (isinstance(value, int) and 0 < value <= len(self.roster)):
+            self.nb_conflicts += 1
+            return
+        for unit in self.topology.cell_units(cell):
+            # LOOP INVARIANT
+            #   The given value has been registered in all the units of
+            #   the given cell handled so far.
+            index = unit*(len(self.roster)+1) + value
+            if self.unit_counts[index] > 0:
+                self.nb_conflicts += 1
+            self.unit_counts[index] += 1
+            self.unit_masks[unit] |= 1 << value
+
+    def unregister(self, value, cell):
+        """
+        Undo the registration of the given value in the counters and the
+        masks of the units of the given cell.
+      """
+        if not (isinstance(value, int) and 0 < value <= len(self.roster)):
+            self.nb_conflicts -= 1
+            return
+        for unit in self.topology.cell_units(cell):
+            # LOOP INVARIANT
+            #   The given value has been unregistered from all the units
+            #   of the given cell handled so far.
+            index = unit*(len(self.roster)+1) + value
+            self.unit_counts[index] -= 1
+            if self.unit_counts[index] > 0:
+                self.nb_conflicts -= 1
+            else:
+                self.unit_masks[unit] &= ~(1 << value)
+
+    def free_mask(self, cell):
+        """
+        Return the bitmask of all values not registered in any of the
+        units of the given cell, nor eliminated from it.
+      """
+        units = self.topology.cell_units(cell)
+        return self.all_values & ~(self.unit_masks[units[0]] |
+                                   self.unit_masks[units[1]] |
+                                   self.unit_masks[units[2]] |
+                                   self.eliminated[cell])
+
+    def change_mask(self, cell, mask):
+        """
+        Change the candidates of the given cell to the given mask, and
+        update the places of the values in its units accordingly, as well
+        as the bucket of the cell, which must have been filled or emptied
+        already.
+      """
+        if self.values[cell] == None:
+            count = bin(mask).count('1')
+        else:
+            count = -1
+        old_count = self.cell_counts[cell]
+        if count != old_count:
+            if old_count >= 0:
+                self.buckets[old_count].discard(cell)
+            if count >= 0:
+                self.buckets[count].add(cell)
+            self.cell_counts[cell] = count
+        changed = self.cell_masks[cell] ^ mask
+        self.cell_masks[cell] = mask
+        if changed == 0:
+            return
+        topo = self.topology
+        units = topo.cell_unit_triples[cell]
+        bits = topo.cell_unit_bits[cell]
+        places = self.places
+        unit_singles = self.unit_singles
+        stride = len(self.roster)+1
+        for k in xrange(3):
+            # LOOP INVARIANT
+            #   The places in the units of the cell handled so far reflect
+            #   its new candidates.
+            unit = units[k]
+            bit = bits[k]
+            base = unit*stride
+            singles = unit_singles[unit]
+            rest = changed
+            while rest != 0:
+                # LOOP INVARIANT
+                #   The places in the current unit of all the values
+                #   removed from rest so far reflect the new candidates.
+                value_bit = rest & -rest
+                rest ^= value_bit
+                index = base + value_bit.bit_length() - 1
+                unit_places = places[index] ^ bit
+                places[index] = unit_places
+                if unit_places != 0 and unit_places & (unit_places-1) == 0:
+                    singles |= value_bit
+                else:
+                    singles &= ~value_bit
+            unit_singles[unit] = singles
+
+    def set_value_at(self, value, position):
+        """
+        Set the given value at the given position in this roster state.
+      """
+        cell = position[0]*len(self.roster) + position[1]
+        old_value = self.values[cell]
+        peers = self.topology.peers[cell]
+        if old_value != None:
+            self.nb_filled -= 1
+            self.unregister(old_value, cell)
+            if isinstance(old_value, int) and 0 < old_value <= len(self.roster):
+                value_bit = 1 << old_value
+                for peer in peers:
+                    # LOOP INVARIANT
+                    #   All the non-filled peers handled so far have the
+                    #   old value as a candidate again, unless it is still
+                    #   registered in one of their units or eliminated.
+                    if self.values[peer] == None and \
+                       self.free_mask(peer) & value_bit != 0:
+                        self.change_mask(peer, self.cell_masks[peer] | value_bit)
+        if value != None:
+            self.nb_filled += 1
+            self.register(value, cell)
+            if isinstance(value, int) and 0 < value <= len(self.roster):
+                value_bit = 1 << value
+                for peer in peers:
+                    # LOOP INVARIANT
+                    #   None of the peers handled so far has the new value
+                    #   as a candidate.
+                    if self.cell_masks[peer] & value_bit != 0:
+                        self.change_mask(peer, self.cell_masks[peer] & ~value_bit)
+        self.values[cell] = value
+        if value == None:
+            self.change_mask(cell, self.free_mask(cell))
+        else:
+            self.change_mask(cell, 0)
+        set_value_at(self.roster, value, position)
+
+    def candidate_mask_at(self, position):
+        """
+        Return the bitmask of all values that can be registered at the
+        given position. The empty mask is returned if the cell at the
+        given position is filled.
+      """
+        return self.cell_masks[position[0]*len(self.roster) + position[1]]
+
+    def eliminate(self, cell, mask):
+        """
+        Eliminate the values in the given mask from the candidates of the
+        given cell, and return the mask of the values that were not
+        eliminated from it yet.
+      """
+        mask &= ~self.eliminated[cell]
+        self.eliminated[cell] |= mask
+        self.change_mask(cell, self.cell_masks[cell] & ~mask)
+        return mask
+
+    def restore(self, cell, mask):
+        """
+        Undo the elimination of the values in the given mask from the
+        candidates of the given cell.
+      """
+        self.eliminated[cell] &= ~mask
+        if self.values[cell] == None:
+            self.change_mask(cell, self.free_mask(cell))
+
+    def min_cell(self):
+        """
+        Return one of the non-filled cells with the least number of
+        candidates, or None if all the cells are filled. The cell is taken
+        from its bucket without inspecting the other cells of the bucket.
+      """
+        for bucket in self.buckets:
+            # LOOP INVARIANT
+            #   The buckets handled so far are empty.
+            if len(bucket) > 0:
+                return next(iter(bucket))
+        return None
+
+    def nb_places(self, unit, value):
+        """
+        Return the number of non-filled cells of the given unit at which
+        the given value is a candidate.
+      """
+        return mask_size(self.places[unit*(len(self.roster)+1) + value])
+
+    def hidden_single_in(self, unit):
+        """
+        Return the position and the value of the hidden single with the
+        smallest value in the given unit, or None if the unit has no
+        hidden single.
+      """
+        singles = self.unit_singles[unit]
+        if singles == 0:
+            return None
+        value = (singles & -singles).bit_length() - 1
+        places = self.places[unit*(len(self.roster)+1) + value]
+        cell = self.topology.unit_cells[unit][places.bit_length() - 1]
+        return self.topology.positions[cell], value
+
+    def candidates_at(self, position):
+        """
+        Return the set of all values that can be registered at the
+        given position. The empty set is returned if the cell at the
+        given position is filled.
+      """
+        return set(mask_values(self.candidate_mask_at(position)))
+
+    def is_complete(self):
+        """ Check whether this roster state is completely filled. """
+        return self.nb_filled == self.topology.nb_cells
+
+    def is_correct(self):
+        """ Check whether this roster state obeys the rules of Sudoku. """
+        return self.nb_conflicts == 0
+
+    def is_legal_placement(self, value, position):
+        """
+        Check whether the given value can be registered at the given
+        position, replacing the value registered there if any, such that
+        no value occurs more than once in the row, the column and the
+        group of that position.
+      """
+        if not (isinstance(value, int) and 0 < value <= len(self.roster)):
+            return False
+        cell = position[0]*len(self.roster) + position[1]
+        old_value = self.values[cell]
+        for unit in self.topology.cell_units(cell):
+            # LOOP INVARIANT
+            #   The given value does not occur elsewhere in any of the
+            #   units of the given position handled so far.
+            count = self.unit_counts[unit*(len(self.roster)+1) + value]
+            if old_value == value:
+                count -= 1
+            if count > 0:
+                return False
+        return True
 
 
 
@@ -231,8 +743,10 @@ def set_value_at(roster, value, position):
     """
     Set the given value at the given position in the given roster.
   """
-    roster[position[0]][position[1]] = value
-    pass
+    if isinstance(roster, RosterObject):
+        roster.set_value_at(value, position)
+    else:
+        roster[position[0]][position[1]] = value
 roster = make_roster()
 set_value_at(roster, 3, (2, 4))
 assert value_at(roster, (2, 4)) == 3
@@ -240,11 +754,167 @@ assert value_at(roster, (2, 4)) == 3
 roster = make_roster_positionally(3, [((8,8), 1)])
 set_value_at(roster, 2, (8, 8))
 assert value_at(roster, (8, 8)) == 2
+
+state = RosterState(make_roster(2,\
+            [   4,None,   3,None,\
+                2,   1,None,   3,\
+                1,None,None,None,\
+                3,None,   2,None]))
+assert state.candidates_at((2, 1)) == {2, 4}
+set_value_at(state, 2, (2, 1))
+assert value_at(state, (2, 1)) == 2
+assert state.candidates_at((2, 1)) == set()
+assert state.candidates_at((3, 1)) == {4}
+set_value_at(state, None, (2, 1))
+assert state.candidates_at((2, 1)) == {2, 4}
+assert state.is_legal_placement(4, (2, 1))
+assert not state.is_legal_placement(1, (2, 1))
+set_value_at(state, 1, (2, 1))
+assert not state.is_correct()
+set_value_at(state, 4, (2, 1))
+assert state.nb_conflicts == 1 and state.nb_filled == 9
+set_value_at(state, None, (1, 3))
+assert state.is_correct() and not state.is_complete()
+fresh_state = RosterState(state.copy())
+assert state.cell_masks == fresh_state.cell_masks
+assert state.places == fresh_state.places
+assert state.unit_singles == fresh_state.unit_singles
+assert state.buckets == fresh_state.buckets and state.cell_counts == fresh_state.cell_counts
+assert state.nb_places(1, 4) == 2 and state.nb_places(1, 3) == 0
+assert state.hidden_single_in(6) == ((1, 2), 4) and state.hidden_single_in(1) == None
+set_value_at(state, None, (2, 1))
+assert state.eliminate(11, 1 << 4) == 1 << 4 and state.eliminate(11, 1 << 4) == 0
+assert state.candidate_mask_at((2, 3)) == 1 << 3 and state.nb_places(2, 4) == 2
+assert 11 in state.buckets[1] and state.min_cell() == 1 and state.cell_masks[1] == 0
+set_value_at(state, 4, (2, 1))
+set_value_at(state, None, (2, 1))
+assert state.candidate_mask_at((2, 3)) == 1 << 3
+state.restore(11, 1 << 4)
+assert state.candidate_mask_at((2, 3)) == (1 << 3) | (1 << 4)
                                  
                                 
 
 
 
+
+class FlatRoster(RosterObject):
+    """
+    A roster stored in one flat buffer with one unsigned byte per cell,
+    row by row, holding 0 for a non-filled cell.
+    A flat roster can be used wherever a roster is expected. Its buffer
+    is either a bytearray of its own, or a view on a part of a larger
+    writable buffer such as a bytearray, an array of unsigned bytes or an
+    mmap, such that many flat rosters can share a single buffer.
+  """
+    __slots__ = ('dim', 'cells')
+
+    def __init__(self, dim=3, cells=None):
+        if cells is None:
+            cells = bytearray(dim**4)
+        self.dim = dim
+        self.cells = cells
+
+    @classmethod
+    def from_buffer(cls, buffer, dim=3, offset=0):
+        """
+        Return a flat roster of the given dimension whose cells are the
+        dim**4 bytes of the given buffer from the given offset on.
+        The bytes of a writable buffer are shared, not copied. Read-only
+        buffers, such as strings and memoryviews, are copied.
+      """
+        import ctypes
+        view_type = ctypes.c_ubyte * dim**4
+        try:
+            return cls(dim, view_type.from_buffer(buffer, offset))
+        except TypeError:
+            if isinstance(buffer, memoryview):
+                buffer = buffer[offset:offset + dim**4].tobytes()
+                offset = 0
+            return cls(dim, view_type.from_buffer_copy(buffer, offset))
+
+    @classmethod
+    def from_roster(cls, roster):
+        """ Return a flat roster filled with the values of the given roster. """
+        flat_roster = cls(dimension(roster))
+        positions = topology(flat_roster.dim).positions
+        for cell in xrange(len(positions)):
+            # LOOP INVARIANT
+            #   The values of all the cells handled so far have been
+            #   copied into the flat roster.
+            value = value_at(roster, positions[cell])
+            if value != None:
+                flat_roster.cells[cell] = value
+        return flat_roster
+
+    def to_roster(self):
+        """ Return a roster as made by make_roster with the values of this roster. """
+        values = []
+        for cell in xrange(len(self.cells)):
+            # LOOP INVARIANT
+            #   The values of all the cells handled so far have been
+            #   appended to the list of values.
+            if self.cells[cell] == 0:
+                values.append(None)
+            else:
+                values.append(self.cells[cell])
+        return make_roster(self.dim, values)
+
+    def __len__(self):
+        return self.dim**2
+
+    def __eq__(self, other):
+        return isinstance(other, FlatRoster) and self.dim == other.dim and \
+               bytearray(self.cells) == bytearray(other.cells)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def copy(self):
+        """ Return a flat roster with a copy of the buffer of this roster. """
+        return FlatRoster(self.dim, bytearray(self.cells))
+
+    def value_at(self, position):
+        """
+        Return the value registered at the given position in this roster,
+        or None if no value is registered there.
+      """
+        value = self.cells[position[0]*self.dim**2 + position[1]]
+        if value == 0:
+            return None
+        return value
+
+    def set_value_at(self, value, position):
+        """ Set the given value at the given position in this roster. """
+        if value == None:
+            value = 0
+        self.cells[position[0]*self.dim**2 + position[1]] = value
+
+    def is_complete(self):
+        """ Check whether this roster is completely filled. """
+        return 0 not in self.cells
+roster = make_roster(2,\
+            [   4,None,   3,None,\
+                2,   1,None,   3,\
+                1,None,None,None,\
+                3,None,   2,None])
+flat_roster = FlatRoster.from_roster(roster)
+assert flat_roster.to_roster() == roster
+assert value_at(flat_roster, (1, 3)) == 3 and value_at(flat_roster, (0, 1)) == None
+assert dimension(flat_roster) == 2 and value_at(flat_roster, (3, 3)) == None
+copy = copy_roster(flat_roster)
+set_value_at(copy, 4, (3, 3))
+assert value_at(copy, (3, 3)) == 4 and value_at(flat_roster, (3, 3)) == None
+buffer = bytearray(3) + bytearray(flat_roster.cells)
+shared_roster = FlatRoster.from_buffer(buffer, 2, 3)
+assert shared_roster == flat_roster
+set_value_at(shared_roster, 1, (3, 3))
+assert buffer[3+15] == 1
+assert FlatRoster.from_buffer(str(buffer), 2, 3) == shared_roster
+assert FlatRoster.from_buffer(memoryview(buffer), 2, 3) == shared_roster
+
+
+
+
 #######
 #
 # ROSTERS: INSPECTION
@@ -258,7 +928,7 @@ def is_filled_at(roster, pos):
     Check whether a value is registered at the given position in
     the given roster.
   """
-    if roster[pos[0]][pos[1]] == None:
+    if value_at(roster, pos) == None:
         return False
     else:
         return True
@@ -276,6 +946,8 @@ def is_completely_filled(roster):
     """
     Check whether the given roster is completely filled.
   """
+    if isinstance(roster, RosterObject):
+        return roster.is_complete()
     for row in range(len(roster)):
         # LOOP INVARIANT
         #   All the elements of all the rows handled so far
@@ -305,41 +977,22 @@ def candidates_at(roster, position):
     in the given roster, such that the roster still obeys the Sudoku rules.
     The empty set is returned if the cell at the given position is filled.
   """
-    list_of_values=[]
-    set_of_values=([])
+    if isinstance(roster, RosterState):
+        return roster.candidates_at(position)
     if is_filled_at(roster, position):
-        return set_of_values
-    dim = dimension(roster)
-    row_nr = row(position)
-    row_pos = row_positions(dim, row_nr)
-    col_nr = col(position)
-    col_pos = col_positions(dim, col_nr)
-    group_nr = group(dim, position)
-    group_pos = group_positions(dim, group_nr)
-    for i in xrange(1, len(roster)+1):
-        # LOOP INVARIANT
-        #   All the possible values of the roster handled so far
-        #   have been compared to all the values that have been
-        #   filled in on the row, column and group of the given
-        #   position. If the comparisons proved that the value
-        #   didn't occur in the row, column or group yet, the
-        #   value has been added to the list of candidates.
-        found_i = False
-        for j in range(len(roster)):
-            # LOOP INVARIANT
-            #   All the values at the row positions, column
-            #   positions and group positions handled so far,
-            #   have been compared to value i.
-            if value_at(roster,row_pos[j]) == i:
-                found_i = True
-            elif value_at(roster, col_pos[j]) == i:
-                found_i = True
-            elif value_at(roster, group_pos[j]) == i:
-                found_i = True
-        if not found_i:
-            list_of_values.extend([i])
-            set_of_values = set(list_of_values)
-    return set_of_values
+        return set()
+    topo = topology(dimension(roster))
+    positions = topo.positions
+    used_values = 0
+    for peer in topo.peers[topo.cell(position)]:
+        # LOOP INVARIANT
+        #   The values at all the peers of the given position handled
+        #   so far have been registered in the mask of used values.
+        value = value_at(roster, positions[peer])
+        if value != None:
+            used_values |= 1 << value
+    all_values = ((1 << len(roster)) - 1) << 1
+    return set(mask_values(all_values & ~used_values))
 
 roster = make_roster(2,\
             [   4,None,   3,None,\
@@ -355,7 +1008,7 @@ assert candidates_at(roster,(2,1)) == {2,4}
 def row_candidates(roster, row):
     pos = (row,0)
     dim = dimension(roster)
-    row_pos = row_positions(dim, row)
+    row_pos = topology(dim).unit_positions[row]
     row_candidates = []
     i = 0
     while i < len(roster):
@@ -380,7 +1033,7 @@ def row_candidates(roster, row):
 def col_candidates(roster, col):
     pos = (0,col)
     dim = dimension(roster)
-    col_pos = col_positions(dim, col)
+    col_pos = topology(dim).unit_positions[dim**2 + col]
     col_candidates = []
     i = 0
     while i < len(roster):
@@ -404,7 +1057,7 @@ def col_candidates(roster, col):
 
 def group_candidates(roster, group):
     dim = dimension(roster)
-    group_pos = group_positions(dim, group)
+    group_pos = topology(dim).unit_positions[2*dim**2 + group]
     pos = group_pos[0]
     group_candidates = []
     i = 0
@@ -451,18 +1104,17 @@ def is_correct_sequence(seq):
         if seq[i] != None:
             if seq[i] < 0 or seq[i] > len(seq):
                 return False
-    seq2 = list(seq)
-    seq2.sort()
-    for i in range(len(seq2)-1):
-        # LOOP INVARIANT
-        #   All the elements of the sorted sequence handled
-        #   so far, have been checked on not being equal to
-        #   the element that follows them.
-        if seq2[i] != None:
-            if seq2[i] == seq2[i+1]:
+    seen = set()
+    for i in range(len(seq)):
+        # LOOP INVARIANT
+        #   All the elements of the sequence handled so far,
+        #   except for None, have been checked on not being
+        #   equal to an element handled before them.
+        if seq[i] != None:
+            if seq[i] in seen:
                 return False
-    else:
-        return True
+            seen.add(seq[i])
+    return True
     
 assert not is_correct_sequence((4, "abc", None, -17, None, "xyz"))
 assert not is_correct_sequence((1, 2, 1))
@@ -475,17 +1127,16 @@ assert is_correct_sequence((None, None, 4, 1))
 #   length of the sequence. In that case, seq[i] is only used three
 #   times. Therefor the complexity is 3.
 #
-# Worst case scenario: T(n) = 3n + 3(n-1) = O(n).
+# Worst case scenario: T(n) = 3n + 3n = O(n).
 #   The worst case scenario in this algorithm, is when it has to
 #   return True. In that case, all the values of the sequence have
 #   to go through all the comparisons. For the first i-loop, seq[i]
 #   is used 3 times and we go as many times through it as the
-#   length of the sequence. The complexity is 2n. For the second
-#   i-loop, seq[i] is also used three times. We go through the loop
-#   one less time, because the last comparison will be between the
-#   one but last and its next element (the last one), which is why
-#   the last element is already checked after this comparison. The
-#   complexity of this loop therefor equals 2(n-1). 
+#   length of the sequence. The complexity is 3n. For the second
+#   i-loop, seq[i] is also used three times: it is compared to None,
+#   looked up in the set of values seen so far and added to it, which
+#   takes constant time on average. The complexity of this loop
+#   therefor equals 3n as well.
 
 
 
@@ -498,6 +1149,8 @@ def is_correct_roster(roster):
     at a position, or the value registered there does not occur at other
     positions in the same row, the same column nor the same group.
   """
+    if isinstance(roster, RosterState):
+        return roster.is_correct()
     dim = dimension(roster)
     row_seq = []
     col_seq = []
@@ -508,7 +1161,7 @@ def is_correct_roster(roster):
         #   rows handled so far, have been added to a sequence,
         #   that has for every row been checked on being a
         #   correct sequence.
-        row_pos = row_positions(dim, row)
+        row_pos = topology(dim).unit_positions[row]
         i = 0
         for i in range(len(roster)):
             # LOOP INVARIANT
@@ -527,7 +1180,7 @@ def is_correct_roster(roster):
         #   columns handled so far, have been added to a sequence,
         #   that has for every column been checked on being a
         #   correct sequence.
-        col_pos = col_positions(dim, col)
+        col_pos = topology(dim).unit_positions[dim**2 + col]
         i = 0
         for i in range(len(roster)):
             # LOOP INVARIANT
@@ -546,7 +1199,7 @@ def is_correct_roster(roster):
         #   groups handled so far, have been added to a sequence,
         #   that has for every group been checked on being a
         #   correct sequence.
-        group_pos = group_positions(dim, group)
+        group_pos = topology(dim).unit_positions[2*dim**2 + group]
         i = 0
         for i in range(len(roster)):
             # LOOP INVARIANT
@@ -592,6 +1245,44 @@ assert not is_correct_roster(make_roster(2,\
 #   3n + 3(n-1) is for the worst case of the correct sequence
 #   function (which is necessary to return True). The complexity
 #   of the worst case scenario therefor equals 3n**2(n**2+3n+3(n-1)).
+#
+# Roster states: T(n) = O(1).
+#   A roster state keeps its number of conflicts up to date on each
+#   call of set_value_at, at a cost of 3 counter updates per call.
+#   Checking its correctness only compares that number to 0.
+
+
+
+
+def is_legal_placement(roster, value, position):
+    """
+    Check whether the given value can be registered at the given position
+    in the given roster, replacing the value registered there if any, such
+    that the value does not occur at other positions in the same row, the
+    same column nor the same group.
+  """
+    if isinstance(roster, RosterState):
+        return roster.is_legal_placement(value, position)
+    if not (isinstance(value, int) and 0 < value <= len(roster)):
+        return False
+    topo = topology(dimension(roster))
+    positions = topo.positions
+    for peer in topo.peers[topo.cell(position)]:
+        # LOOP INVARIANT
+        #   The given value does not occur at any of the peers of the
+        #   given position handled so far.
+        if value_at(roster, positions[peer]) == value:
+            return False
+    return True
+roster = make_roster(2,\
+            [   4,None,   3,None,\
+                2,   1,None,   3,\
+                1,None,None,None,\
+                3,None,   2,None])
+assert is_legal_placement(roster, 2, (2, 1))
+assert not is_legal_placement(roster, 1, (2, 1))
+assert is_legal_placement(roster, 4, (0, 0))
+assert not is_legal_placement(RosterState(roster), 3, (0, 0))
 
 
 
@@ -639,6 +1330,129 @@ assert roster_contents(roster) == [4, [3], [1], [1, 2],
 
           
 
+ROSTER_SYMBOLS = '123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+def roster_string_fields(text):
+    """
+    Return the list of the fields describing the cells in the given
+    string, as explained for roster_string_dimension.
+  """
+    text = text.strip()
+    if ',' in text or len(text.split()) > 1:
+        return text.replace(',', ' ').split()
+    return list(text)
+assert roster_string_fields('1.3.') == ['1', '.', '3', '.']
+assert roster_string_fields(' 1, 12 . 3\n') == ['1', '12', '.', '3']
+
+
+
+
+def roster_string_dimension(text):
+    """
+    Return the dimension of the roster described by the given string.
+    A roster of dimension N is described by N**4 fields, row by row, in
+    one of two forms:
+      - compact: one character per cell, '.' or '0' for a non-filled
+        cell, '1' up to '9' for the values 1 up to 9, and 'A' up to 'Z'
+        (or 'a' up to 'z') for the values 10 up to 35;
+      - separated: the fields are separated by whitespace or commas, and
+        are '.' or '0' for a non-filled cell, or the decimal value of
+        the cell. This form describes rosters of any dimension.
+    Whitespace around the string is ignored.
+    ValueError is raised if the string does not describe a roster.
+  """
+    fields = roster_string_fields(text)
+    dim = int(round(len(fields) ** 0.25))
+    if dim == 0 or dim**4 != len(fields):
+        raise ValueError('not a roster of %d fields' % len(fields))
+    if len(fields) == len(text.strip()):
+        if dim**2 > len(ROSTER_SYMBOLS):
+            raise ValueError('no compact form for a roster of dimension %d' % dim)
+        if text.strip().upper().translate(None, '.0' + ROSTER_SYMBOLS[:dim**2]) != '':
+            raise ValueError('invalid symbol for a roster of dimension %d' % dim)
+    else:
+        for field in fields:
+            # LOOP INVARIANT
+            #   All the fields handled so far describe a cell of a roster
+            #   of the dimension.
+            if field != '.' and not (field.isdigit() and int(field) <= dim**2):
+                raise ValueError('invalid field for a roster of dimension %d: %r'
+                                 % (dim, field))
+    return dim
+assert roster_string_dimension('1.3.' + '0'*12) == 2
+assert roster_string_dimension(' ' + '.'*81 + '\n') == 3
+assert roster_string_dimension('36 ' + '. '*1295) == 6
+
+
+
+
+def roster_from_string(text):
+    """
+    Return a new roster filled with the values described by the given
+    string, as explained for roster_string_dimension.
+  """
+    dim = roster_string_dimension(text)
+    fields = roster_string_fields(text)
+    is_compact = len(fields) == len(text.strip())
+    values = []
+    for field in fields:
+        # LOOP INVARIANT
+        #   The values of all the fields handled so far have been
+        #   appended to the list of values.
+        if field == '.' or field == '0':
+            values.append(None)
+        elif is_compact:
+            values.append(ROSTER_SYMBOLS.index(field.upper()) + 1)
+        else:
+            values.append(int(field))
+    return make_roster(dim, values)
+assert roster_from_string('4.3.21.31...3.2.') == make_roster(2,\
+            [   4,None,   3,None,\
+                2,   1,None,   3,\
+                1,None,None,None,\
+                3,None,   2,None])
+assert roster_from_string('4,.,3,.,2,1,.,3,1,.,.,.,3,.,2,.') == \
+       roster_from_string('4.3.21.31...3.2.')
+
+
+
+
+def roster_to_string(roster, separated=None):
+    """
+    Return the string describing the given roster, as explained for
+    roster_string_dimension. Non-filled cells are described by '.'.
+    The separated form, with the fields separated by spaces, is used if
+    separated is True, or if separated is None and the values of the
+    roster do not fit the compact form.
+  """
+    size = dimension(roster)**2
+    if separated == None:
+        separated = size > len(ROSTER_SYMBOLS)
+    fields = []
+    for pos in topology(dimension(roster)).positions:
+        # LOOP INVARIANT
+        #   The fields of all the positions handled so far have been
+        #   appended to the list of fields.
+        value = value_at(roster, pos)
+        if value == None:
+            fields.append('.')
+        elif separated:
+            fields.append(str(value))
+        else:
+            fields.append(ROSTER_SYMBOLS[value-1])
+    if separated:
+        return ' '.join(fields)
+    return ''.join(fields)
+assert roster_to_string(roster_from_string('4.3.21.31...3.2.')) == '4.3.21.31...3.2.'
+assert roster_to_string(make_roster(4, [16, 10])).startswith('GA..')
+assert roster_to_string(make_roster(4, [16, 10]), True).startswith('16 10 . .')
+assert roster_to_string(make_roster(6, [36])).startswith('36 . ')
+assert roster_from_string(roster_to_string(make_roster(6, [36, 12]))) == \
+       make_roster(6, [36, 12])
+
+
+
+
 #! This function can be used to easily inspect rosters
 def print_roster(roster):
     """
@@ -666,100 +1480,1135 @@ def print_roster(roster):
 
 ##############################################
 #
-# ROSTERS: NUMBER OF SOLUTIONS
+# ROSTERS: BACKENDS
+#
+# fill_intelligently, nb_solutions and count_solutions can hand their
+# work to another engine, selected by name with their backend argument:
+# - 'dlx': Algorithm X with dancing links (see EXACT COVER),
+# - 'cdcl': conflict-driven clause learning (see CLAUSE LEARNING).
+# The default backend None keeps the search of the function itself.
 #
 ################################################
 
 
-# THIS SHOULD BE A RECURSIVE FUNCTION
-def nb_solutions(roster, start_pos=(0,0)):
+BACKENDS = ('dlx', 'cdcl')
+
+def check_backend(backend):
     """
-    Return the total number of possible ways that the given roster
-    can be filled completely. Each of these solutions must satisfy
-    the rules of Sudoku.
+    Check that the given backend is None or one of the known backends,
+    and raise ValueError otherwise.
   """
-    if is_completely_filled(roster) and is_correct_roster(roster):
-        return 1
-    dim = dimension(roster)
-    pos = start_pos
-    number_of_solutions = 0
-    while value_at(roster,pos) != None:
+    if backend != None and backend not in BACKENDS:
+        raise ValueError('unknown backend: %r' % (backend,))
+
+
+
+
+def backend_solver(state, backend):
+    """
+    Return the solver of the given backend for the given correct roster
+    state. Each solver generates the solutions of the state with its
+    solutions method, as lists of positions and values, and counts them
+    with its count method.
+  """
+    if backend == 'cdcl':
+        return ClauseSolver(state)
+    return ExactCover(state)
+
+
+
+
+def fill_with_backend(roster, backend, is_visualizing=False, sudoku_gui=None):
+    """
+    Fill the given roster completely using the given backend, with the
+    same outcome as fill_intelligently.
+  """
+    check_backend(backend)
+    if is_visualizing:
+        sudoku_gui.update_roster(roster_contents(roster))
+    state = roster
+    if not isinstance(state, RosterState):
+        state = RosterState(roster)
+    if not is_correct_roster(state):
+        return False
+    # Only the first solution generated is needed.
+    solution = None
+    for solution in backend_solver(state, backend).solutions():
+        break
+    if solution == None:
+        return False
+    for i in range(len(solution)):
         # LOOP INVARIANT
-        #   At all the positions handled so far, on which
-        #   the value is already known, the next position
-        #   has become the new position.
-        pos = next_position(dim, pos)
-    i = 0
-    for i in xrange(1, len(roster)+1):
-        # LOOP INVARIANT
-        #   All the values of the roster handled so far have
-        #   been checked on maken the roster incorrect while
-        #   filled in on the last handled emtpy position.
-        set_value_at(roster, i, pos)
-        if is_correct_roster(roster):
-            number_of_solutions += nb_solutions(roster, pos)
-    set_value_at(roster, None, pos)
-    return number_of_solutions
-roster = make_roster(2,\
-            [   4,None,   3,None,\
-             None,None,None,None,\
-             None,None,None,None,\
-             None,   2,None,None])
-assert nb_solutions(roster) == 3
+        #   The values of all the choices of the solution handled so far
+        #   have been registered in the roster.
+        set_value_at(state, solution[i][1], solution[i][0])
+    if is_visualizing:
+        sudoku_gui.update_roster(roster_contents(roster))
+    return True
+
 
 
 
 
 ##############################################
 #
-# ROSTERS: FILL INTELLIGENTLY
+# ROSTERS: SEARCH STATISTICS
+#
+# fill_intelligently and nb_solutions can record statistics of their
+# search in a SearchStats object given as their stats argument. Without
+# it, the search only pays for one comparison with None per node.
+# The calls of the TIMED_FUNCTIONS are counted and timed through the
+# wrappers the search gets from its statistics, never by replacing the
+# functions of this module, such that searches in several threads can
+# record statistics at the same time.
+# Backends do not record statistics.
 #
 ################################################
 
-	
-def get_first_naked_single(roster, start_pos=(0,0)):
+
+# The functions of which the calls are counted and timed while a search
+# records statistics.
+TIMED_FUNCTIONS = ('candidates_at', 'is_correct_roster')
+
+class SearchStats(object):
     """
-    Return the position and the value of the first naked single in
-    the given roster starting from the given position.
-    A naked single is a non-filled cell in which ony one value can be filled in
-    in order for the roster to stay correct. Other values are impossible
-    because they already occur in the row, the column or the group to
-    which the cell belongs.
-    None is returned if no naked single exists starting from
-    the given position.
+    Statistics of the searches in which this object is given as stats:
+      - nodes: the number of nodes of the search tree visited,
+      - max_depth: the largest number of cells filled in by the search
+        below its starting roster at any node,
+      - backtracks: the number of nodes left without success,
+      - naked_singles and hidden_singles: the number of singles filled in,
+      - branchings: the number of nodes at which the search branched on
+        the candidates of the cell chosen by min_candidate, and
+        branching_factors, mapping each number of candidates branched on
+        to the number of such branchings,
+      - eliminations: mapping the name of each elimination rule that
+        applied to the number of candidates it eliminated,
+      - calls and times: mapping the name of each of the TIMED_FUNCTIONS
+        to the number of calls of that function during the search and
+        to the time in seconds spent in those calls.
+    Statistics add up over all the searches recorded in the same object.
   """
-    pos = start_pos;
-    dim = dimension(roster)
-    while pos != None:
-        # LOOP INVARIANT
-        #   The number of candidates on all the positions
-        #   checked so far has been checked on being equal
-        #   to 1, which would prove that at that position,
-        #   there would only be one candidate (the naked single).
-        candidates = list(candidates_at(roster, pos))
-        if len(candidates) == 1:
-            return pos, candidates[0]
-        else:
-            pos = next_position(dim, pos)
-    return None
 
+    __slots__ = ('nodes', 'max_depth', 'backtracks', 'naked_singles',
+                 'hidden_singles', 'branchings', 'branching_factors',
+                 'eliminations', 'calls', 'times', 'base', 'recording')
 
+    def __init__(self):
+        self.nodes = 0
+        self.max_depth = 0
+        self.backtracks = 0
+        self.naked_singles = 0
+        self.hidden_singles = 0
+        self.branchings = 0
+        self.branching_factors = {}
+        self.eliminations = {}
+        self.calls = {}
+        self.times = {}
+        for name in TIMED_FUNCTIONS:
+            # LOOP INVARIANT
+            #   The calls and times of all the names handled so far have
+            #   been set to 0.
+            self.calls[name] = 0
+            self.times[name] = 0.0
+        self.base = None
+        self.recording = False
 
+    def is_recording(self):
+        """ Check whether a search is recording in these statistics. """
+        return self.recording
 
-def search_hidden_single(dim, candidate_list):
-    for j in xrange(1, dim**2):
-        # LOOP INVARIANT
-        #   All the values of the roster handled so far
-        #   have been checked on being the first value
-        #   that only occurs once in the candidate list.
-        count_value_j = 0
-        for k in range(len(candidate_list)):
-            # LOOP INVARIANT
-            #   All the values of the candidate list handled
-            #   so far that equaled the current value for j
-            #   have been counted and checked on being equal to 1.
-            if candidate_list[k][0] == j:
-                count_value_j += 1
+    def start_recording(self, state):
+        """
+        Start recording a search from the given roster state, until
+        stop_recording is called. The search counts and times the calls of
+        the TIMED_FUNCTIONS by calling the functions given by timed.
+      """
+        self.base = state.nb_filled
+        self.recording = True
+
+    def stop_recording(self):
+        """ Stop recording a search. """
+        self.recording = False
+
+    def timed(self, name, function):
+        """
+        Return a function that calls the given function, counting and
+        timing the call under the given name.
+      """
+        import time
+        def timed_function(*args):
+            start = time.time()
+            try:
+                return function(*args)
+            finally:
+                self.calls[name] += 1
+                self.times[name] += time.time() - start
+        return timed_function
+
+    def visit(self, state):
+        """ Record a visit of a node of the search at the given roster state. """
+        self.nodes += 1
+        depth = state.nb_filled - self.base
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def branch(self, nb_candidates):
+        """ Record a branching on the given number of candidates. """
+        self.branchings += 1
+        self.branching_factors[nb_candidates] = \
+            self.branching_factors.get(nb_candidates, 0) + 1
+
+    def as_dict(self):
+        """ Return these statistics as a dictionary. """
+        return {'nodes': self.nodes,
+                'max_depth': self.max_depth,
+                'backtracks': self.backtracks,
+                'naked_singles': self.naked_singles,
+                'hidden_singles': self.hidden_singles,
+                'branchings': self.branchings,
+                'branching_factors': dict(self.branching_factors),
+                'eliminations': dict(self.eliminations),
+                'calls': dict(self.calls),
+                'times': dict(self.times)}
+
+    def __repr__(self):
+        return 'SearchStats(%r)' % (self.as_dict(),)
+
+
+
+
+
+##############################################
+#
+# ROSTERS: SEARCH BUDGETS
+#
+# A budget limits the searches in which it is given: they give up once
+# they have visited a maximum number of nodes, once a deadline has passed,
+# or once the budget has been cancelled, for instance from another
+# thread. Checking a budget costs a counter increment and a comparison
+# per node; the clock is only read every TIME_CHECK_INTERVAL nodes.
+# A search that gives up leaves its roster untouched and returns a
+# GaveUp object, which is false like a failed search but can be told
+# apart from one.
+#
+################################################
+
+
+TIME_CHECK_INTERVAL = 16
+
+class Budget(object):
+    """
+    A budget of at most max_nodes nodes, if given, to be spent before the
+    given deadline in seconds since the epoch, or within timeout seconds
+    from now, if given. The nodes add up over all the searches given the
+    same budget. reason tells why the budget is exhausted: 'nodes',
+    'deadline' or 'cancelled', or None while it is not.
+  """
+    __slots__ = ('max_nodes', 'deadline', 'cancelled', 'nodes', 'reason')
+
+    def __init__(self, max_nodes=None, timeout=None, deadline=None):
+        import time
+        if timeout != None:
+            deadline = time.time() + timeout
+        self.max_nodes = max_nodes
+        self.deadline = deadline
+        self.cancelled = False
+        self.nodes = 0
+        self.reason = None
+
+    def cancel(self):
+        """ Make the searches given this budget give up at their next node. """
+        self.cancelled = True
+
+    def spend(self):
+        """
+        Spend a node of this budget, and return whether the budget is
+        exhausted, recording the reason why.
+      """
+        self.nodes += 1
+        if self.cancelled:
+            self.reason = 'cancelled'
+        elif self.max_nodes != None and self.nodes > self.max_nodes:
+            self.reason = 'nodes'
+        elif self.deadline != None and self.nodes % TIME_CHECK_INTERVAL == 1:
+            import time
+            if time.time() >= self.deadline:
+                self.reason = 'deadline'
+        return self.reason != None
+budget = Budget(max_nodes=2)
+assert not budget.spend() and not budget.spend() and budget.spend()
+assert budget.reason == 'nodes'
+budget = Budget(timeout=-1)
+assert budget.spend() and budget.reason == 'deadline'
+budget = Budget()
+budget.cancel()
+assert budget.spend() and budget.reason == 'cancelled'
+
+
+
+
+class GaveUp(object):
+    """
+    The result of a search that gave up for the given reason of its
+    budget, with the given statistics gathered so far as a dictionary
+    (see SearchStats), and the number of solutions counted so far, if the
+    search counts solutions. A GaveUp object is false.
+  """
+    __slots__ = ('reason', 'stats', 'count')
+
+    def __init__(self, reason, stats, count=None):
+        self.reason = reason
+        self.stats = stats
+        self.count = count
+
+    def __nonzero__(self):
+        return False
+
+    def __repr__(self):
+        return 'GaveUp(%r, nodes=%r, count=%r)' % (self.reason, self.stats['nodes'],
+                                                   self.count)
+assert not GaveUp('nodes', {'nodes': 3})
+
+
+
+
+
+##############################################
+#
+# ROSTERS: NUMBER OF SOLUTIONS
+#
+################################################
+
+
+def nb_solutions(roster, start_pos=(0,0), backend=None, stats=None, budget=None):
+    """
+    Return the total number of possible ways that the given roster
+    can be filled completely. Each of these solutions must satisfy
+    the rules of Sudoku.
+    If a backend is given, the solutions of the complete roster are
+    counted by that backend instead (see BACKENDS).
+    If stats is given, the search records its statistics in it (see
+    SearchStats).
+    If a budget is given, the search gives up once the budget is exhausted,
+    and returns a GaveUp object instead, with the solutions counted so far
+    and the statistics gathered so far (see SEARCH BUDGETS).
+  """
+    if backend != None:
+        if budget != None:
+            raise ValueError('budgets only apply to the built-in search')
+        return count_solutions(roster, backend=backend)
+    # The roster is wrapped in a roster state once. From then on, only
+    # candidates are filled in, such that the roster stays correct and
+    # is_correct_roster no longer needs to be checked after each trial.
+    if not isinstance(roster, RosterState):
+        roster = RosterState(roster)
+        if not is_correct_roster(roster):
+            return 0
+    if budget != None and stats == None:
+        stats = SearchStats()
+    if stats != None:
+        stats.start_recording(roster)
+        try:
+            return nb_solutions_of_state(roster, start_pos, stats, budget)
+        finally:
+            stats.stop_recording()
+    return nb_solutions_of_state(roster, start_pos)
+
+
+
+
+def nb_solutions_of_state(state, start_pos=(0,0), stats=None, budget=None):
+    """
+    Return the total number of possible ways that the given correct roster
+    state can be filled completely, filling in the non-filled cells from
+    the given position on in the order of the cells, as nb_solutions does.
+    The search keeps a stack of choices instead of recursing: each choice
+    holds the position of a cell filled in by the search, its candidates,
+    the index of the candidate registered there, and the number of
+    solutions counted before that cell was filled in. The roster state is
+    left untouched.
+    If a budget is given, the statistics must be given as well.
+  """
+    dim = dimension(state)
+    number_of_solutions = 0
+    choices = []
+    pos = start_pos
+    while True:
+        # LOOP INVARIANT
+        #   The cells at the positions of the choices are the only cells
+        #   filled in by the search, each with the candidate at the index
+        #   of its choice, and the solutions with smaller candidates at
+        #   any of those positions have been counted.
+        if stats != None:
+            stats.visit(state)
+        if budget != None and budget.spend():
+            while len(choices) > 0:
+                # LOOP INVARIANT
+                #   The cells of all the choices handled so far have been
+                #   emptied again.
+                set_value_at(state, None, choices.pop()[0])
+            return GaveUp(budget.reason, stats.as_dict(), number_of_solutions)
+        while pos != None and value_at(state,pos) != None:
+            # LOOP INVARIANT
+            #   At all the positions handled so far, on which
+            #   the value is already known, the next position
+            #   has become the new position.
+            pos = next_position(dim, pos)
+        candidates = []
+        if pos == None:
+            if is_completely_filled(state):
+                number_of_solutions += 1
+            elif stats != None:
+                stats.backtracks += 1
+        else:
+            candidates = mask_values(state.candidate_mask_at(pos))
+            if stats != None:
+                if len(candidates) == 0:
+                    stats.backtracks += 1
+                elif len(candidates) > 1:
+                    stats.branch(len(candidates))
+        if len(candidates) > 0:
+            choices.append([pos, candidates, 0, number_of_solutions])
+            set_value_at(state, candidates[0], pos)
+        else:
+            while len(choices) > 0 and choices[-1][2] == len(choices[-1][1])-1:
+                # LOOP INVARIANT
+                #   The cells of all the choices without candidates left
+                #   handled so far have been emptied again.
+                choice = choices.pop()
+                set_value_at(state, None, choice[0])
+                if stats != None and number_of_solutions == choice[3]:
+                    stats.backtracks += 1
+            if len(choices) == 0:
+                return number_of_solutions
+            choice = choices[-1]
+            choice[2] += 1
+            set_value_at(state, choice[1][choice[2]], choice[0])
+            pos = choice[0]
+roster = make_roster(2,\
+            [   4,None,   3,None,\
+             None,None,None,None,\
+             None,None,None,None,\
+             None,   2,None,None])
+assert nb_solutions(roster) == 3
+stats = SearchStats()
+assert nb_solutions(roster, stats=stats) == 3
+assert stats.nodes > 3 and stats.max_depth == 13 and stats.branchings > 0
+result = nb_solutions(roster, budget=Budget(max_nodes=10))
+assert isinstance(result, GaveUp) and result.reason == 'nodes'
+assert result.stats['nodes'] == 11 and result.count < 3
+assert roster == make_roster(2,\
+            [   4,None,   3,None,\
+             None,None,None,None,\
+             None,None,None,None,\
+             None,   2,None,None])
+assert not stats.is_recording() and candidates_at.__name__ == 'candidates_at'
+
+
+
+
+##############################################
+#
+# ROSTERS: ELIMINATION RULES
+#
+# An elimination rule reasons about the candidates of a roster state to
+# find candidates that cannot lead to a solution, without filling in any
+# cell. Each rule is a function that takes a roster state and returns a
+# dictionary mapping cells to the masks of the candidates to eliminate
+# from them. The rules are selected by name:
+# - 'naked_subsets': K cells of a unit whose candidates together are K
+#   values hold those values, which are eliminated from the other cells
+#   of the unit (naked pairs and triples).
+# - 'hidden_subsets': K values of a unit whose places together are K
+#   cells fill those cells, from which all other values are eliminated
+#   (hidden pairs and triples).
+# - 'pointing': a value whose places in a group all lie in one row or
+#   column is eliminated from the rest of that row or column (pointing
+#   pairs and triples).
+# - 'box_line': a value whose places in a row or column all lie in one
+#   group is eliminated from the rest of that group.
+# - 'x_wing': a value with the same two places in two rows is eliminated
+#   from the rest of the two columns of those places, and vice versa.
+#
+################################################
+
+
+RULES = ('naked_subsets', 'hidden_subsets', 'pointing', 'box_line', 'x_wing')
+
+# The largest number of cells or values in the subsets of the subset rules.
+MAX_SUBSET_SIZE = 3
+
+def check_rules(rules):
+    """
+    Check that the given rules are None or a sequence of known rules,
+    and raise ValueError otherwise.
+  """
+    if rules != None:
+        for rule in rules:
+            # LOOP INVARIANT
+            #   All the rules handled so far are known rules.
+            if rule not in RULES:
+                raise ValueError('unknown rule: %r' % (rule,))
+
+
+
+
+def place_cells(state, unit, places):
+    """
+    Return the list of the cells of the given unit of the given roster
+    state at the given places.
+  """
+    unit_cells = state.topology.unit_cells[unit]
+    cells = []
+    while places != 0:
+        # LOOP INVARIANT
+        #   The cells at all the places removed so far have been added
+        #   to the list of cells.
+        place = places & -places
+        places ^= place
+        cells.append(unit_cells[place.bit_length()-1])
+    return cells
+
+
+
+
+def add_elimination(state, found, cell, mask):
+    """
+    Add the candidates of the given cell of the given roster state that
+    are in the given mask to the eliminations found so far.
+  """
+    mask &= state.cell_masks[cell]
+    if mask != 0:
+        found[cell] = found.get(cell, 0) | mask
+
+
+
+
+def naked_subsets(state):
+    """
+    Return the eliminations following from the naked subsets of at most
+    MAX_SUBSET_SIZE cells in the units of the given roster state.
+  """
+    from itertools import combinations
+    masks = state.cell_masks
+    found = {}
+    for unit in xrange(len(state.unit_masks)):
+        # LOOP INVARIANT
+        #   The eliminations of the naked subsets of all the units handled
+        #   so far have been found.
+        cells = []
+        small_cells = []
+        for cell in state.topology.unit_cells[unit]:
+            # LOOP INVARIANT
+            #   All the non-filled cells handled so far have been collected,
+            #   and so have those with few enough candidates for a subset.
+            if masks[cell] != 0:
+                cells.append(cell)
+                if mask_size(masks[cell]) <= MAX_SUBSET_SIZE:
+                    small_cells.append(cell)
+        for size in xrange(2, min(MAX_SUBSET_SIZE, len(cells)-1) + 1):
+            # LOOP INVARIANT
+            #   The eliminations of all the naked subsets of the sizes
+            #   handled so far in the current unit have been found.
+            for subset in combinations(small_cells, size):
+                # LOOP INVARIANT
+                #   The eliminations of all the subsets handled so far
+                #   have been found.
+                union = 0
+                for cell in subset:
+                    # LOOP INVARIANT
+                    #   union holds the candidates of all the cells of the
+                    #   subset handled so far.
+                    union |= masks[cell]
+                if mask_size(union) == size:
+                    for cell in cells:
+                        # LOOP INVARIANT
+                        #   The values of the subset have been eliminated
+                        #   from all the cells outside the subset handled
+                        #   so far.
+                        if cell not in subset:
+                            add_elimination(state, found, cell, union)
+    return found
+
+
+
+
+def hidden_subsets(state):
+    """
+    Return the eliminations following from the hidden subsets of at most
+    MAX_SUBSET_SIZE values in the units of the given roster state.
+  """
+    from itertools import combinations
+    size = len(state)
+    found = {}
+    for unit in xrange(len(state.unit_masks)):
+        # LOOP INVARIANT
+        #   The eliminations of the hidden subsets of all the units
+        #   handled so far have been found.
+        base = unit*(size+1)
+        values = []
+        nb_missing = 0
+        for value in xrange(1, size+1):
+            # LOOP INVARIANT
+            #   All the values handled so far with a place left in the
+            #   unit have been counted, and those with few enough places
+            #   for a subset have been collected.
+            places = state.places[base + value]
+            if places != 0:
+                nb_missing += 1
+                if mask_size(places) <= MAX_SUBSET_SIZE:
+                    values.append(value)
+        for subset_size in xrange(2, min(MAX_SUBSET_SIZE, nb_missing-1) + 1):
+            # LOOP INVARIANT
+            #   The eliminations of all the hidden subsets of the sizes
+            #   handled so far in the current unit have been found.
+            for subset in combinations(values, subset_size):
+                # LOOP INVARIANT
+                #   The eliminations of all the subsets handled so far
+                #   have been found.
+                union = 0
+                subset_mask = 0
+                for value in subset:
+                    # LOOP INVARIANT
+                    #   union holds the places of all the values of the
+                    #   subset handled so far, and subset_mask the values.
+                    union |= state.places[base + value]
+                    subset_mask |= 1 << value
+                if mask_size(union) == subset_size:
+                    for cell in place_cells(state, unit, union):
+                        # LOOP INVARIANT
+                        #   All the values outside the subset have been
+                        #   eliminated from the cells handled so far.
+                        add_elimination(state, found, cell, ~subset_mask)
+    return found
+
+
+
+
+def pointing(state):
+    """
+    Return the eliminations following from the values of which the places
+    in a group of the given roster state all lie in one row or column.
+  """
+    topo = state.topology
+    size = len(state)
+    found = {}
+    for group_nr in xrange(size):
+        # LOOP INVARIANT
+        #   The eliminations pointed at by all the groups handled so far
+        #   have been found.
+        unit = 2*size + group_nr
+        for value in xrange(1, size+1):
+            # LOOP INVARIANT
+            #   The eliminations pointed at by all the values handled so
+            #   far in the current group have been found.
+            places = state.places[unit*(size+1) + value]
+            if places != 0:
+                cells = place_cells(state, unit, places)
+                lines = []
+                if same_line(topo.cell_rows, cells):
+                    lines.append(topo.cell_rows[cells[0]])
+                if same_line(topo.cell_cols, cells):
+                    lines.append(size + topo.cell_cols[cells[0]])
+                for line in lines:
+                    # LOOP INVARIANT
+                    #   The value has been eliminated from the rest of all
+                    #   the lines handled so far.
+                    for cell in topo.unit_cells[line]:
+                        # LOOP INVARIANT
+                        #   The value has been eliminated from all the cells
+                        #   of the line outside the group handled so far.
+                        if topo.cell_groups[cell] != group_nr:
+                            add_elimination(state, found, cell, 1 << value)
+    return found
+
+
+
+
+def same_line(lines, cells):
+    """
+    Check whether all the given cells have the same entry in the given
+    table of lines, i.e. lie on the same row or column.
+  """
+    for cell in cells:
+        # LOOP INVARIANT
+        #   All the cells handled so far lie on the line of the first cell.
+        if lines[cell] != lines[cells[0]]:
+            return False
+    return True
+
+
+
+
+def box_line(state):
+    """
+    Return the eliminations following from the values of which the places
+    in a row or a column of the given roster state all lie in one group.
+  """
+    topo = state.topology
+    size = len(state)
+    found = {}
+    for line in xrange(2*size):
+        # LOOP INVARIANT
+        #   The eliminations claimed by all the rows and columns handled
+        #   so far have been found.
+        for value in xrange(1, size+1):
+            # LOOP INVARIANT
+            #   The eliminations claimed by all the values handled so far
+            #   in the current line have been found.
+            places = state.places[line*(size+1) + value]
+            if places != 0:
+                cells = place_cells(state, line, places)
+                if same_line(topo.cell_groups, cells):
+                    group_unit = 2*size + topo.cell_groups[cells[0]]
+                    for cell in topo.unit_cells[group_unit]:
+                        # LOOP INVARIANT
+                        #   The value has been eliminated from all the cells
+                        #   of the group outside the line handled so far.
+                        if line not in topo.cell_units(cell):
+                            add_elimination(state, found, cell, 1 << value)
+    return found
+
+
+
+
+def x_wing(state):
+    """
+    Return the eliminations following from the X-Wings in the given
+    roster state: two rows in which a value has the same two places, or
+    two columns in which it does.
+  """
+    topo = state.topology
+    size = len(state)
+    found = {}
+    for value in xrange(1, size+1):
+        # LOOP INVARIANT
+        #   The eliminations of the X-Wings of all the values handled so
+        #   far have been found.
+        for offset in (0, size):
+            # LOOP INVARIANT
+            #   The eliminations of the X-Wings of the current value on
+            #   the kinds of lines handled so far have been found.
+            lines_by_places = {}
+            for line in xrange(offset, offset+size):
+                # LOOP INVARIANT
+                #   All the lines handled so far in which the value has
+                #   two places have been grouped by those places.
+                places = state.places[line*(size+1) + value]
+                if mask_size(places) == 2:
+                    lines_by_places.setdefault(places, []).append(line)
+            for places in lines_by_places:
+                # LOOP INVARIANT
+                #   The eliminations of the X-Wings on all the places
+                #   handled so far have been found.
+                lines = lines_by_places[places]
+                if len(lines) == 2:
+                    for corner in place_cells(state, lines[0], places):
+                        # LOOP INVARIANT
+                        #   The value has been eliminated from the rest of
+                        #   the crossing lines of all the corners handled
+                        #   so far.
+                        if offset == 0:
+                            cross_unit = size + topo.cell_cols[corner]
+                        else:
+                            cross_unit = topo.cell_rows[corner]
+                        for cell in topo.unit_cells[cross_unit]:
+                            # LOOP INVARIANT
+                            #   The value has been eliminated from all the
+                            #   cells of the crossing line outside the two
+                            #   lines handled so far.
+                            if topo.cell_units(cell)[offset // size] not in lines:
+                                add_elimination(state, found, cell, 1 << value)
+    return found
+
+
+
+
+RULE_FUNCTIONS = {'naked_subsets': naked_subsets,
+                  'hidden_subsets': hidden_subsets,
+                  'pointing': pointing,
+                  'box_line': box_line,
+                  'x_wing': x_wing}
+
+def apply_rules(state, rules, eliminations, stats=None):
+    """
+    Apply the given rules to the given roster state, in order, until one
+    of them eliminates candidates. Those candidates are eliminated, and
+    a pair of the cell and the mask of the eliminated values is appended
+    to the given list of eliminations for each cell involved.
+    Return the number of candidates eliminated, which is 0 if none of the
+    rules applies. If stats is given, the eliminations are added to the
+    eliminations of the rule in it.
+  """
+    for rule in rules:
+        # LOOP INVARIANT
+        #   None of the rules handled so far eliminates any candidates.
+        found = RULE_FUNCTIONS[rule](state)
+        nb_eliminated = 0
+        for cell in sorted(found):
+            # LOOP INVARIANT
+            #   The candidates found for all the cells handled so far have
+            #   been eliminated and appended to the eliminations.
+            mask = state.eliminate(cell, found[cell])
+            if mask != 0:
+                eliminations.append((cell, mask))
+                nb_eliminated += mask_size(mask)
+        if nb_eliminated > 0:
+            if stats != None:
+                stats.eliminations[rule] = stats.eliminations.get(rule, 0) + nb_eliminated
+            return nb_eliminated
+    return 0
+
+
+
+
+def undo_eliminations(state, eliminations, length):
+    """
+    Restore the candidates of the given roster state on the given list of
+    eliminations, from the last one on, until the list is cut back to the
+    given length.
+  """
+    while len(eliminations) > length:
+        # LOOP INVARIANT
+        #   The candidates of all the eliminations removed from the list
+        #   so far have been restored.
+        cell, mask = eliminations.pop()
+        state.restore(cell, mask)
+state = RosterState(make_roster(2, [1, 2]))
+assert pointing(state) == {6: (1 << 3) | (1 << 4), 7: (1 << 3) | (1 << 4)}
+assert naked_subsets(state) == hidden_subsets(state) == box_line(state) == pointing(state)
+state = RosterState(make_roster(2,\
+            [None,None,None,None,\
+             None,   1,None,   2,\
+             None,   2,None,   3]))
+assert x_wing(state) == {0: 1 << 4, 2: 1 << 4, 12: 1 << 4, 14: 1 << 4}
+eliminations = []
+assert apply_rules(state, ['pointing', 'x_wing'], eliminations) == 4
+assert state.candidate_mask_at((0, 0)) & (1 << 4) == 0 and x_wing(state) == {}
+undo_eliminations(state, eliminations, 0)
+assert state.candidate_mask_at((0, 0)) & (1 << 4) != 0 and len(eliminations) == 0
+
+
+
+
+
+##############################################
+#
+# ROSTERS: SEARCH RECORDING
+#
+# A recorder given to fill_intelligently receives the changes made by the
+# search as compact events, instead of a full picture of the roster at
+# each step. Each event is a triple of integers (KIND, CELL, DATA):
+#   - (PLACE, cell, value): a single has been filled in at the cell,
+#   - (CHOOSE, cell, value): the search has branched on the cell, and
+#     filled in the given candidate there,
+#   - (ELIMINATE, cell, mask): an elimination rule has eliminated the
+#     values in the mask from the candidates of the cell,
+#   - (BACKTRACK, places, eliminations): the search has undone all but
+#     the given numbers of the cells it filled in and of the eliminations.
+# The pictures of the roster, as roster_contents gives them, are only
+# rebuilt from the events when the recording is played back (see
+# recorded_frames and replay_recording).
+# A recorder is any object with the following methods:
+#   - start(state): start recording a search from the given roster state,
+#     forgetting any earlier recording,
+#   - record(kind, cell, data): store the given event,
+#   - player(): return a FramePlayer in the state from which the stored
+#     events are to be replayed,
+#   - events(): return an iterator over the stored events, in order.
+# A RingRecorder keeps the last events in memory, up to a maximum number;
+# a LogRecorder writes all the events to a binary file.
+#
+################################################
+
+
+PLACE, CHOOSE, ELIMINATE, BACKTRACK = range(4)
+
+class FramePlayer(object):
+    """
+    The changes recorded by a search, replayed on the values of the cells
+    of a roster of the given dimension, holding 0 for non-filled cells.
+    places holds the cells filled in by the search, in order, and
+    eliminations the pairs of a cell and a mask eliminated by the search.
+  """
+    __slots__ = ('dim', 'values', 'places', 'eliminations')
+
+    def __init__(self, dim, values):
+        self.dim = dim
+        self.values = list(values)
+        self.places = []
+        self.eliminations = []
+
+    @classmethod
+    def from_state(cls, state):
+        """ Return a player on the values of the given roster state. """
+        values = []
+        for value in state.values:
+            # LOOP INVARIANT
+            #   The values of all the cells handled so far have been
+            #   collected, with 0 for non-filled cells.
+            if value == None:
+                values.append(0)
+            else:
+                values.append(value)
+        return cls(state.dim, values)
+
+    def copy(self):
+        """ Return a player in the same state as this one. """
+        player = FramePlayer(self.dim, self.values)
+        player.places = list(self.places)
+        player.eliminations = list(self.eliminations)
+        return player
+
+    def apply(self, kind, cell, data):
+        """ Apply the given event to this player. """
+        if kind == PLACE or kind == CHOOSE:
+            self.values[cell] = data
+            self.places.append(cell)
+        elif kind == ELIMINATE:
+            self.eliminations.append((cell, data))
+        else:
+            while len(self.places) > cell:
+                # LOOP INVARIANT
+                #   The cells of all the places undone so far have been
+                #   emptied again.
+                self.values[self.places.pop()] = 0
+            del self.eliminations[data:]
+
+    def frame(self):
+        """
+        Return the contents of the roster of this player, as given by
+        roster_contents, without the candidates eliminated.
+      """
+        values = []
+        for value in self.values:
+            # LOOP INVARIANT
+            #   The values of all the cells handled so far have been
+            #   collected, with None for non-filled cells.
+            if value == 0:
+                values.append(None)
+            else:
+                values.append(value)
+        state = RosterState(make_roster(self.dim, values))
+        for cell, mask in self.eliminations:
+            # LOOP INVARIANT
+            #   The candidates of all the eliminations handled so far
+            #   have been eliminated.
+            state.eliminate(cell, mask)
+        return roster_contents(state)
+player = FramePlayer(2, [4, 0, 3, 0] + [0]*12)
+player.apply(PLACE, 1, 1)
+player.apply(ELIMINATE, 4, 1 << 2)
+assert player.frame()[:5] == [4, 1, 3, [2], [3]]
+player.apply(BACKTRACK, 0, 0)
+assert player.frame()[:5] == [4, [1, 2], 3, [1, 2], [1, 2, 3]]
+
+
+
+
+def recorded_frames(recorder, step=1, max_frames=None):
+    """
+    Generate the contents of the roster, as roster_contents gives them,
+    before the first event stored by the given recorder, after every step
+    events, and after the last event. If max_frames is given, step is
+    raised such that at most about that many frames are generated.
+  """
+    events = list(recorder.events())
+    if max_frames != None and max_frames > 1:
+        step = max(step, -(-len(events) // (max_frames-1)))
+    player = recorder.player()
+    yield player.frame()
+    for i in xrange(len(events)):
+        # LOOP INVARIANT
+        #   All the events handled so far have been replayed, and a
+        #   frame has been generated after every step of them.
+        player.apply(*events[i])
+        if (i+1) % step == 0 or i == len(events)-1:
+            yield player.frame()
+
+
+
+
+def replay_recording(recorder, sudoku_gui, step=1, max_frames=None):
+    """
+    Pass the frames of the recording of the given recorder, as generated
+    by recorded_frames with the given arguments, to the update_roster
+    method of the given gui.
+  """
+    for frame in recorded_frames(recorder, step, max_frames):
+        # LOOP INVARIANT
+        #   All the frames handled so far have been passed to the gui.
+        sudoku_gui.update_roster(frame)
+
+
+
+
+class RingRecorder(object):
+    """
+    A recorder that keeps the last capacity events in memory. Older events
+    are replayed on the player from which the events kept are replayed.
+    The capacity must be at least 1.
+  """
+
+    def __init__(self, capacity=100000):
+        import collections
+        if capacity < 1:
+            raise ValueError('invalid capacity for a ring recorder: %r' % capacity)
+        self.capacity = capacity
+        self.kept = collections.deque()
+        self.base = None
+
+    def start(self, state):
+        self.kept.clear()
+        self.base = FramePlayer.from_state(state)
+
+    def record(self, kind, cell, data):
+        if len(self.kept) == self.capacity:
+            self.base.apply(*self.kept.popleft())
+        self.kept.append((kind, cell, data))
+
+    def player(self):
+        return self.base.copy()
+
+    def events(self):
+        return iter(self.kept)
+recorder = RingRecorder(capacity=1)
+recorder.start(RosterState(make_roster(2, [4, None, 3])))
+recorder.record(PLACE, 1, 1)
+recorder.record(PLACE, 3, 2)
+assert list(recorder.events()) == [(PLACE, 3, 2)] and recorder.player().values[1] == 1
+assert list(recorded_frames(recorder))[-1][:4] == [4, 1, 3, 2]
+try:
+    RingRecorder(capacity=0)
+    assert False
+except ValueError:
+    pass
+
+
+
+
+class LogRecorder(object):
+    """
+    A recorder that writes the events to the given binary file, which must
+    be opened for reading as well to replay them. The file starts with the
+    magic string 'SDKE', the dimension of the roster as one byte, 3
+    reserved bytes and the values of its cells, one byte per cell, and then
+    holds each event as a byte, an unsigned 16-bit integer and an unsigned
+    64-bit integer, all little-endian. A recorder on a file written before
+    replays the events in it.
+  """
+
+    def __init__(self, file):
+        import struct
+        self.file = file
+        self.header = struct.Struct('<4sB3x')
+        self.event = struct.Struct('<BHQ')
+
+    def start(self, state):
+        player = FramePlayer.from_state(state)
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(self.header.pack('SDKE', player.dim))
+        self.file.write(bytearray(player.values))
+
+    def record(self, kind, cell, data):
+        self.file.write(self.event.pack(kind, cell, data))
+
+    def player(self):
+        self.file.flush()
+        self.file.seek(0)
+        magic, dim = self.header.unpack(self.file.read(self.header.size))
+        if magic != 'SDKE':
+            raise ValueError('not a search recording')
+        values = bytearray(self.file.read(dim**4))
+        self.file.seek(0, 2)
+        return FramePlayer(dim, values)
+
+    def events(self):
+        self.file.flush()
+        self.file.seek(0)
+        magic, dim = self.header.unpack(self.file.read(self.header.size))
+        position = self.header.size + dim**4
+        block = self.event.size * 4096
+        data = 'start'
+        while data:
+            # LOOP INVARIANT
+            #   All the events before the position have been generated.
+            self.file.seek(position)
+            data = self.file.read(block)
+            position += len(data)
+            self.file.seek(0, 2)
+            for offset in xrange(0, len(data), self.event.size):
+                # LOOP INVARIANT
+                #   All the events of the block before the offset have been
+                #   generated.
+                yield self.event.unpack_from(data, offset)
+
+
+
+
+##############################################
+#
+# ROSTERS: FILL INTELLIGENTLY
+#
+################################################
+
+	
+def get_first_naked_single(roster, start_pos=(0,0)):
+    """
+    Return the position and the value of the first naked single in
+    the given roster starting from the given position.
+    A naked single is a non-filled cell in which ony one value can be filled in
+    in order for the roster to stay correct. Other values are impossible
+    because they already occur in the row, the column or the group to
+    which the cell belongs.
+    None is returned if no naked single exists starting from
+    the given position.
+  """
+    if isinstance(roster, RosterState):
+        # A roster state keeps the candidates of each cell as a mask,
+        # which holds a naked single if it has a single bit set.
+        masks = roster.cell_masks
+        for cell in xrange(roster.topology.cell(start_pos), len(masks)):
+            # LOOP INVARIANT
+            #   None of the cells handled so far holds a naked single.
+            mask = masks[cell]
+            if mask != 0 and mask & (mask-1) == 0:
+                return roster.topology.positions[cell], mask.bit_length()-1
+        return None
+    pos = start_pos;
+    dim = dimension(roster)
+    while pos != None:
+        # LOOP INVARIANT
+        #   The number of candidates on all the positions
+        #   checked so far has been checked on being equal
+        #   to 1, which would prove that at that position,
+        #   there would only be one candidate (the naked single).
+        candidates = list(candidates_at(roster, pos))
+        if len(candidates) == 1:
+            return pos, candidates[0]
+        else:
+            pos = next_position(dim, pos)
+    return None
+
+
+
+
+def search_hidden_single(dim, candidate_list):
+    for j in xrange(1, dim**2+1):
+        # LOOP INVARIANT
+        #   All the values of the roster handled so far
+        #   have been checked on being the first value
+        #   that only occurs once in the candidate list.
+        count_value_j = 0
+        for k in range(len(candidate_list)):
+            # LOOP INVARIANT
+            #   All the values of the candidate list handled
+            #   so far that equaled the current value for j
+            #   have been counted and checked on being equal to 1.
+            if candidate_list[k][0] == j:
+                count_value_j += 1
                 if count_value_j == 1:
                     pos_j = candidate_list[k][1]
         if count_value_j == 1:
@@ -769,159 +2618,2121 @@ def search_hidden_single(dim, candidate_list):
 
 
 
-def get_first_hidden_single(roster, start_pos=(0,0)):
+def get_first_hidden_single(roster, start_pos=(0,0)):
+    """
+    Return the position and the value of the first hidden single in
+    the given roster starting from the given position.
+    A hidden single is a non-filled cell which is forced to
+    take a specific value, because that value is not yet present in
+    the associated group, row, or column, and due to the placement of
+    the other values, there are no alternative positions left for
+    that value to take.
+    None is returned if no hidden single exists starting from
+    the given position.
+  """
+    dim = dimension(roster)
+    row_nr = row(start_pos)
+    col_nr = col(start_pos)
+    group_nr = group(dim, start_pos)
+    if isinstance(roster, RosterState):
+        # A roster state tracks the values with a single place left in
+        # each unit, such that only the units need to be inspected.
+        for unit in range(row_nr, dim**2) + range(dim**2 + col_nr, 2*dim**2) + \
+                    range(2*dim**2 + group_nr, 3*dim**2):
+            # LOOP INVARIANT
+            #   None of the units handled so far has a hidden single.
+            hidden_single = roster.hidden_single_in(unit)
+            if hidden_single != None:
+                return hidden_single
+        return None
+    for i in xrange(row_nr, dim**2):
+        # LOOP INVARIANT
+        #   All the candidates on the row positions of the
+        #   current row handled so far, have been checked on
+        #   having a hidden single. 
+        row_can = row_candidates(roster, i)
+        hidden_single = search_hidden_single(dim, row_can)
+        if hidden_single != None:
+            return hidden_single
+    for i in xrange(col_nr, dim**2):
+        # LOOP INVARIANT
+        #   All the candidates on the column positions of the
+        #   current column handled so far, have been checked on
+        #   having a hidden single. 
+        col_can = col_candidates(roster, i)
+        hidden_single = search_hidden_single(dim, col_can)
+        if hidden_single != None:
+            return hidden_single
+    for i in range(group_nr, dim**2):
+        # LOOP INVARIANT
+        #   All the candidates on the group positions of the
+        #   current group handled so far, have been checked on
+        #   having a hidden single. 
+        group_can = group_candidates(roster, i)
+        hidden_single = search_hidden_single(dim, group_can)
+        if hidden_single != None:
+            return hidden_single
+    return None
+roster = make_roster(2,\
+            [   4,None,None,None,\
+                2,   1,None,   3,\
+                1,None,None,None,\
+                3,None,   2,None])
+assert get_first_naked_single(roster) == ((0, 1), 3)
+roster = make_roster(2,\
+            [   4,   3,   1,   2,\
+                2,   1,   4,   3,\
+                1,None,None,None,\
+                3,None,   2,None])
+assert get_first_hidden_single(roster,(0,0)) == ((2, 1), 2)
+assert get_first_hidden_single(RosterState(roster),(0,0)) == ((2, 1), 2)
+assert get_first_naked_single(roster) == ((2, 2), 3)
+
+
+
+
+def min_candidate(roster):
+    """
+    Return the first position, in the order of the cells, of a non-filled
+    cell with the least number of candidates in the given roster. For a
+    roster state, the position of any such cell is returned instead (see
+    RosterState.min_cell).
+  """
+    dim = dimension(roster)
+    min_candidate = len(roster)+1
+    if isinstance(roster, RosterState):
+        # A roster state keeps its cells in buckets by their number of
+        # candidates, such that no cells need to be scanned.
+        return roster.topology.positions[roster.min_cell()]
+    pos = (0,0);
+    while pos != None:
+        # LOOP INVARIANT
+        #   The number of candidates on the positions handled
+        #   so far has been checked on being smaller than the
+        #   smallest number of candidates found on a position
+        #   so far.
+        if value_at(roster, pos) == None:
+            nb_candidates = len(candidates_at(roster, pos))
+            if nb_candidates < min_candidate:
+                min_candidate = nb_candidates
+                min_pos = pos
+        pos = next_position(dim, pos)
+    return min_pos
+roster = make_roster(2,\
+            [   4,None,   3,None,\
+             None,None,None,None,\
+             None,None,None,None,\
+             None,   2,None,None])
+assert min_candidate(roster) == min_candidate(RosterState(roster)) == (0, 1)
+state = RosterState(make_roster(2, [1, None, None, None, None, 2]))
+assert len(candidates_at(state, min_candidate(state))) == 2
+
+
+
+
+TIE_BREAKS = ('index', 'degree')
+VALUE_ORDERS = ('ascending', 'least_constraining')
+
+def check_ordering(tie_break, value_order):
+    """
+    Check that the given tie break and value order are None or one of the
+    TIE_BREAKS and the VALUE_ORDERS respectively, and raise ValueError
+    otherwise.
+  """
+    if tie_break != None and tie_break not in TIE_BREAKS:
+        raise ValueError('unknown tie break: %r' % (tie_break,))
+    if value_order != None and value_order not in VALUE_ORDERS:
+        raise ValueError('unknown value order: %r' % (value_order,))
+
+
+
+
+def branch_position(state, tie_break=None):
+    """
+    Return the position of a non-filled cell with the least number of
+    candidates in the given roster state. Among such cells, no tie break
+    (the default) takes any cell, as min_candidate does, the tie break
+    'index' takes the first cell, and 'degree' the cell with the most
+    non-filled peers, the first one if there are several.
+  """
+    if tie_break == None:
+        return min_candidate(state)
+    bucket = set()
+    for cells in state.buckets:
+        # LOOP INVARIANT
+        #   The buckets handled so far are empty.
+        if len(cells) > 0:
+            bucket = cells
+            break
+    if tie_break == 'index':
+        return state.topology.positions[min(bucket)]
+    best_cell = None
+    best_degree = -1
+    for cell in bucket:
+        # LOOP INVARIANT
+        #   best_cell is the smallest of the cells handled so far with the
+        #   most non-filled peers, best_degree.
+        degree = 0
+        for peer in state.topology.peers[cell]:
+            # LOOP INVARIANT
+            #   degree counts the non-filled peers handled so far.
+            if state.values[peer] == None:
+                degree += 1
+        if degree > best_degree or (degree == best_degree and cell < best_cell):
+            best_cell = cell
+            best_degree = degree
+    return state.topology.positions[best_cell]
+
+
+
+
+def branch_values(state, position, value_order=None):
+    """
+    Return the list of the candidates at the given position of the given
+    roster state, in the order in which to try them: ascending (the
+    default), or least constraining first, i.e. by ascending number of
+    peers of which they are a candidate as well, and ascending otherwise.
+  """
+    candidates = mask_values(state.candidate_mask_at(position))
+    if value_order == 'least_constraining':
+        peers = state.topology.peers[state.topology.cell(position)]
+        constraints = {}
+        for value in candidates:
+            # LOOP INVARIANT
+            #   The number of peers sharing each of the candidates handled
+            #   so far has been counted.
+            value_bit = 1 << value
+            constraints[value] = 0
+            for peer in peers:
+                # LOOP INVARIANT
+                #   The peers handled so far having the value as a
+                #   candidate have been counted.
+                if state.cell_masks[peer] & value_bit != 0:
+                    constraints[value] += 1
+        candidates.sort(key=lambda value: (constraints[value], value))
+    return candidates
+state = RosterState(make_roster(2,\
+            [   4,None,None,None,\
+             None,None,None,None,\
+             None,None,None,None,\
+             None,None,None,   1]))
+assert branch_values(state, (1, 2)) == [1, 2, 3, 4]
+assert branch_values(state, (1, 2), 'least_constraining') == [1, 4, 2, 3]
+state = RosterState(make_roster(2,\
+            [None,None,None,   2,\
+             None,None,None,   3,\
+                3,None,None,None,\
+                2,None,None,None]))
+assert branch_position(state) == (0, 0) and branch_position(state, 'degree') == (0, 2)
+assert branch_position(state, 'index') == (0, 0)
+
+
+
+
+def undo_trail(state, trail, length):
+    """
+    Empty the cells of the given roster state at the positions on the
+    given trail, from the last one on, until the trail is cut back to the
+    given length. Return the number of cells emptied.
+  """
+    nb_undone = len(trail) - length
+    while len(trail) > length:
+        # LOOP INVARIANT
+        #   The cells at all the positions removed from the trail so far
+        #   have been emptied.
+        set_value_at(state, None, trail.pop())
+    return nb_undone
+
+
+
+
+def fill_intelligently(roster, is_visualizing = False, sudoku_gui = None,
+                       backend = None, stats = None, rules = None, cache = None,
+                       budget = None, recorder = None, tie_break = None,
+                       value_order = None):
+    """
+    Fill the given roster completely by exploiting naked singles and hidden
+    singles as much as possible. At times that there are no hidden singles
+    nor naked singles in the roster, filling proceeds with a cell with the
+    least number of candidates.
+    The function returns True if its was able to work out a complete fill.
+    In that case, the state of the roster is changed to reflect the fill.
+    If a complete fill is impossible, the function returns False and leaves the
+    given roster untouched.
+    If a backend is given, the fill is worked out by that backend instead
+    (see BACKENDS). Such a backend only shows the roster before and after
+    the fill when visualizing.
+    If stats is given, the search records its statistics in it (see
+    SearchStats).
+    If rules are given, the search applies those elimination rules (see
+    ELIMINATION RULES) until none of them applies, each time it runs out
+    of singles, before it branches on a cell.
+    If a cache is given, the fill is served from that solution cache if an
+    equivalent roster was filled before (see SOLUTION CACHE).
+    If a budget is given, the search gives up once the budget is exhausted,
+    leaves the roster untouched and returns a GaveUp object instead, with
+    the statistics gathered so far (see SEARCH BUDGETS).
+    If a recorder is given, the search records its changes in it as events
+    (see SEARCH RECORDING), which is much cheaper than visualizing.
+    The search branches on a cell chosen by the given tie break among the
+    cells with the least number of candidates, and tries its candidates in
+    the given value order (see branch_position and branch_values).
+  """
+    check_rules(rules)
+    check_ordering(tie_break, value_order)
+    if cache != None:
+        return fill_with_cache(roster, cache, is_visualizing, sudoku_gui,
+                               backend, stats, rules, budget, recorder,
+                               tie_break, value_order)
+    if backend != None:
+        if budget != None or recorder != None:
+            raise ValueError('budgets and recorders only apply to the built-in search')
+        return fill_with_backend(roster, backend, is_visualizing, sudoku_gui)
+    # The roster is wrapped in a roster state once, such that all the
+    # candidates during the fill follow from the masks of the state, and
+    # checking whether the roster is complete and correct takes constant time.
+    if not isinstance(roster, RosterState):
+        roster = RosterState(roster)
+        if not is_correct_roster(roster):
+            return False
+    if budget != None and stats == None:
+        stats = SearchStats()
+    if stats != None:
+        stats.start_recording(roster)
+        try:
+            return fill_state(roster, is_visualizing, sudoku_gui, stats, rules,
+                              budget, recorder, tie_break, value_order)
+        finally:
+            stats.stop_recording()
+    return fill_state(roster, is_visualizing, sudoku_gui, rules=rules,
+                      recorder=recorder, tie_break=tie_break,
+                      value_order=value_order)
+
+
+
+
+def fill_state(state, is_visualizing=False, sudoku_gui=None, stats=None,
+               rules=None, budget=None, recorder=None, tie_break=None,
+               value_order=None):
+    """
+    Fill the given correct roster state completely, as fill_intelligently
+    does, and return whether that succeeded.
+    The search keeps a trail of the positions of all the cells it filled
+    in, singles included, a list of the candidates eliminated by the
+    rules, and a stack of choices instead of recursing: each choice holds
+    the lengths of the trail and of the eliminations before branching on
+    a cell, the position of that cell, its candidates and the index of the
+    next candidate to try there. Backtracking cuts the trail and the
+    eliminations back to the lengths of the last choice with candidates
+    left, such that a failed fill leaves the roster state untouched. The
+    eliminations are undone after a successful fill as well.
+    If a budget is given, the statistics must be given as well.
+  """
+    trail = []
+    eliminations = []
+    choices = []
+    topo = state.topology
+    check_correct, find_candidates = is_correct_roster, candidates_at
+    if stats != None:
+        check_correct = stats.timed('is_correct_roster', is_correct_roster)
+        find_candidates = stats.timed('candidates_at', candidates_at)
+    if recorder != None:
+        recorder.start(state)
+    while True:
+        # LOOP INVARIANT
+        #   The cells at the positions on the trail are the only cells
+        #   filled in by the search, and the choices hold the branchings
+        #   on the trail, with the candidates not tried yet.
+        if stats != None:
+            stats.visit(state)
+        if budget != None and budget.spend():
+            undo_trail(state, trail, 0)
+            undo_eliminations(state, eliminations, 0)
+            if recorder != None:
+                recorder.record(BACKTRACK, 0, 0)
+            return GaveUp(budget.reason, stats.as_dict())
+        # when is_visualizing is True, the provided sudoku_gui will receive
+        # the subsequent roster contents which will be used to visualize
+        # the algorithm step-by-step once the algorithm has finished
+        if is_visualizing:
+            sudoku_gui.update_roster(roster_contents(state))
+        if is_completely_filled(state) and check_correct(state):
+            undo_eliminations(state, eliminations, 0)
+            if recorder != None:
+                recorder.record(BACKTRACK, len(trail), 0)
+            return True
+        """
+        The function min_candidate(roster) returns the position at which the
+        number of candidates is the least. This is the position that needs to
+        be filled in first. min_can gives the list of the candidates at this
+        position. If this list is empty, the roster contains a wrong value,
+        and the search backtracks to the last choice with candidates left.
+        If the length equals one, there's at least one naked single in the
+        roster. In that case, the naked single must be filled in. If no naked
+        single can be found (when the length of min_can is greater than one),
+        the roster needs to be checked for hidden singles. If a hidden single
+        can be found, the hidden single must be filled in. If not, the shortest
+        list of candidates is used to fill the roster.
+      """
+        pos_to_fill = min_candidate(state)
+        min_can = list(find_candidates(state, pos_to_fill))
+        if len(min_can) == 1:
+            # The cell with the least number of candidates holds a naked
+            # single, which is filled in at once.
+            set_value_at(state, min_can[0], pos_to_fill)
+            trail.append(pos_to_fill)
+            if stats != None:
+                stats.naked_singles += 1
+            if recorder != None:
+                recorder.record(PLACE, topo.cell(pos_to_fill), min_can[0])
+        elif len(min_can) > 1:
+            nb_eliminations = len(eliminations)
+            hidden_single = get_first_hidden_single(state)
+            if hidden_single != None:
+                set_value_at(state, hidden_single[1], hidden_single[0])
+                trail.append(hidden_single[0])
+                if stats != None:
+                    stats.hidden_singles += 1
+                if recorder != None:
+                    recorder.record(PLACE, topo.cell(hidden_single[0]), hidden_single[1])
+            elif rules != None and apply_rules(state, rules, eliminations, stats) > 0:
+                if recorder != None:
+                    for cell, mask in eliminations[nb_eliminations:]:
+                        # LOOP INVARIANT
+                        #   All the new eliminations handled so far have
+                        #   been recorded.
+                        recorder.record(ELIMINATE, cell, mask)
+            else:
+                if tie_break != None or value_order != None:
+                    pos_to_fill = branch_position(state, tie_break)
+                    min_can = branch_values(state, pos_to_fill, value_order)
+                if stats != None:
+                    stats.branch(len(min_can))
+                choices.append([len(trail), len(eliminations), pos_to_fill, min_can, 1])
+                set_value_at(state, min_can[0], pos_to_fill)
+                trail.append(pos_to_fill)
+                if recorder != None:
+                    recorder.record(CHOOSE, topo.cell(pos_to_fill), min_can[0])
+        else:
+            while len(choices) > 0 and choices[-1][4] == len(choices[-1][3]):
+                # LOOP INVARIANT
+                #   All the choices handled so far had no candidates left.
+                choices.pop()
+            if len(choices) == 0:
+                nb_undone = undo_trail(state, trail, 0)
+                undo_eliminations(state, eliminations, 0)
+                if stats != None:
+                    stats.backtracks += nb_undone + 1
+                if recorder != None:
+                    recorder.record(BACKTRACK, 0, 0)
+                return False
+            choice = choices[-1]
+            nb_undone = undo_trail(state, trail, choice[0])
+            undo_eliminations(state, eliminations, choice[1])
+            if stats != None:
+                stats.backtracks += nb_undone
+            set_value_at(state, choice[3][choice[4]], choice[2])
+            if recorder != None:
+                recorder.record(BACKTRACK, len(trail), len(eliminations))
+                recorder.record(CHOOSE, topo.cell(choice[2]), choice[3][choice[4]])
+            trail.append(choice[2])
+            choice[4] += 1
+roster = make_roster(2,
+            [1,   None,None,None,\
+             None,2,   None,None,\
+             None,None,3,   None,\
+             None,None,None,4])
+stats = SearchStats()
+assert fill_intelligently(roster, False, None, stats=stats)
+assert stats.nodes == 13 and stats.max_depth == 12
+assert stats.naked_singles + stats.hidden_singles + stats.branchings >= 12
+assert stats.calls['candidates_at'] > 0 and stats.calls['is_correct_roster'] == 1
+assert not stats.is_recording() and is_correct_roster.__name__ == 'is_correct_roster'
+roster = make_roster(2, [1, None, None, None, None, 2])
+result = fill_intelligently(roster, budget=Budget(max_nodes=5))
+assert isinstance(result, GaveUp) and result.stats['nodes'] == 6
+assert roster == make_roster(2, [1, None, None, None, None, 2])
+roster = make_roster(2, [None, None, None, None, None, 1, None, 2, None, 2, None, 3])
+recorder = RingRecorder()
+assert fill_intelligently(copy_roster(roster), rules=RULES, recorder=recorder)
+kinds = set()
+for event in recorder.events():
+    # LOOP INVARIANT
+    #   The kinds of all the events handled so far have been collected.
+    kinds.add(event[0])
+assert kinds == set([PLACE, CHOOSE, ELIMINATE, BACKTRACK])
+frames = list(recorded_frames(recorder))
+assert frames[0] == roster_contents(roster) and len(frames) == len(recorder.kept) + 1
+assert fill_intelligently(roster) and frames[-1] == roster_contents(roster)
+assert len(list(recorded_frames(recorder, max_frames=3))) <= 3
+for tie_break in TIE_BREAKS:
+    # LOOP INVARIANT
+    #   The roster has been filled with all the tie breaks handled so far.
+    for value_order in VALUE_ORDERS:
+        # LOOP INVARIANT
+        #   The roster has been filled with all the value orders handled
+        #   so far.
+        roster = make_roster(2, [1, None, None, None, None, 2])
+        assert fill_intelligently(roster, tie_break=tie_break, value_order=value_order)
+        assert is_completely_filled(roster) and is_correct_roster(roster)
+flat_roster = FlatRoster.from_roster(make_roster(2, [1, None, None, None, None, 2]))
+assert fill_intelligently(flat_roster)
+assert is_completely_filled(flat_roster) and is_correct_roster(flat_roster)
+roster = make_roster(2,\
+            [1,   None,None,None,\
+             None,2,   None,None,\
+             2,   None,3,   None,\
+             None,None,1,   4])
+assert not fill_intelligently(roster, False, None)
+assert not fill_intelligently(roster, rules=RULES)
+roster = make_roster(2, [None, None, None, None, None, 1, None, 2, None, 2, None, 3])
+assert fill_intelligently(roster, rules=RULES)
+assert is_completely_filled(roster) and is_correct_roster(roster)
+
+
+
+
+##############################################
+#
+# ROSTERS: BOUNDED NUMBER OF SOLUTIONS
+#
+################################################
+
+
+def propagate_singles(state, filled_positions):
+    """
+    Fill in naked singles and hidden singles in the given roster state
+    until none are left, and append the position of each cell filled in
+    to the given list.
+    Return False if the roster state turns out to have no solution, because
+    a non-filled cell has no candidates left, or because a value missing
+    from a row, column or group has no position left in it. Return True
+    otherwise.
+  """
+    topo = state.topology
+    positions = topo.positions
+    progress = True
+    while progress:
+        # LOOP INVARIANT
+        #   All the singles found in the passes handled so far have
+        #   been filled in and appended to the filled positions.
+        progress = False
+        for cell in xrange(topo.nb_cells):
+            # LOOP INVARIANT
+            #   All the naked singles at the cells handled so far in this
+            #   pass have been filled in.
+            if state.values[cell] == None:
+                mask = state.cell_masks[cell]
+                if mask == 0:
+                    return False
+                if mask & (mask-1) == 0:
+                    set_value_at(state, mask.bit_length()-1, positions[cell])
+                    filled_positions.append(positions[cell])
+                    progress = True
+        if progress:
+            continue
+        for unit in xrange(len(topo.unit_cells)):
+            # LOOP INVARIANT
+            #   None of the units handled so far in this pass has a value
+            #   without a position left, and the first hidden single found
+            #   in each of them has been filled in.
+            once = 0
+            for cell in topo.unit_cells[unit]:
+                # LOOP INVARIANT
+                #   once holds the candidates of the cells of the unit
+                #   handled so far.
+                once |= state.cell_masks[cell]
+            if state.all_values & ~(state.unit_masks[unit] | once) != 0:
+                return False
+            hidden_single = state.hidden_single_in(unit)
+            if hidden_single != None:
+                set_value_at(state, hidden_single[1], hidden_single[0])
+                filled_positions.append(hidden_single[0])
+                progress = True
+    return True
+
+
+
+
+def count_solutions_of_state(state, limit):
+    """
+    Return the number of ways in which the given correct roster state can
+    be filled completely, counting at most limit solutions if limit is not
+    None. The roster state is left untouched.
+  """
+    filled_positions = []
+    number_of_solutions = 0
+    if propagate_singles(state, filled_positions):
+        if state.is_complete():
+            number_of_solutions = 1
+        else:
+            pos = min_candidate(state)
+            candidates = mask_values(state.candidate_mask_at(pos))
+            for i in range(len(candidates)):
+                # LOOP INVARIANT
+                #   The solutions with all the candidates handled so far
+                #   filled in at the chosen position have been counted,
+                #   up to the given limit.
+                set_value_at(state, candidates[i], pos)
+                if limit == None:
+                    number_of_solutions += count_solutions_of_state(state, None)
+                else:
+                    number_of_solutions += count_solutions_of_state(
+                        state, limit-number_of_solutions)
+                    if number_of_solutions >= limit:
+                        break
+            set_value_at(state, None, pos)
+    undo_trail(state, filled_positions, 0)
+    return number_of_solutions
+
+
+
+
+def count_solutions(roster, limit=None, backend=None, cache=None):
+    """
+    Return the number of possible ways that the given roster can be filled
+    completely, just like nb_solutions. If a limit is given, counting stops
+    as soon as that many solutions have been found, such that
+    count_solutions(roster, limit=2) == 1 checks whether the roster has
+    a unique solution.
+    Naked singles and hidden singles are filled in first. Otherwise the
+    search proceeds with a cell with the least number of candidates.
+    If a backend is given, the solutions are counted by that backend
+    instead (see BACKENDS).
+    If a cache is given, the number is served from that solution cache if
+    an equivalent roster was counted before (see SOLUTION CACHE).
+    The given roster is left untouched.
+  """
+    check_backend(backend)
+    if cache != None:
+        return count_with_cache(roster, limit, backend, cache)
+    if not isinstance(roster, RosterState):
+        roster = RosterState(roster)
+    if not is_correct_roster(roster):
+        return 0
+    if backend != None:
+        return backend_solver(roster, backend).count(limit)
+    return count_solutions_of_state(roster, limit)
+roster = make_roster(2,\
+            [   4,None,   3,None,\
+             None,None,None,None,\
+             None,None,None,None,\
+             None,   2,None,None])
+assert count_solutions(roster) == 3
+assert count_solutions(roster, limit=2) == 2
+assert roster == make_roster(2,\
+            [   4,None,   3,None,\
+             None,None,None,None,\
+             None,None,None,None,\
+             None,   2,None,None])
+assert count_solutions(make_roster(2), limit=1) == 1
+assert count_solutions(make_roster(2)) == 288
+assert count_solutions(make_roster(2, [1, 1])) == 0
+
+
+
+
+def split_state(state, depth):
+    """
+    Generate copies of the rosters reached from the given correct roster
+    state by filling in singles and branching at most depth times on a
+    cell with the least number of candidates, as count_solutions does.
+    Branches without solutions are left out. The roster state is left
+    untouched.
+  """
+    filled_positions = []
+    if propagate_singles(state, filled_positions):
+        if depth == 0 or state.is_complete():
+            yield copy_roster(state.roster)
+        else:
+            pos = min_candidate(state)
+            candidates = mask_values(state.candidate_mask_at(pos))
+            for i in range(len(candidates)):
+                # LOOP INVARIANT
+                #   The rosters of the branches for all the candidates
+                #   handled so far have been generated.
+                set_value_at(state, candidates[i], pos)
+                for roster in split_state(state, depth-1):
+                    # LOOP INVARIANT
+                    #   All the rosters of the current branch handled so
+                    #   far have been generated.
+                    yield roster
+            set_value_at(state, None, pos)
+    undo_trail(state, filled_positions, 0)
+
+
+
+
+def split_roster(roster, depth):
+    """
+    Generate rosters that split up the search for the solutions of the
+    given roster: each solution of the given roster is a solution of
+    exactly one of the generated rosters, and vice versa. The rosters are
+    the branches of the search of count_solutions at the given depth.
+    The given roster is left untouched.
+  """
+    if not isinstance(roster, RosterState):
+        roster = RosterState(roster)
+    if is_correct_roster(roster):
+        for subroster in split_state(roster, depth):
+            # LOOP INVARIANT
+            #   All the rosters handled so far have been generated.
+            yield subroster
+roster = make_roster(2,\
+            [   4,None,   3,None,\
+             None,None,None,None,\
+             None,None,None,None,\
+             None,   2,None,None])
+assert len(list(split_roster(roster, 0))) == 1
+assert sum(map(count_solutions, split_roster(roster, 1))) == 3
+assert sum(map(count_solutions, split_roster(make_roster(2), 2))) == 288
+
+
+
+
+##############################################
+#
+# ROSTERS: SOLUTION ENUMERATION
+#
+################################################
+
+
+class SolutionView(RosterObject):
+    """
+    A read-only view on the roster state of a search, as generated by
+    iter_solutions. A view can be read and copied like any roster, but
+    setting a value in it raises TypeError. It shows the solution only
+    until the search goes on.
+  """
+    __slots__ = ('state',)
+
+    def __init__(self, state):
+        self.state = state
+
+    def __len__(self):
+        return len(self.state)
+
+    def copy(self):
+        """ Return a flat roster holding the values of this view. """
+        return FlatRoster.from_roster(self.state)
+
+    def value_at(self, position):
+        """ Return the value at the given position, or None. """
+        return self.state.value_at(position)
+
+    def set_value_at(self, value, position):
+        """ Raise TypeError, as a view cannot be changed. """
+        raise TypeError('a solution view cannot be changed')
+
+    def is_complete(self):
+        """ Check whether all the cells of this view are filled. """
+        return self.state.is_complete()
+
+
+
+
+def iter_solutions(roster, limit=None, views=False):
+    """
+    Generate the solutions of the given roster one by one, at most limit
+    of them if limit is not None, searching for the next solution only
+    when it is asked for. The search fills in singles and branches on a
+    cell with the least number of candidates, as count_solutions does.
+    Each solution is generated as a flat roster of its own. If views is
+    True, a read-only view on the roster state of the search is generated
+    instead, which holds the solution only until the next one is asked
+    for (see SolutionView).
+    The search works on a copy of the given roster, which is left
+    untouched. It keeps a trail and a stack of choices as fill_state does:
+    each choice holds the length of the trail before branching on a cell,
+    the position of that cell, its candidates and the index of the next
+    candidate to try there.
+  """
+    state = RosterState(copy_roster(roster))
+    if not is_correct_roster(state) or limit == 0:
+        return
+    dim = dimension(state)
+    view = SolutionView(state)
+    number_of_solutions = 0
+    trail = []
+    choices = []
+    while True:
+        # LOOP INVARIANT
+        #   The cells at the positions on the trail are the only cells
+        #   filled in by the search, the choices hold the branchings
+        #   on the trail with the candidates not tried yet, and all
+        #   the solutions before the current state have been generated.
+        is_dead_end = True
+        if propagate_singles(state, trail):
+            if state.is_complete():
+                if views:
+                    yield view
+                else:
+                    yield FlatRoster(dim, bytearray(state.values))
+                number_of_solutions += 1
+                if number_of_solutions == limit:
+                    return
+            else:
+                pos = min_candidate(state)
+                candidates = mask_values(state.candidate_mask_at(pos))
+                choices.append([len(trail), pos, candidates, 1])
+                set_value_at(state, candidates[0], pos)
+                trail.append(pos)
+                is_dead_end = False
+        if is_dead_end:
+            while len(choices) > 0 and choices[-1][3] == len(choices[-1][2]):
+                # LOOP INVARIANT
+                #   All the choices handled so far had no candidates
+                #   left.
+                choices.pop()
+            if len(choices) == 0:
+                return
+            choice = choices[-1]
+            undo_trail(state, trail, choice[0])
+            set_value_at(state, choice[2][choice[3]], choice[1])
+            trail.append(choice[1])
+            choice[3] += 1
+roster = make_roster(2,\
+            [   4,None,   3,None,\
+             None,None,None,None,\
+             None,None,None,None,\
+             None,   2,None,None])
+solutions = list(iter_solutions(roster))
+assert len(solutions) == 3 and len(set(map(roster_to_string, solutions))) == 3
+for solution in solutions:
+    # LOOP INVARIANT
+    #   All the solutions handled so far are complete and correct.
+    assert is_completely_filled(solution) and is_correct_roster(solution)
+    assert value_at(solution, (0, 0)) == 4 and value_at(solution, (3, 1)) == 2
+assert len(list(iter_solutions(roster, limit=2))) == 2
+assert roster == make_roster(2,\
+            [   4,None,   3,None,\
+             None,None,None,None,\
+             None,None,None,None,\
+             None,   2,None,None])
+assert list(iter_solutions(make_roster(2, [1, 1]))) == []
+solutions = iter_solutions(make_roster(2))
+solution = next(solutions)
+assert is_completely_filled(solution)
+solutions.close()
+assert sum(1 for solution in iter_solutions(make_roster(2), views=True)) == 288
+view = next(iter_solutions(roster, views=True))
+assert is_completely_filled(view) and is_correct_roster(view)
+flat_copy = copy_roster(view)
+set_value_at(flat_copy, None, (0, 1))
+assert not is_completely_filled(flat_copy) and is_completely_filled(view)
+try:
+    set_value_at(view, 1, (0, 1))
+    assert False
+except TypeError:
+    pass
+
+
+
+
+##############################################
+#
+# ROSTERS: EXACT COVER
+#
+# Filling a roster is an exact cover problem. Each way of registering a
+# value V at a position P is a row of a matrix, and each constraint of
+# Sudoku is a column of that matrix: each cell holds a value, and each
+# row, column and group holds each value. The row for V at P has a 1 in
+# the column of the cell at P, and in the columns for V in the row, the
+# column and the group of P. A solution is a set of rows that has exactly
+# one 1 in every column.
+# The matrix is solved with Algorithm X, using dancing links: all 1s are
+# nodes in circular doubly linked lists, such that covering a column and
+# uncovering it again takes time proportional to the nodes involved.
+#
+################################################
+
+
+class ExactCover(object):
+    """
+    The exact cover matrix of a correct roster state, restricted to the
+    constraints that the registered values do not satisfy yet, and to the
+    candidates of the non-filled cells.
+    The nodes of the matrix are numbered: node 0 is the root, nodes 1 up to
+    the number of columns are the column headers, and the remaining nodes
+    are the 1s of the matrix. For each node, left, right, up and down hold
+    its neighbours, and column holds its column header. For each column
+    header, size holds the number of 1s left in that column. For each node
+    of the matrix, choice holds the position and the value of its row.
+  """
+    __slots__ = ('left', 'right', 'up', 'down', 'column', 'size', 'choice')
+
+    def __init__(self, state):
+        topo = state.topology
+        positions = topo.positions
+        values_per_unit = len(state)+1
+        cell_columns = {}
+        unit_columns = {}
+        nb_columns = 0
+        for cell in xrange(topo.nb_cells):
+            # LOOP INVARIANT
+            #   A column has been numbered for all the non-filled cells
+            #   handled so far.
+            if state.values[cell] == None:
+                nb_columns += 1
+                cell_columns[cell] = nb_columns
+        for unit in xrange(len(topo.unit_cells)):
+            # LOOP INVARIANT
+            #   A column has been numbered for all the values missing
+            #   from the units handled so far.
+            for value in mask_values(state.all_values & ~state.unit_masks[unit]):
+                # LOOP INVARIANT
+                #   A column has been numbered for all the values missing
+                #   from the current unit handled so far.
+                nb_columns += 1
+                unit_columns[unit*values_per_unit + value] = nb_columns
+        self.left = range(-1, nb_columns)
+        self.right = range(1, nb_columns+2)
+        self.left[0] = nb_columns
+        self.right[nb_columns] = 0
+        self.up = range(nb_columns+1)
+        self.down = range(nb_columns+1)
+        self.column = range(nb_columns+1)
+        self.size = [0]*(nb_columns+1)
+        self.choice = [None]*(nb_columns+1)
+        for cell in xrange(topo.nb_cells):
+            # LOOP INVARIANT
+            #   A row has been added for every candidate of all the
+            #   non-filled cells handled so far.
+            pos = positions[cell]
+            for value in mask_values(state.candidate_mask_at(pos)):
+                # LOOP INVARIANT
+                #   A row has been added for every candidate of the
+                #   current cell handled so far.
+                columns = [cell_columns[cell]]
+                for unit in topo.cell_units(cell):
+                    # LOOP INVARIANT
+                    #   The columns of the current value in all the units
+                    #   of the current cell handled so far have been added.
+                    columns.append(unit_columns[unit*values_per_unit + value])
+                self.add_row(columns, (pos, value))
+
+    def add_row(self, columns, choice):
+        """
+        Add a row with a 1 in each of the given columns to this matrix.
+        The row stands for the given choice of a position and a value.
+      """
+        first = len(self.column)
+        for i in range(len(columns)):
+            # LOOP INVARIANT
+            #   A node has been appended at the bottom of all the given
+            #   columns handled so far, and linked to the nodes of the
+            #   row handled so far.
+            node = first + i
+            header = columns[i]
+            self.column.append(header)
+            self.choice.append(choice)
+            self.up.append(self.up[header])
+            self.down.append(header)
+            self.down[self.up[header]] = node
+            self.up[header] = node
+            self.size[header] += 1
+            self.left.append(node-1)
+            self.right.append(node+1)
+        self.left[first] = first + len(columns)-1
+        self.right[first + len(columns)-1] = first
+
+    def cover(self, header):
+        """
+        Remove the given column from the header list, and all the rows
+        with a 1 in that column from the other columns.
+      """
+        left, right, up, down = self.left, self.right, self.up, self.down
+        right[left[header]] = right[header]
+        left[right[header]] = left[header]
+        i = down[header]
+        while i != header:
+            # LOOP INVARIANT
+            #   All the rows of the column handled so far have been
+            #   removed from the other columns.
+            j = right[i]
+            while j != i:
+                # LOOP INVARIANT
+                #   All the nodes of the current row handled so far have
+                #   been removed from their columns.
+                down[up[j]] = down[j]
+                up[down[j]] = up[j]
+                self.size[self.column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def uncover(self, header):
+        """ Undo the covering of the given column. """
+        left, right, up, down = self.left, self.right, self.up, self.down
+        i = up[header]
+        while i != header:
+            # LOOP INVARIANT
+            #   All the rows of the column handled so far, from the
+            #   bottom up, have been restored in the other columns.
+            j = left[i]
+            while j != i:
+                # LOOP INVARIANT
+                #   All the nodes of the current row handled so far, from
+                #   right to left, have been restored in their columns.
+                self.size[self.column[j]] += 1
+                down[up[j]] = j
+                up[down[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[header]] = header
+        left[right[header]] = header
+
+    def smallest_column(self):
+        """ Return the remaining column with the least number of 1s. """
+        header = self.right[0]
+        smallest = header
+        while header != 0 and self.size[smallest] > 1:
+            # LOOP INVARIANT
+            #   smallest is the column with the least number of 1s among
+            #   the columns handled so far.
+            if self.size[header] < self.size[smallest]:
+                smallest = header
+            header = self.right[header]
+        return smallest
+
+    def solutions(self):
+        """
+        Generate all the solutions of this matrix, using Algorithm X with
+        an explicit stack of chosen rows. Each solution is a list of the
+        choices of its rows.
+      """
+        right, left, down, column = self.right, self.left, self.down, self.column
+        if right[0] == 0:
+            yield []
+            return
+        chosen = []
+        header = self.smallest_column()
+        self.cover(header)
+        node = down[header]
+        while True:
+            # LOOP INVARIANT
+            #   The columns of all the chosen rows are covered, and node
+            #   is the next row to try in the column of the last level.
+            if node == header:
+                self.uncover(header)
+                if len(chosen) == 0:
+                    return
+                node = chosen.pop()
+                header = column[node]
+                j = left[node]
+                while j != node:
+                    # LOOP INVARIANT
+                    #   The columns of the nodes handled so far, from right
+                    #   to left, have been uncovered.
+                    self.uncover(column[j])
+                    j = left[j]
+                node = down[node]
+                continue
+            chosen.append(node)
+            j = right[node]
+            while j != node:
+                # LOOP INVARIANT
+                #   The columns of the nodes of the chosen row handled so
+                #   far have been covered.
+                self.cover(column[j])
+                j = right[j]
+            if right[0] == 0:
+                solution = []
+                for i in range(len(chosen)):
+                    # LOOP INVARIANT
+                    #   The choices of all the chosen rows handled so far
+                    #   have been added to the solution.
+                    solution.append(self.choice[chosen[i]])
+                yield solution
+                # Continue with the next row at the last level.
+                node = chosen.pop()
+                j = left[node]
+                while j != node:
+                    # LOOP INVARIANT
+                    #   The columns of the nodes handled so far, from right
+                    #   to left, have been uncovered.
+                    self.uncover(column[j])
+                    j = left[j]
+                node = down[node]
+                continue
+            header = self.smallest_column()
+            self.cover(header)
+            node = down[header]
+
+    def count(self, limit=None):
+        """
+        Return the number of solutions of this matrix, counting at most
+        limit solutions if limit is not None.
+      """
+        number_of_solutions = 0
+        for solution in self.solutions():
+            # LOOP INVARIANT
+            #   All the solutions generated so far have been counted.
+            number_of_solutions += 1
+            if number_of_solutions == limit:
+                break
+        return number_of_solutions
+roster = make_roster(2,\
+            [   4,None,   3,None,\
+             None,None,None,None,\
+             None,None,None,None,\
+             None,   2,None,None])
+assert ExactCover(RosterState(roster)).count() == 3
+assert ExactCover(RosterState(make_roster(2))).count() == 288
+assert ExactCover(RosterState(make_roster(2, [1, 2, 3, 4] + [None]*12))).count(limit=5) == 5
+roster = make_roster(2,
+            [1,   None,None,None,\
+             None,2,   None,None,\
+             None,None,3,   None,\
+             None,None,None,4])
+assert fill_intelligently(roster, backend='dlx')
+assert is_completely_filled(roster) and is_correct_roster(roster)
+roster = make_roster(2,\
+            [1,   None,None,None,\
+             None,2,   None,None,\
+             2,   None,3,   None,\
+             None,None,1,   4])
+assert not fill_intelligently(roster, backend='dlx')
+roster = make_roster(2,\
+            [   4,None,   3,None,\
+             None,None,None,None,\
+             None,None,None,None,\
+             None,   2,None,None])
+assert nb_solutions(roster, backend='dlx') == 3
+assert count_solutions(roster, limit=2, backend='dlx') == 2
+
+
+
+
+##############################################
+#
+# ROSTERS: CLAUSE LEARNING
+#
+# Filling a roster is also a satisfiability problem. Each way of
+# registering a value V at a position P is a boolean variable, and each
+# constraint of Sudoku (see EXACT COVER) requires exactly one of its
+# variables to be true. A literal is a variable or its negation: literal
+# 2*X stands for variable X being true and literal 2*X+1 for X being
+# false. A clause is a list of literals of which at least one must be
+# true.
+# The search is conflict-driven clause learning:
+# - Literals are assigned by decisions and by propagation. At least one
+#   variable of each constraint being true is a clause, propagated with
+#   two watched literals per clause. At most one variable of each
+#   constraint being true is propagated directly: once a variable is
+#   true, all the other variables of its constraints are false.
+# - A conflict is analyzed back to the first literal of the last decision
+#   level that implies it, which yields a learned clause that is added to
+#   the problem. The search then jumps back to the highest level at which
+#   the learned clause implies a literal, and may skip several levels.
+# - Each decision takes an unassigned variable with the highest activity,
+#   where the activity of a variable grows each time it is involved in a
+#   conflict, with increasing weight for recent conflicts.
+# - The search restarts from scratch after a number of conflicts that
+#   follows the Luby sequence, keeping the learned clauses.
+#
+################################################
+
+
+RESTART_INTERVAL = 100
+ACTIVITY_DECAY = 0.95
+
+def luby(i):
     """
-    Return the position and the value of the first hidden single in
-    the given roster starting from the given position.
-    A hidden single is a non-filled cell which is forced to
-    take a specific value, because that value is not yet present in
-    the associated group, row, or column, and due to the placement of
-    the other values, there are no alternative positions left for
-    that value to take.
-    None is returned if no hidden single exists starting from
-    the given position.
+    Return the i-th element of the Luby sequence 1, 1, 2, 1, 1, 2, 4, 1,
+    1, 2, 1, 1, 2, 4, 8, ..., counting from 1.
   """
-    dim = dimension(roster)
-    row_nr = row(start_pos)
-    col_nr = col(start_pos)
-    group_nr = group(dim, start_pos)
-    for i in xrange(row_nr, dim**2):
-        # LOOP INVARIANT
-        #   All the candidates on the row positions of the
-        #   current row handled so far, have been checked on
-        #   having a hidden single. 
-        row_can = row_candidates(roster, i)
-        hidden_single = search_hidden_single(dim, row_can)
-        if hidden_single != None:
-            return hidden_single
-    for i in xrange(col_nr, dim**2):
+    size = 1
+    while size < i+1:
         # LOOP INVARIANT
-        #   All the candidates on the column positions of the
-        #   current column handled so far, have been checked on
-        #   having a hidden single. 
-        col_can = col_candidates(roster, i)
-        hidden_single = search_hidden_single(dim, col_can)
-        if hidden_single != None:
-            return hidden_single
-    for i in range(group_nr, dim**2):
+        #   size is 2**k - 1 for some k, and smaller than i+1 except in
+        #   the end.
+        size = 2*size + 1
+    while size != i:
         # LOOP INVARIANT
-        #   All the candidates on the group positions of the
-        #   current group handled so far, have been checked on
-        #   having a hidden single. 
-        group_can = group_candidates(roster, i)
-        hidden_single = search_hidden_single(dim, group_can)
-        if hidden_single != None:
-            return hidden_single
-    return None
-roster = make_roster(2,\
-            [   4,None,None,None,\
-                2,   1,None,   3,\
-                1,None,None,None,\
-                3,None,   2,None])
-assert get_first_naked_single(roster) == ((0, 1), 3)
-roster = make_roster(2,\
-            [   4,   3,   1,   2,\
-                2,   1,   4,   3,\
-                1,None,None,None,\
-                3,None,   2,None])
-assert get_first_hidden_single(roster,(0,0)) == ((2, 1), 2)
-assert get_first_naked_single(roster) == ((2, 2), 3)
+        #   The i-th element of the sequence is the i-th element of its
+        #   first size elements, which end with (size+1)/2.
+        size = (size-1) / 2
+        if i > size:
+            i -= size
+    return (size+1) / 2
+assert map(luby, range(1, 16)) == [1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8]
 
 
 
 
-def min_candidate(roster):
+class ClauseSolver(object):
     """
-    Return 
+    The satisfiability problem of a correct roster state, restricted to
+    the constraints that the registered values do not satisfy yet, and to
+    the candidates of the non-filled cells.
+    For each variable, choice holds its position and value, and excluded
+    the positive literals of the other variables of its constraints. For
+    each literal, truth holds 1 if it is true, -1 if it is false and 0 if
+    it is unassigned, and watches holds the clauses watching it. For each
+    assigned variable, level holds its decision level, and reason what
+    implied it: None for a decision, the clause that implied it with the
+    implied literal first, or the false literal of the variable whose
+    truth excluded it.
+    The trail holds the assigned literals in the order of their
+    assignment, and decisions the length of the trail at each decision.
+    The heap holds the variables by decreasing activity, and in_heap tells
+    for each variable whether it is in the heap with its current activity.
   """
-    dim = dimension(roster)
-    min_candidate = len(roster)+1
-    pos = (0,0);
-    while pos != None:
-        # LOOP INVARIANT
-        #   The number of candidates on the positions handled
-        #   so far has been checked on being smaller than the
-        #   smallest number of candidates found on a position
-        #   so far.
-        candidates = candidates_at(roster, pos)
-        if len(candidates) < min_candidate and value_at(roster, pos) == None:
-            min_candidate = len(candidates)
-            min_pos = pos
-        pos = next_position(dim, pos)
-    return min_pos
-    
-
+    __slots__ = ('choice', 'excluded', 'truth', 'watches', 'level', 'reason',
+                 'trail', 'decisions', 'head', 'activity', 'increment',
+                 'heap', 'in_heap', 'seen', 'is_unsatisfiable')
 
-# THIS SHOULD BE A RECURSIVE FUNCTION
-def fill_intelligently(roster, is_visualizing = False, sudoku_gui = None):
-    """
-    Fill the given roster completely by exploiting naked singles and hidden
-    singles as much as possible. At times that there are no hidden singles
-    nor naked singles in the roster, filling proceeds with a cell with the
-    least number of candidates.
-    The function returns True if its was able to work out a complete fill.
-    In that case, the state of the roster is changed to reflect the fill.
-    If a complete fill is impossible, the function returns False and leaves the
-    given roster untouched.
-  """
-    # when is_visualizing is True, the provided sudoku_gui will receive
-    # the subsequent (recursive) roster contents which will be used
-    # to visualize the algorithm step-by-step once the algorithm has finished
-    if is_visualizing:
-        sudoku_gui.update_roster(roster_contents(roster))
-    pass
+    def __init__(self, state):
+        topo = state.topology
+        positions = topo.positions
+        values_per_unit = len(state)+1
+        self.choice = []
+        constraint_vars = []
+        unit_vars = {}
+        for cell in xrange(topo.nb_cells):
+            # LOOP INVARIANT
+            #   A variable has been numbered for every candidate of all
+            #   the non-filled cells handled so far, and a constraint
+            #   added for each of these cells.
+            if state.values[cell] == None:
+                pos = positions[cell]
+                cell_vars = []
+                for value in mask_values(state.candidate_mask_at(pos)):
+                    # LOOP INVARIANT
+                    #   A variable has been numbered for every candidate
+                    #   of the current cell handled so far.
+                    var = len(self.choice)
+                    self.choice.append((pos, value))
+                    cell_vars.append(var)
+                    for unit in topo.cell_units(cell):
+                        # LOOP INVARIANT
+                        #   The variable has been added to the constraints
+                        #   of its value in all the units of its cell
+                        #   handled so far.
+                        unit_vars.setdefault(unit*values_per_unit + value, []).append(var)
+                constraint_vars.append(cell_vars)
+        for unit in xrange(len(topo.unit_cells)):
+            # LOOP INVARIANT
+            #   A constraint has been added for all the values missing
+            #   from the units handled so far.
+            for value in mask_values(state.all_values & ~state.unit_masks[unit]):
+                # LOOP INVARIANT
+                #   A constraint has been added for all the values missing
+                #   from the current unit handled so far.
+                constraint_vars.append(unit_vars.get(unit*values_per_unit + value, []))
+        nb_vars = len(self.choice)
+        self.excluded = []
+        self.watches = []
+        for var in xrange(nb_vars):
+            # LOOP INVARIANT
+            #   The lists of all the variables handled so far, and of their
+            #   literals, have been made.
+            self.excluded.append(set())
+            self.watches.append([])
+            self.watches.append([])
+        self.truth = [0]*(2*nb_vars)
+        self.level = [0]*nb_vars
+        self.reason = [None]*nb_vars
+        self.trail = []
+        self.decisions = []
+        self.head = 0
+        self.activity = [0.0]*nb_vars
+        self.increment = 1.0
+        self.heap = []
+        for var in xrange(nb_vars):
+            # LOOP INVARIANT
+            #   All the variables handled so far are in the heap.
+            self.heap.append((0.0, var))
+        self.in_heap = [True]*nb_vars
+        self.seen = [False]*nb_vars
+        self.is_unsatisfiable = False
+        for constraint in constraint_vars:
+            # LOOP INVARIANT
+            #   The variables of all the constraints handled so far exclude
+            #   each other, and the clauses of these constraints have been
+            #   added.
+            clause = []
+            for var in constraint:
+                # LOOP INVARIANT
+                #   The literals of all the variables of the constraint
+                #   handled so far are in the clause.
+                self.excluded[var].update(constraint)
+                clause.append(2*var)
+            self.add_clause(clause)
+        for var in xrange(nb_vars):
+            # LOOP INVARIANT
+            #   The variables excluded by all the variables handled so far
+            #   have been turned into lists of literals.
+            self.excluded[var].discard(var)
+            literals = []
+            for other in sorted(self.excluded[var]):
+                # LOOP INVARIANT
+                #   The literals of all the excluded variables handled so
+                #   far are in literals.
+                literals.append(2*other)
+            self.excluded[var] = literals
 
-    """
-    The function min_candidate(roster) returns the position at which the
-    number of candidates is the least. This is the position that needs to be
-    filled in first. min_can gives the list of the candidates at this position.
-    If this list is empty, the roster contains a wrong value. Therefor no
-    solution is found. If the length equals one, there's at least one naked
-    single in the roster. In that case, the naked single must be filled in.
-    If no naked single can be found (when the length of min_can is greater than
-    one), the roster needs to be checked for hidden singles. If a hidden single
-    can be found, the hidden single must be filled in. If not, the shortest list
-    of candidates is used to fill the roster. 
-  """
-    if is_completely_filled(roster) and is_correct_roster(roster):
-        return True
-    solution_found = False
-    pos_to_fill = min_candidate(roster)
-    min_can = list(candidates_at(roster, pos_to_fill))
-    if len(min_can) == 0:
-        return False
-    elif len(min_can) == 1:
-        naked_single = get_first_naked_single(roster)
-        pos_to_fill = naked_single[0]
-        set_value_at(roster, naked_single[1], pos_to_fill)
-        solution_found = fill_intelligently(roster, is_visualizing, sudoku_gui)
-    else:
-        hidden_single = get_first_hidden_single(roster)
-        if hidden_single != None:
-            pos_to_fill = hidden_single[0]
-            set_value_at(roster, hidden_single[1], pos_to_fill)
-            solution_found = fill_intelligently(roster, is_visualizing, sudoku_gui)
+    def add_clause(self, clause):
+        """
+        Add the given clause at decision level 0, dropping its literals
+        that are false at that level.
+      """
+        literals = []
+        for lit in clause:
+            # LOOP INVARIANT
+            #   All the literals handled so far that are not false are in
+            #   literals.
+            if self.truth[lit] == 1:
+                return
+            if self.truth[lit] == 0:
+                literals.append(lit)
+        if len(literals) == 0:
+            self.is_unsatisfiable = True
+        elif len(literals) == 1:
+            self.assign(literals[0], None)
         else:
-            for i in range(len(min_can)):
-                # LOOP INVARIANT
-                #   The candidates at the current position handled
-                #   so far have been checked.
-                if not solution_found:
-                    set_value_at(roster, min_can[i], pos_to_fill)
-                    solution_found = fill_intelligently(roster, is_visualizing, sudoku_gui)
-    if not solution_found:
-        set_value_at(roster, None, pos_to_fill)
-    return solution_found
+            self.watches[literals[0]].append(literals)
+            self.watches[literals[1]].append(literals)
+
+    def assign(self, lit, reason):
+        """ Make the given literal true for the given reason. """
+        var = lit >> 1
+        self.truth[lit] = 1
+        self.truth[lit ^ 1] = -1
+        self.level[var] = len(self.decisions)
+        self.reason[var] = reason
+        self.trail.append(lit)
+
+    def propagate(self):
+        """
+        Assign all the literals implied by the literals on the trail that
+        have not been propagated yet. Return a clause of which all the
+        literals are false if there is a conflict, and None otherwise.
+      """
+        truth, trail, watches = self.truth, self.trail, self.watches
+        level, reason = self.level, self.reason
+        current = len(self.decisions)
+        while self.head < len(trail):
+            # LOOP INVARIANT
+            #   All the literals on the trail before head have been
+            #   propagated without conflict.
+            lit = trail[self.head]
+            self.head += 1
+            false_lit = lit ^ 1
+            if false_lit & 1:
+                for other_lit in self.excluded[lit >> 1]:
+                    # LOOP INVARIANT
+                    #   The variables of all the literals handled so far
+                    #   are false.
+                    if truth[other_lit] == 1:
+                        return [false_lit, other_lit ^ 1]
+                    if truth[other_lit] == 0:
+                        # The negation of other_lit is assigned inline.
+                        truth[other_lit] = -1
+                        truth[other_lit ^ 1] = 1
+                        level[other_lit >> 1] = current
+                        reason[other_lit >> 1] = false_lit
+                        trail.append(other_lit ^ 1)
+            watching = watches[false_lit]
+            kept = watches[false_lit] = []
+            i = 0
+            while i < len(watching):
+                # LOOP INVARIANT
+                #   All the clauses watching the false literal handled so
+                #   far watch another literal instead, or are kept and have
+                #   their other watched literal true or implied.
+                clause = watching[i]
+                i += 1
+                if clause[0] == false_lit:
+                    clause[0] = clause[1]
+                    clause[1] = false_lit
+                first = clause[0]
+                if truth[first] == 1:
+                    kept.append(clause)
+                    continue
+                size = len(clause)
+                k = 2
+                while k < size and truth[clause[k]] == -1:
+                    # LOOP INVARIANT
+                    #   All the literals of the clause from 2 up to k are
+                    #   false.
+                    k += 1
+                if k < size:
+                    clause[1] = clause[k]
+                    clause[k] = false_lit
+                    watches[clause[1]].append(clause)
+                    continue
+                kept.append(clause)
+                if truth[first] == -1:
+                    kept.extend(watching[i:])
+                    return clause
+                self.assign(first, clause)
+        return None
+
+    def bump(self, var):
+        """ Raise the activity of the given variable. """
+        self.activity[var] += self.increment
+        self.in_heap[var] = False
+        if self.activity[var] > 1e100:
+            import heapq
+            self.heap = []
+            for other in xrange(len(self.activity)):
+                # LOOP INVARIANT
+                #   The activities of all the variables handled so far
+                #   have been scaled down, and these variables are in the
+                #   heap.
+                self.activity[other] *= 1e-100
+                self.heap.append((-self.activity[other], other))
+                self.in_heap[other] = True
+            self.increment *= 1e-100
+            heapq.heapify(self.heap)
+
+    def analyze(self, conflict):
+        """
+        Return the clause learned from the given conflict at the current
+        decision level, with the literal it implies first and a literal of
+        the highest other level second, if any.
+      """
+        truth, level, reason, trail, seen = self.truth, self.level, self.reason, self.trail, self.seen
+        current = len(self.decisions)
+        learned = [None]
+        pending = 0
+        index = len(trail)-1
+        clause = conflict
+        lit = None
+        while True:
+            # LOOP INVARIANT
+            #   learned holds the false literals of the lower levels seen
+            #   so far, and pending the number of literals of the current
+            #   level seen but not resolved yet, all later than index on
+            #   the trail.
+            if isinstance(clause, int):
+                clause = [lit, clause]
+            start = 0
+            if lit != None:
+                start = 1
+            for k in xrange(start, len(clause)):
+                # LOOP INVARIANT
+                #   All the literals of the clause handled so far have been
+                #   seen, except those of level 0.
+                var = clause[k] >> 1
+                if not seen[var] and level[var] > 0:
+                    seen[var] = True
+                    self.bump(var)
+                    if level[var] == current:
+                        pending += 1
+                    else:
+                        learned.append(clause[k])
+            while not seen[trail[index] >> 1]:
+                # LOOP INVARIANT
+                #   None of the literals on the trail after index are seen.
+                index -= 1
+            lit = trail[index]
+            index -= 1
+            seen[lit >> 1] = False
+            pending -= 1
+            if pending == 0:
+                break
+            clause = reason[lit >> 1]
+        learned[0] = lit ^ 1
+        # Literals implied by the other literals of the clause are dropped.
+        kept = [learned[0]]
+        for k in xrange(1, len(learned)):
+            # LOOP INVARIANT
+            #   All the literals handled so far that are not implied by
+            #   other literals of the learned clause are kept.
+            implying = reason[learned[k] >> 1]
+            if isinstance(implying, int):
+                implying = [learned[k] ^ 1, implying]
+            is_redundant = implying != None
+            if is_redundant:
+                for j in xrange(1, len(implying)):
+                    # LOOP INVARIANT
+                    #   All the other literals of the reason handled so far
+                    #   are in the learned clause or of level 0.
+                    var = implying[j] >> 1
+                    if not seen[var] and level[var] > 0:
+                        is_redundant = False
+                        break
+            if not is_redundant:
+                kept.append(learned[k])
+        for k in xrange(1, len(learned)):
+            # LOOP INVARIANT
+            #   The variables of all the literals handled so far are no
+            #   longer seen.
+            seen[learned[k] >> 1] = False
+        highest = 1
+        for k in xrange(2, len(kept)):
+            # LOOP INVARIANT
+            #   The literal at highest has the highest level among the
+            #   literals handled so far.
+            if level[kept[k] >> 1] > level[kept[highest] >> 1]:
+                highest = k
+        if len(kept) > 1:
+            kept[1], kept[highest] = kept[highest], kept[1]
+        return kept
+
+    def backtrack(self, target):
+        """ Unassign all the literals of the levels above the given level. """
+        import heapq
+        if len(self.decisions) > target:
+            start = self.decisions[target]
+            for k in xrange(start, len(self.trail)):
+                # LOOP INVARIANT
+                #   The variables of all the literals handled so far have
+                #   been unassigned and are in the heap.
+                lit = self.trail[k]
+                var = lit >> 1
+                self.truth[lit] = 0
+                self.truth[lit ^ 1] = 0
+                self.reason[var] = None
+                if not self.in_heap[var]:
+                    heapq.heappush(self.heap, (-self.activity[var], var))
+                    self.in_heap[var] = True
+            del self.trail[start:]
+            del self.decisions[target:]
+            self.head = start
+
+    def decide(self):
+        """
+        Return an unassigned variable with the highest activity, or None if
+        all the variables are assigned.
+      """
+        import heapq
+        heap, truth, activity, in_heap = self.heap, self.truth, self.activity, self.in_heap
+        if len(heap) > 4*len(activity):
+            # Drop the outdated entries.
+            heap = self.heap = []
+            for var in xrange(len(activity)):
+                # LOOP INVARIANT
+                #   All the variables handled so far are in the heap.
+                heap.append((-activity[var], var))
+                in_heap[var] = True
+            heapq.heapify(heap)
+        while len(heap) > 0:
+            # LOOP INVARIANT
+            #   Each unassigned variable is in the heap with its activity.
+            score, var = heapq.heappop(heap)
+            if -score == activity[var]:
+                in_heap[var] = False
+                if truth[2*var] == 0:
+                    return var
+        return None
+
+    def solve(self):
+        """
+        Search for an assignment of all the variables that satisfies all
+        the clauses. Return True if one has been found, and False if there
+        is none.
+      """
+        if self.is_unsatisfiable:
+            return False
+        restarts = 1
+        conflicts = 0
+        while True:
+            # LOOP INVARIANT
+            #   All the assignments that satisfy all the clauses extend
+            #   the assignments of level 0, and satisfy the learned
+            #   clauses.
+            conflict = self.propagate()
+            if conflict != None:
+                if len(self.decisions) == 0:
+                    self.is_unsatisfiable = True
+                    return False
+                learned = self.analyze(conflict)
+                if len(learned) == 1:
+                    self.backtrack(0)
+                    self.assign(learned[0], None)
+                else:
+                    self.backtrack(self.level[learned[1] >> 1])
+                    self.watches[learned[0]].append(learned)
+                    self.watches[learned[1]].append(learned)
+                    self.assign(learned[0], learned)
+                self.increment /= ACTIVITY_DECAY
+                conflicts += 1
+                if conflicts == RESTART_INTERVAL*luby(restarts):
+                    self.backtrack(0)
+                    restarts += 1
+                    conflicts = 0
+            else:
+                var = self.decide()
+                if var == None:
+                    return True
+                self.decisions.append(len(self.trail))
+                self.assign(2*var, None)
+
+    def solutions(self):
+        """
+        Generate all the solutions of this problem. Each solution is a list
+        of the choices of its true variables. After each solution, a clause
+        excluding it is added.
+      """
+        while self.solve():
+            # LOOP INVARIANT
+            #   All the solutions generated so far are excluded by the
+            #   clauses.
+            solution = []
+            excluded = []
+            for var in xrange(len(self.choice)):
+                # LOOP INVARIANT
+                #   The choices of all the true variables handled so far
+                #   have been added to the solution.
+                if self.truth[2*var] == 1:
+                    solution.append(self.choice[var])
+                    excluded.append(2*var + 1)
+            yield solution
+            self.backtrack(0)
+            self.add_clause(excluded)
+
+    def count(self, limit=None):
+        """
+        Return the number of solutions of this problem, counting at most
+        limit solutions if limit is not None.
+      """
+        number_of_solutions = 0
+        for solution in self.solutions():
+            # LOOP INVARIANT
+            #   All the solutions generated so far have been counted.
+            number_of_solutions += 1
+            if number_of_solutions == limit:
+                break
+        return number_of_solutions
+roster = make_roster(2,\
+            [   4,None,   3,None,\
+             None,None,None,None,\
+             None,None,None,None,\
+             None,   2,None,None])
+assert ClauseSolver(RosterState(roster)).count() == 3
+assert ClauseSolver(RosterState(make_roster(2))).count() == 288
+assert ClauseSolver(RosterState(make_roster(2, [1, 2, 3, 4] + [None]*12))).count(limit=5) == 5
 roster = make_roster(2,
             [1,   None,None,None,\
              None,2,   None,None,\
              None,None,3,   None,\
              None,None,None,4])
-assert fill_intelligently(roster, False, None)
+assert fill_intelligently(roster, backend='cdcl')
+assert is_completely_filled(roster) and is_correct_roster(roster)
 roster = make_roster(2,\
             [1,   None,None,None,\
              None,2,   None,None,\
              2,   None,3,   None,\
              None,None,1,   4])
-assert not fill_intelligently(roster, False, None)
+assert not fill_intelligently(roster, backend='cdcl')
+assert count_solutions(roster_from_string(
+    '000000010400000000020000000000050407008000300001090000300400200050100000000806000'),
+    limit=2, backend='cdcl') == 1
+
+
+
+
+##############################################
+#
+# ROSTERS: SOLUTION CACHE
+#
+# Two rosters are equivalent if one can be turned into the other by a
+# symmetry of Sudoku: relabeling the values, reordering the rows within
+# their bands, the columns within their stacks, the bands and the stacks,
+# and transposing. Equivalent rosters have equivalent solutions.
+# canonical_form turns a roster into a canonical roster that is equal
+# for equivalent rosters, together with the symmetry that does so. A
+# SolutionCache keyed by canonical rosters then serves the solutions of
+# all the rosters equivalent to a roster solved before.
+#
+# The canonical roster is the smallest one, comparing the values row by
+# row with non-filled cells as 0, among the rosters reached by ordering
+# the lines by invariants of the roster and relabeling the values in the
+# order in which they first occur. Lines with equal invariants are tried
+# in every order, up to MAX_CANONICAL_ORDERS orders; beyond that a single
+# order is used, such that some equivalent rosters get different
+# canonical rosters and merely miss the cache.
+#
+################################################
+
+
+MAX_CANONICAL_ORDERS = 1000
+
+class Symmetry(object):
+    """
+    A symmetry of rosters of dimension dim. Applying it to a roster gives
+    the roster of which the cell at position (R, C) holds the value at
+    position (rows[R], cols[C]) of the given roster, or of its transpose if
+    transposed is True, relabeled by labels: value V becomes labels[V].
+  """
+    __slots__ = ('dim', 'transposed', 'rows', 'cols', 'labels')
+
+    def __init__(self, dim, transposed, rows, cols, labels):
+        self.dim = dim
+        self.transposed = transposed
+        self.rows = rows
+        self.cols = cols
+        self.labels = labels
+
+    def source_position(self, position):
+        """
+        Return the position of the given roster from which the value at
+        the given position of the transformed roster comes.
+      """
+        if self.transposed:
+            return (self.cols[position[1]], self.rows[position[0]])
+        return (self.rows[position[0]], self.cols[position[1]])
+
+    def apply(self, roster):
+        """ Return a new roster obtained by applying this symmetry to the given one. """
+        result = make_roster(self.dim)
+        for pos in topology(self.dim).positions:
+            # LOOP INVARIANT
+            #   The values at all the positions handled so far have been
+            #   transformed into the new roster.
+            value = value_at(roster, self.source_position(pos))
+            if value != None:
+                set_value_at(result, self.labels[value], pos)
+        return result
+
+    def unapply(self, transformed, roster):
+        """
+        Register in the given roster the values of the given roster
+        obtained by applying this symmetry, transformed back.
+      """
+        values = [0]*len(self.labels)
+        for value in xrange(1, len(self.labels)):
+            # LOOP INVARIANT
+            #   The original values of all the labels handled so far
+            #   have been registered.
+            values[self.labels[value]] = value
+        for pos in topology(self.dim).positions:
+            # LOOP INVARIANT
+            #   The values at all the positions handled so far have been
+            #   transformed back into the given roster.
+            value = value_at(transformed, pos)
+            if value != None:
+                value = values[value]
+            set_value_at(roster, value, self.source_position(pos))
+
+
+
+
+def rank_keys(keys):
+    """
+    Return the list of the ranks of the given keys among the distinct
+    given keys, in ascending order.
+  """
+    ranks = {}
+    for key in sorted(set(keys)):
+        # LOOP INVARIANT
+        #   All the keys handled so far have been ranked.
+        ranks[key] = len(ranks)
+    result = []
+    for key in keys:
+        # LOOP INVARIANT
+        #   The ranks of all the keys handled so far have been collected.
+        result.append(ranks[key])
+    return result
+assert rank_keys(['b', 'a', 'b', 'c']) == [1, 0, 1, 2]
+
+
+
+
+def line_ranks(grid, size, rounds=3):
+    """
+    Return the ranks of the rows and the ranks of the columns of the given
+    flat list of the values of a roster, holding 0 for non-filled cells.
+    The ranks are invariant under the symmetries of Sudoku other than
+    transposition: each round refines the rank of each line with the
+    ranks of the crossing lines and of the values of its filled cells,
+    and the rank of each value with the ranks of the lines it is in.
+  """
+    row_ranks = [0]*size
+    col_ranks = [0]*size
+    value_ranks = [0]*(size+1)
+    for round_nr in xrange(rounds):
+        # LOOP INVARIANT
+        #   The ranks have been refined in all the rounds handled so far.
+        row_keys = []
+        col_keys = []
+        value_keys = []
+        for i in xrange(size+1):
+            # LOOP INVARIANT
+            #   An empty key has been created for all the lines and
+            #   values handled so far.
+            row_keys.append([])
+            col_keys.append([])
+            value_keys.append([])
+        for cell in xrange(size*size):
+            # LOOP INVARIANT
+            #   The filled cells handled so far have been added to the
+            #   keys of their row, their column and their value.
+            value = grid[cell]
+            if value != 0:
+                row_nr, col_nr = divmod(cell, size)
+                row_keys[row_nr].append((col_ranks[col_nr], value_ranks[value]))
+                col_keys[col_nr].append((row_ranks[row_nr], value_ranks[value]))
+                value_keys[value].append((row_ranks[row_nr], col_ranks[col_nr]))
+        row_ranks = rank_keys(refined_keys(row_ranks, row_keys))
+        col_ranks = rank_keys(refined_keys(col_ranks, col_keys))
+        value_ranks = rank_keys(refined_keys(value_ranks, value_keys))
+    return row_ranks, col_ranks
+
+
+
+
+def refined_keys(ranks, keys):
+    """
+    Return the list of pairs of each of the given ranks and the sorted
+    tuple of the corresponding list of keys.
+  """
+    refined = []
+    for i in xrange(len(ranks)):
+        # LOOP INVARIANT
+        #   The refined keys of all the ranks handled so far have been
+        #   collected.
+        refined.append((ranks[i], tuple(sorted(keys[i]))))
+    return refined
+
+
+
+
+def tie_orders(items, keys):
+    """
+    Return the list of all the orders of the given items that sort them
+    by the given keys, i.e. in which items with equal keys take every
+    order among themselves, or None if there are more than
+    MAX_CANONICAL_ORDERS of them.
+  """
+    from itertools import permutations
+    ordered = sorted(items, key=keys.__getitem__)
+    orders = [[]]
+    start = 0
+    while start < len(ordered):
+        # LOOP INVARIANT
+        #   orders holds all the orders of the items before start.
+        end = start + 1
+        while end < len(ordered) and keys[ordered[end]] == keys[ordered[start]]:
+            # LOOP INVARIANT
+            #   All the items from start up to end have equal keys.
+            end += 1
+        extended = []
+        for order in orders:
+            # LOOP INVARIANT
+            #   All the orders handled so far have been extended with
+            #   every order of the items from start up to end.
+            for tail in permutations(ordered[start:end]):
+                # LOOP INVARIANT
+                #   The current order has been extended with all the
+                #   orders of the tied items handled so far.
+                extended.append(order + list(tail))
+            if len(extended) > MAX_CANONICAL_ORDERS:
+                return None
+        orders = extended
+        start = end
+    return orders
+assert tie_orders([0, 1, 2], [5, 3, 5]) == [[1, 0, 2], [1, 2, 0]]
+
+
+
+
+def line_orders(dim, ranks):
+    """
+    Return the list of the orders of the rows (or the columns) with the
+    given ranks that sort the bands by the sorted ranks of their lines
+    and the lines within each band by rank, trying lines and bands with
+    equal ranks in every order. If there are more than
+    MAX_CANONICAL_ORDERS such orders, only one of them is returned.
+  """
+    band_keys = []
+    line_orders_in_band = []
+    for band in xrange(dim):
+        # LOOP INVARIANT
+        #   The keys and the orders of the lines of all the bands handled
+        #   so far have been collected.
+        lines = range(band*dim, (band+1)*dim)
+        band_ranks = []
+        for line in lines:
+            # LOOP INVARIANT
+            #   The ranks of all the lines handled so far have been
+            #   collected.
+            band_ranks.append(ranks[line])
+        band_keys.append(tuple(sorted(band_ranks)))
+        line_orders_in_band.append(tie_orders(lines, ranks))
+    band_orders = tie_orders(range(dim), band_keys)
+    orders = None
+    if band_orders != None and None not in line_orders_in_band:
+        orders = []
+        for band_order in band_orders:
+            # LOOP INVARIANT
+            #   All the orders of the lines following the band orders
+            #   handled so far have been collected.
+            partial_orders = [[]]
+            for band in band_order:
+                # LOOP INVARIANT
+                #   partial_orders holds all the orders of the lines of
+                #   the bands of the band order handled so far.
+                extended = []
+                for order in partial_orders:
+                    # LOOP INVARIANT
+                    #   All the partial orders handled so far have been
+                    #   extended with every order of the current band.
+                    for band_lines in line_orders_in_band[band]:
+                        # LOOP INVARIANT
+                        #   The current partial order has been extended
+                        #   with all the line orders handled so far.
+                        extended.append(order + band_lines)
+                partial_orders = extended
+            orders.extend(partial_orders)
+            if len(orders) > MAX_CANONICAL_ORDERS:
+                orders = None
+                break
+    if orders == None:
+        orders = []
+        for band in sorted(range(dim), key=band_keys.__getitem__):
+            # LOOP INVARIANT
+            #   The lines of all the bands handled so far have been added
+            #   to the single order, sorted by rank.
+            orders.extend(sorted(range(band*dim, (band+1)*dim), key=ranks.__getitem__))
+        orders = [orders]
+    return orders
+assert line_orders(2, [1, 0, 0, 0]) == [[2, 3, 1, 0], [3, 2, 1, 0]]
+
+
+
+
+def relabeled_grid(grid, size, rows, cols, best):
+    """
+    Return the list of the values of the given flat list of the values of
+    a roster, taken in the given orders of the rows and the columns, and
+    relabeled in the order in which they first occur, together with the
+    relabeling. None is returned instead as soon as that list is found to
+    be greater than the given best list, if any.
+  """
+    labels = [0]*(size+1)
+    next_label = 1
+    result = []
+    is_tied = best != None
+    for row_nr in rows:
+        # LOOP INVARIANT
+        #   The values of all the rows handled so far have been relabeled
+        #   and appended to the result, which is not greater than best.
+        base = row_nr*size
+        for col_nr in cols:
+            # LOOP INVARIANT
+            #   The values of the current row at all the columns handled
+            #   so far have been relabeled and appended to the result.
+            value = grid[base + col_nr]
+            if value != 0 and labels[value] == 0:
+                labels[value] = next_label
+                next_label += 1
+            label = labels[value]
+            if is_tied and label != best[len(result)]:
+                if label > best[len(result)]:
+                    return None
+                is_tied = False
+            result.append(label)
+    return result, labels
+
+
+
+
+def canonical_form(roster):
+    """
+    Return the canonical roster of the given roster together with the
+    symmetry that turns the given roster into it (see SOLUTION CACHE).
+    Values missing from the given roster are relabeled in ascending
+    order after the values that occur in it.
+  """
+    dim = dimension(roster)
+    size = dim**2
+    best = None
+    for transposed in (False, True):
+        # LOOP INVARIANT
+        #   best holds the smallest relabeled grid found for the
+        #   orientations handled so far, with its symmetry.
+        grid = []
+        for pos in topology(dim).positions:
+            # LOOP INVARIANT
+            #   The values at all the positions handled so far have been
+            #   appended to the grid of the current orientation.
+            if transposed:
+                pos = (pos[1], pos[0])
+            value = value_at(roster, pos)
+            if value == None:
+                value = 0
+            grid.append(value)
+        row_ranks, col_ranks = line_ranks(grid, size)
+        col_orders = line_orders(dim, col_ranks)
+        for rows in line_orders(dim, row_ranks):
+            # LOOP INVARIANT
+            #   best holds the smallest relabeled grid found so far, with
+            #   its symmetry.
+            for cols in col_orders:
+                # LOOP INVARIANT
+                #   best holds the smallest relabeled grid found so far,
+                #   with its symmetry.
+                if best == None:
+                    relabeled = relabeled_grid(grid, size, rows, cols, None)
+                else:
+                    relabeled = relabeled_grid(grid, size, rows, cols, best[0])
+                if relabeled != None and (best == None or relabeled[0] < best[0]):
+                    best = (relabeled[0], Symmetry(dim, transposed, rows, cols,
+                                                   relabeled[1]))
+    values, symmetry = best
+    labels = symmetry.labels
+    next_label = max(labels) + 1
+    for value in xrange(1, size+1):
+        # LOOP INVARIANT
+        #   All the missing values handled so far have been relabeled.
+        if labels[value] == 0:
+            labels[value] = next_label
+            next_label += 1
+    canonical = []
+    for value in values:
+        # LOOP INVARIANT
+        #   All the values handled so far have been added to the
+        #   canonical roster, with None for non-filled cells.
+        if value == 0:
+            canonical.append(None)
+        else:
+            canonical.append(value)
+    return make_roster(dim, canonical), symmetry
+roster = roster_from_string('4.3.21.31...3.2.')
+canonical, symmetry = canonical_form(roster)
+assert symmetry.apply(roster) == canonical
+transformed = Symmetry(2, True, [1, 0, 3, 2], [2, 3, 0, 1], [0, 3, 1, 4, 2]).apply(roster)
+assert canonical_form(transformed)[0] == canonical
+restored = make_roster(2)
+symmetry.unapply(canonical, restored)
+assert restored == roster
+
+
+
+
+class SolutionCache(object):
+    """
+    A cache mapping keys to values, both strings, that holds at most
+    capacity entries in memory and evicts the least recently used entry
+    beyond that. If a path is given, all entries are also stored in a
+    SQLite database at that path, which is consulted when an entry is
+    missing from memory, such that the cache persists across runs.
+    hits and misses count the lookups that found an entry or not.
+  """
+
+    def __init__(self, capacity=10000, path=None):
+        import collections
+        self.capacity = capacity
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.connection = None
+        if path != None:
+            import sqlite3
+            self.connection = sqlite3.connect(path)
+            self.connection.execute('PRAGMA journal_mode = WAL')
+            self.connection.execute('PRAGMA synchronous = NORMAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS entries '
+                                    '(key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self.connection.commit()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def remember(self, key, value):
+        """ Make the given entry the most recently used entry in memory. """
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def get(self, key):
+        """ Return the value of the given key, or None if it is missing. """
+        value = self.entries.get(key)
+        if value == None and self.connection != None:
+            row = self.connection.execute('SELECT value FROM entries WHERE key = ?',
+                                          (key,)).fetchone()
+            if row != None:
+                value = str(row[0])
+        if value == None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.remember(key, value)
+        return value
 
+    def put(self, key, value):
+        """ Map the given key to the given value. """
+        self.remember(key, value)
+        if self.connection != None:
+            self.connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?)',
+                                    (key, value))
+            self.connection.commit()
+
+    def close(self):
+        """ Close the database of this cache, if any. """
+        if self.connection != None:
+            self.connection.close()
+            self.connection = None
+cache = SolutionCache(capacity=2)
+cache.put('a', '1')
+cache.put('b', '2')
+assert cache.get('a') == '1'
+cache.put('c', '3')
+assert cache.get('b') == None and cache.get('a') == '1' and len(cache) == 2
+
+
+
+
+def fill_with_cache(roster, cache, is_visualizing=False, sudoku_gui=None,
+                    backend=None, stats=None, rules=None, budget=None,
+                    recorder=None, tie_break=None, value_order=None):
+    """
+    Fill the given roster as fill_intelligently does with the given
+    arguments, serving the fill from the given solution cache if an
+    equivalent roster was filled before, and adding it to the cache
+    otherwise. A roster without a solution is cached as '-', while a
+    search that gives up is not cached.
+  """
+    if not is_correct_roster(roster):
+        return False
+    canonical, symmetry = canonical_form(roster)
+    key = 'fill ' + roster_to_string(canonical)
+    solution = cache.get(key)
+    if solution == '-':
+        return False
+    if solution != None:
+        symmetry.unapply(roster_from_string(solution), roster)
+        if is_visualizing:
+            sudoku_gui.update_roster(roster_contents(roster))
+        return True
+    result = fill_intelligently(roster, is_visualizing, sudoku_gui, backend, stats,
+                                rules, budget=budget, recorder=recorder,
+                                tie_break=tie_break, value_order=value_order)
+    if result:
+        cache.put(key, roster_to_string(symmetry.apply(roster)))
+    elif not isinstance(result, GaveUp):
+        cache.put(key, '-')
+    return result
+
+
+
+
+def count_with_cache(roster, limit, backend, cache):
+    """
+    Return the number of solutions of the given roster as count_solutions
+    does with the given arguments, serving it from the given solution
+    cache if an equivalent roster was counted before with the same limit,
+    and adding it to the cache otherwise.
+  """
+    if not is_correct_roster(roster):
+        return 0
+    key = 'count %s %s' % (limit, roster_to_string(canonical_form(roster)[0]))
+    count = cache.get(key)
+    if count == None:
+        count = count_solutions(roster, limit, backend)
+        cache.put(key, str(count))
+    return int(count)
+cache = SolutionCache()
+roster = roster_from_string('1..4.4...1.3...1')
+transformed = Symmetry(2, True, [1, 0, 3, 2], [2, 3, 0, 1], [0, 3, 1, 4, 2]).apply(roster)
+assert fill_intelligently(roster, cache=cache) and cache.misses == 1
+assert fill_intelligently(transformed, cache=cache) and cache.hits == 1
+assert is_completely_filled(transformed) and is_correct_roster(transformed)
+assert Symmetry(2, True, [1, 0, 3, 2], [2, 3, 0, 1], [0, 3, 1, 4, 2]).apply(roster) == transformed
+assert count_solutions(make_roster(2), limit=5, cache=cache) == 5
+assert count_solutions(make_roster(2), limit=5, cache=cache) == 5 and cache.hits == 2
@@ -0,0 +1,225 @@
+#######
+#
+# PUZZLE STORES
+#
+# A puzzle store is a binary file holding rosters of one dimension D as
+# fixed-size records, such that any roster can be read without parsing.
+# The file starts with a header of 16 bytes:
+#   - the magic string 'SDKS',
+#   - the version of the format (1) and the dimension D, one byte each,
+#   - 2 reserved bytes,
+#   - the number of records, as an unsigned little-endian 64-bit integer.
+# Each record then holds the D**4 cells of a roster, row by row, one byte
+# per cell, holding 0 for a non-filled cell, as in a FlatRoster.
+# A solution store runs parallel to a puzzle store: its record K holds the
+# solution of record K of the puzzle store, or only zeros if that puzzle
+# has no solution.
+#
+# Usage: python sudokuStore.py INPUT.txt OUTPUT.store
+#   converts the puzzles in a text file, one per line, into a store.
+#
+#######
+
+import mmap
+import os
+import struct
+
+import sudokuSolver
+
+
+HEADER = struct.Struct('<4sBBHQ')
+MAGIC = 'SDKS'
+VERSION = 1
+
+
+def read_header(file):
+    """
+    Return the dimension and the number of records read from the header
+    at the start of the given file.
+    ValueError is raised if the file does not start with a valid header.
+  """
+    file.seek(0)
+    header = file.read(HEADER.size)
+    if len(header) != HEADER.size:
+        raise ValueError('not a puzzle store')
+    magic, version, dim, reserved, count = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('not a puzzle store')
+    return dim, count
+
+
+
+
+class StoreWriter(object):
+    """
+    A writer that appends rosters to a puzzle store.
+    The number of records in the header is brought up to date when the
+    writer is closed; a writer can be used in a with statement to close
+    it automatically.
+  """
+
+    def __init__(self, path, dim=3):
+        """
+        Open the store at the given path to append rosters of the given
+        dimension to it. A new store is created if the path does not
+        exist yet; otherwise its dimension must be the given dimension.
+      """
+        if os.path.exists(path):
+            self.file = open(path, 'r+b')
+            store_dim, self.count = read_header(self.file)
+            if store_dim != dim:
+                self.file.close()
+                raise ValueError('store of dimension %d, not %d' % (store_dim, dim))
+            self.file.seek(HEADER.size + self.count*dim**4)
+            self.file.truncate()
+        else:
+            self.file = open(path, 'w+b')
+            self.count = 0
+            self.file.write(HEADER.pack(MAGIC, VERSION, dim, 0, 0))
+        self.dim = dim
+
+    def append(self, roster):
+        """
+        Append the given roster, of the dimension of this store, as a new
+        record. None is appended as a record of zeros.
+      """
+        if roster != None and sudokuSolver.dimension(roster) != self.dim:
+            raise ValueError('roster of dimension %d in a store of dimension %d'
+                             % (sudokuSolver.dimension(roster), self.dim))
+        if roster == None:
+            self.file.write(bytearray(self.dim**4))
+        else:
+            if not isinstance(roster, sudokuSolver.FlatRoster):
+                roster = sudokuSolver.FlatRoster.from_roster(roster)
+            self.file.write(bytearray(roster.cells))
+        self.count += 1
+
+    def close(self):
+        """ Write the number of records in the header and close the store. """
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.dim, 0, self.count))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+
+
+class PuzzleStore(object):
+    """
+    A puzzle store mapped into memory for reading.
+    The rosters of a store are flat rosters viewing the mapped records,
+    such that reading them takes no copying nor parsing. They can be
+    changed, but such changes are never written back to the file. The
+    rosters of a store must no longer be used once the store is closed.
+    A store supports len, iteration, indexing and slicing; a slice gives
+    a list of rosters.
+  """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.dim, self.count = read_header(file)
+            self.record_size = self.dim**4
+            size = HEADER.size + self.count*self.record_size
+            if os.fstat(file.fileno()).st_size < size:
+                raise ValueError('truncated puzzle store')
+            self.mmap = mmap.mmap(file.fileno(), size, access=mmap.ACCESS_COPY)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            rosters = []
+            for i in xrange(*index.indices(self.count)):
+                # LOOP INVARIANT
+                #   The rosters of all the indices of the slice handled
+                #   so far have been added to the list of rosters.
+                rosters.append(self[i])
+            return rosters
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('puzzle store index out of range')
+        return sudokuSolver.FlatRoster.from_buffer(
+            self.mmap, self.dim, HEADER.size + index*self.record_size)
+
+    def __iter__(self):
+        for index in xrange(self.count):
+            # LOOP INVARIANT
+            #   The rosters of all the records handled so far have been
+            #   generated.
+            yield self[index]
+
+    def close(self):
+        """ Unmap this store. """
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+
+
+def solve_store(puzzle_path, solution_path, backend=None):
+    """
+    Fill a copy of each roster in the puzzle store at the given path with
+    fill_intelligently, and append the solutions to the solution store at
+    the given path. Puzzles that already have a record in the solution
+    store are skipped, such that an interrupted run can be resumed.
+    Return the number of solutions appended.
+  """
+    with PuzzleStore(puzzle_path) as puzzles:
+        with StoreWriter(solution_path, puzzles.dim) as solutions:
+            first = solutions.count
+            for index in xrange(first, len(puzzles)):
+                # LOOP INVARIANT
+                #   The solutions of all the puzzles handled so far have
+                #   been appended to the solution store.
+                roster = sudokuSolver.copy_roster(puzzles[index])
+                if sudokuSolver.fill_intelligently(roster, backend=backend):
+                    solutions.append(roster)
+                else:
+                    solutions.append(None)
+            return len(puzzles) - first
+
+
+
+
+def main(argv=None):
+    """
+    Convert the puzzles in the text file given as first argument, one per
+    line, into a new puzzle store at the path given as second argument.
+  """
+    import argparse
+    import sudokuBatch
+    parser = argparse.ArgumentParser(description='Convert Sudoku puzzles into a puzzle store.')
+    parser.add_argument('input', type=argparse.FileType('r'))
+    parser.add_argument('output')
+    args = parser.parse_args(argv)
+    writer = None
+    try:
+        for puzzle in sudokuBatch.read_puzzles(args.input):
+            # LOOP INVARIANT
+            #   The rosters of all the puzzles read so far have been
+            #   appended to the store.
+            if writer == None:
+                if os.path.exists(args.output):
+                    os.remove(args.output)
+                writer = StoreWriter(args.output,
+                                     sudokuSolver.roster_string_dimension(puzzle))
+            writer.append(sudokuSolver.roster_from_string(puzzle))
+    finally:
+        if writer != None:
+            writer.close()
+
+
+if __name__ == '__main__':
+    main()
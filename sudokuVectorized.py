@@ -0,0 +1,337 @@
+#######
+#
+# VECTORIZED ROSTERS
+#
+# A batch of N rosters of dimension D is an integer NumPy array of shape
+# (N, D**2, D**2), holding 0 for each non-filled cell.
+# Candidates are computed for the whole batch at once, by broadcasting the
+# values used in each row, column and group over the cells of that unit.
+# A candidate grid is a boolean array of shape (N, D**2, D**2, D**2),
+# in which the element at [K, R, C, V-1] tells whether value V is a
+# candidate at position (R, C) of roster K.
+#
+# Completed grids are validated in bulk with a bitmask per cell: the cell
+# holding value V is represented by bit V, and any other value by 0. A
+# unit of D**2 cells then holds each value exactly once if and only if
+# the sum of its bits is the mask of all the values, because a sum of
+# D**2 powers of 2 only has D**2 bits set if they are all different.
+#
+# This module requires NumPy.
+#
+#######
+
+import numpy
+
+import sudokuSolver
+
+
+def rosters_to_array(rosters):
+    """
+    Return the batch of the given rosters, which must all have the same
+    dimension.
+  """
+    size = len(rosters[0])
+    batch = numpy.zeros((len(rosters), size, size), dtype=numpy.uint8)
+    for k in range(len(rosters)):
+        # LOOP INVARIANT
+        #   The values of all the rosters handled so far have been
+        #   copied into the batch.
+        for row in range(size):
+            # LOOP INVARIANT
+            #   The values of all the rows of the current roster handled
+            #   so far have been copied into the batch.
+            for col in range(size):
+                # LOOP INVARIANT
+                #   The values of the current row at all the columns
+                #   handled so far have been copied into the batch.
+                value = sudokuSolver.value_at(rosters[k], (row, col))
+                if value != None:
+                    batch[k, row, col] = value
+    return batch
+
+
+
+
+def batch_dimension(batch):
+    """ Return the dimension of the rosters in the given batch. """
+    return int(round(batch.shape[1] ** 0.5))
+
+
+
+
+def array_to_rosters(batch):
+    """ Return the list of the rosters in the given batch. """
+    rosters = []
+    dim = batch_dimension(batch)
+    for k in range(batch.shape[0]):
+        # LOOP INVARIANT
+        #   All the rosters of the batch handled so far have been
+        #   converted and added to the list of rosters.
+        values = []
+        for value in batch[k].ravel().tolist():
+            # LOOP INVARIANT
+            #   The values of all the cells handled so far have been
+            #   converted and added to the list of values.
+            if value == 0:
+                values.append(None)
+            else:
+                values.append(value)
+        rosters.append(sudokuSolver.make_roster(dim, values))
+    return rosters
+roster = sudokuSolver.make_roster(2,\
+            [   4,None,   3,None,\
+                2,   1,None,   3,\
+                1,None,None,None,\
+                3,None,   2,None])
+assert array_to_rosters(rosters_to_array([roster])) == [roster]
+
+
+
+
+def value_grid(batch):
+    """
+    Return the boolean array of shape (N, D**2, D**2, D**2) in which the
+    element at [K, R, C, V-1] tells whether value V is registered at
+    position (R, C) of roster K of the given batch.
+  """
+    size = batch.shape[1]
+    return batch[..., numpy.newaxis] == numpy.arange(1, size+1)
+
+
+
+
+def group_sums(grid):
+    """
+    Return, for the given array of shape (N, D**2, D**2, ...), the array of
+    shape (N, D**2, ...) holding the sum over the cells of each group.
+  """
+    dim = batch_dimension(grid)
+    shape = grid.shape
+    grouped = grid.reshape((shape[0], dim, dim, dim, dim) + shape[3:])
+    sums = grouped.sum(axis=(2, 4), dtype=numpy.int32)
+    return sums.reshape((shape[0], dim*dim) + shape[3:])
+
+
+
+
+def spread_over_groups(grid):
+    """
+    Return, for the given array of shape (N, D**2, ...) holding a result
+    for each group, the array of shape (N, D**2, D**2, ...) holding the
+    result of its group at each position.
+  """
+    dim = batch_dimension(grid)
+    shape = grid.shape
+    spread = grid.reshape((shape[0], dim, 1, dim, 1) + shape[2:])
+    spread = numpy.broadcast_to(spread, (shape[0], dim, dim, dim, dim) + shape[2:])
+    return spread.reshape((shape[0], dim*dim, dim*dim) + shape[2:])
+
+
+
+
+def candidate_grid(batch, packed=False):
+    """
+    Return the candidate grid of the given batch: the element at
+    [K, R, C, V-1] is True if and only if the cell at position (R, C) of
+    roster K is not filled and value V does not occur in its row, its
+    column nor its group.
+    If packed is True, the last axis is packed into bits with
+    numpy.packbits instead, giving an array of unsigned bytes.
+  """
+    values = value_grid(batch)
+    used = values.any(axis=2)[:, :, numpy.newaxis, :]
+    used = used | values.any(axis=1)[:, numpy.newaxis, :, :]
+    used = used | spread_over_groups(group_sums(values) > 0)
+    candidates = ~used & (batch == 0)[..., numpy.newaxis]
+    if packed:
+        return numpy.packbits(candidates, axis=-1)
+    return candidates
+batch = rosters_to_array([roster, sudokuSolver.make_roster(2)])
+assert candidate_grid(batch)[0, 2, 1].tolist() == [False, True, False, True]
+assert candidate_grid(batch)[0, 0, 0].tolist() == [False]*4
+assert candidate_grid(batch)[1].all()
+assert candidate_grid(batch, packed=True)[0, 2, 1].tolist() == [0x50]
+
+
+
+
+def naked_singles(batch, candidates=None):
+    """
+    Return the integer array of shape (N, D**2, D**2) holding, for each
+    non-filled cell of the given batch with exactly one candidate, that
+    candidate, and 0 for all other cells.
+    The candidate grid of the batch can be given if it is already known.
+  """
+    if candidates is None:
+        candidates = candidate_grid(batch)
+    single = candidates.sum(axis=3) == 1
+    return numpy.where(single, candidates.argmax(axis=3)+1, 0)
+roster = sudokuSolver.make_roster(2,\
+            [   4,None,None,None,\
+                2,   1,None,   3,\
+                1,None,None,None,\
+                3,None,   2,None])
+assert naked_singles(rosters_to_array([roster]))[0, 0].tolist() == [0, 3, 1, 0]
+
+
+
+
+def hidden_singles(batch, candidates=None):
+    """
+    Return the integer array of shape (N, D**2, D**2) holding, for each
+    non-filled cell of the given batch, the smallest value that can only
+    go into that cell within its row, its column or its group, and 0 for
+    all other cells.
+    The candidate grid of the batch can be given if it is already known.
+  """
+    if candidates is None:
+        candidates = candidate_grid(batch)
+    once = (candidates.sum(axis=2) == 1)[:, :, numpy.newaxis, :]
+    once = once | (candidates.sum(axis=1) == 1)[:, numpy.newaxis, :, :]
+    once = once | spread_over_groups(group_sums(candidates) == 1)
+    hidden = candidates & once
+    return numpy.where(hidden.any(axis=3), hidden.argmax(axis=3)+1, 0)
+roster = sudokuSolver.make_roster(2,\
+            [   4,   3,   1,   2,\
+                2,   1,   4,   3,\
+                1,None,None,None,\
+                3,None,   2,None])
+assert hidden_singles(rosters_to_array([roster]))[0, 2, 1] == 2
+
+
+
+
+def are_correct_rosters(batch):
+    """
+    Return the boolean array of shape (N,) telling for each roster of the
+    given batch whether it is correct according to the rules of Sudoku:
+    all its values lie between 0 and the squared dimension, and no value
+    other than 0 occurs more than once in a row, a column or a group.
+  """
+    values = value_grid(batch)
+    in_range = ((batch >= 0) & (batch <= batch.shape[1])).all(axis=(1, 2))
+    rows_ok = (values.sum(axis=2) <= 1).all(axis=(1, 2))
+    cols_ok = (values.sum(axis=1) <= 1).all(axis=(1, 2))
+    groups_ok = (group_sums(values) <= 1).all(axis=(1, 2))
+    return in_range & rows_ok & cols_ok & groups_ok
+assert are_correct_rosters(rosters_to_array([
+            sudokuSolver.make_roster(2,\
+            [   4,None,   3,None,\
+                2,   1,None,   4,\
+                1,   4,None,None,\
+                3,   2,   4,   1]),
+            sudokuSolver.make_roster(2,\
+            [   4,   3,None,None,\
+                2,   1,None,None,\
+                1,None,None,   1,\
+                3,None,None,None])])).tolist() == [True, False]
+
+
+
+
+def slice_sum(grid, axis, step):
+    """
+    Return the sum of the slices grid[..., k::step, ...] along the given
+    axis, for k from 0 to step-1, in the dtype of the given array.
+    Summing the slices one by one is several times faster than the
+    reductions of NumPy over short axes.
+  """
+    index = [slice(None)] * grid.ndim
+    index[axis] = slice(0, None, step)
+    total = grid[tuple(index)].copy()
+    for k in range(1, step):
+        # LOOP INVARIANT
+        #   total holds the sum of the slices starting at 0..k-1.
+        index[axis] = slice(k, None, step)
+        total += grid[tuple(index)]
+    return total
+
+
+
+
+def unit_sums(bits):
+    """
+    Return, for the given array of shape (N, D**2, D**2) holding a bitmask
+    for each cell of N rosters, the array of shape (N, 3*D**2) holding the
+    sum of the bitmasks of each unit, with units numbered as in the
+    topologies of sudokuSolver: first the rows, then the columns and then
+    the groups.
+  """
+    dim = batch_dimension(bits)
+    size = dim*dim
+    rows = slice_sum(bits, 2, size)[:, :, 0]
+    cols = slice_sum(bits, 1, size)[:, 0, :]
+    bands = slice_sum(bits, 1, dim)
+    groups = slice_sum(bands, 2, dim).reshape((bits.shape[0], size))
+    return numpy.concatenate((rows, cols, groups), axis=1)
+
+
+
+
+def validate_grids(batch, chunksize=65536):
+    """
+    Check whether the rosters of the given batch are completely filled and
+    correct according to the rules of Sudoku. Return a pair of arrays of
+    shape (N,): a boolean array telling for each roster whether it passes,
+    and an integer array holding for each roster the first unit in which
+    a value is missing, or -1 for a roster that passes.
+    The batch is checked in chunks of the given number of rosters, such
+    that the memory used on top of the batch does not depend on its size;
+    it can therefore be a memory-mapped array as well (see store_array).
+  """
+    size = batch.shape[1]
+    # The sum of the bits of a unit is below 1 << (size+1).
+    if size < 15:
+        dtype = numpy.int16
+    elif size < 31:
+        dtype = numpy.int32
+    else:
+        dtype = numpy.int64
+    table = numpy.zeros(256, dtype=dtype)
+    table[1:size+1] = numpy.left_shift(1, numpy.arange(1, size+1, dtype=dtype))
+    full = table.sum()
+    passed = numpy.zeros(batch.shape[0], dtype=bool)
+    first_units = numpy.zeros(batch.shape[0], dtype=numpy.int32)
+    for start in range(0, batch.shape[0], chunksize):
+        # LOOP INVARIANT
+        #   The results of all the rosters before start have been stored.
+        chunk = batch[start:start+chunksize]
+        bits = numpy.take(table, chunk, mode='clip')
+        correct = unit_sums(bits) == full
+        chunk_passed = correct.all(axis=1)
+        passed[start:start+chunksize] = chunk_passed
+        first_units[start:start+chunksize] = numpy.where(
+            chunk_passed, -1, correct.argmin(axis=1))
+    return passed, first_units
+solution = sudokuSolver.make_roster(2,\
+            [   4,   1,   3,   2,\
+                2,   3,   4,   1,\
+                1,   4,   2,   3,\
+                3,   2,   1,   4])
+swapped = sudokuSolver.make_roster(2,\
+            [   4,   1,   3,   2,\
+                2,   3,   4,   1,\
+                1,   4,   2,   3,\
+                3,   2,   4,   1])
+passed, first_units = validate_grids(rosters_to_array(
+    [solution, swapped, sudokuSolver.make_roster(2)]), chunksize=2)
+assert passed.tolist() == [True, False, False]
+assert first_units.tolist() == [-1, 6, 0]
+
+
+
+
+def store_array(path):
+    """
+    Return the rosters in the puzzle store at the given path (see
+    sudokuStore) as a read-only memory-mapped batch, without reading them.
+  """
+    import sudokuStore
+    with open(path, 'rb') as file:
+        dim, count = sudokuStore.read_header(file)
+    size = dim**2
+    if count == 0:
+        # An empty memory map cannot be made.
+        return numpy.zeros((0, size, size), dtype=numpy.uint8)
+    return numpy.memmap(path, dtype=numpy.uint8, mode='r',
+                        offset=sudokuStore.HEADER.size, shape=(count, size, size))